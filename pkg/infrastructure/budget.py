@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预算 - 迭代截止时间与会话级成本预算
+
+Deadline: 在一次迭代的各阶段间传递剩余时间。各阶段（DeepSeek 构思、多模态分析、
+Forge 生成、评分）按剩余预算确定自身的请求超时与重试次数；预算不足时放弃重试、
+走各自的降级路径（兜底 prompt、本地评分、跳过融合），使单次迭代的耗时有上界。
+
+SessionBudget: 整个会话的墙钟时间、GPU 秒数（Forge 请求耗时）与评分调用次数上限，
+任一耗尽即停止迭代并交付当前最佳结果；SESSION_TIERS 供服务端按档位提供。
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# 剩余时间少于该值时不再发起新的网络请求（连接 + 最短响应都不够）
+MIN_ATTEMPT_SECONDS = 3.0
+
+
+class Deadline:
+    """截止时间（None 表示不限时，所有方法退化为原有行为）"""
+
+    def __init__(self, seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            seconds: 从现在起的可用秒数（None 表示不限时）
+            clock: 单调时钟（测试时可替换）
+        """
+        self._clock = clock
+        # 创建时的总秒数（供各阶段按"已用去的比例"决策）
+        self.seconds = None if seconds is None else max(0.0, float(seconds))
+        self.expires_at = None if seconds is None else clock() + self.seconds
+
+    @classmethod
+    def ensure(cls, deadline: Optional["Deadline"]) -> "Deadline":
+        """调用方未传入预算时返回不限时的实例"""
+        return deadline if deadline is not None else cls()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.expires_at is None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float = MIN_ATTEMPT_SECONDS) -> bool:
+        """剩余时间是否还够 seconds"""
+        return self.remaining() >= seconds
+
+    def timeout(self, cap: float) -> float:
+        """单次请求的超时：不超过 cap，也不超过剩余时间"""
+        return min(float(cap), self.remaining())
+
+    def can_retry_after(self, wait: float, min_attempt: float = MIN_ATTEMPT_SECONDS) -> bool:
+        """退避等待 wait 秒后是否还够发起一次请求"""
+        return self.allows(wait + min_attempt)
+
+    def sub(self, seconds: Optional[float] = None, fraction: Optional[float] = None) -> "Deadline":
+        """
+        为某个阶段划出子预算（不会晚于当前截止时间）
+
+        Args:
+            seconds: 子预算秒数
+            fraction: 按剩余时间比例划分（与 seconds 同时给出时取较小者）
+        """
+        limits = [self.remaining()]
+        if seconds is not None:
+            limits.append(seconds)
+        if fraction is not None and not self.unlimited:
+            limits.append(self.remaining() * fraction)
+        budget = min(limits)
+        return Deadline(None if math.isinf(budget) else budget, clock=self._clock)
+
+    def __repr__(self) -> str:
+        if self.unlimited:
+            return "Deadline(unlimited)"
+        return f"Deadline(remaining={self.remaining():.1f}s)"
+
+
+# 会话预算档位（缺省项表示不限）
+SESSION_TIERS: Dict[str, Dict[str, float]] = {
+    "preview": {"wall_seconds": 60, "judge_calls": 6},
+    "standard": {"wall_seconds": 600, "gpu_seconds": 300, "judge_calls": 40},
+    "premium": {"wall_seconds": 1800, "gpu_seconds": 900, "judge_calls": 120},
+    "unlimited": {},
+}
+
+
+class SessionBudget:
+    """会话级预算：墙钟时间 / GPU 秒数 / 评分调用次数（None 表示该项不限）"""
+
+    def __init__(
+        self,
+        wall_seconds: Optional[float] = None,
+        gpu_seconds: Optional[float] = None,
+        judge_calls: Optional[int] = None,
+        tier: str = "unlimited",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            wall_seconds: 墙钟时间上限（秒，从创建时起算）
+            gpu_seconds: GPU 时间上限（秒，按 Forge 请求耗时计）
+            judge_calls: 评分调用次数上限（复用已知结果与本地估算不计）
+            tier: 档位名称（仅用于展示）
+            clock: 单调时钟（测试时可替换）
+        """
+        self.wall_seconds = wall_seconds
+        self.gpu_seconds = gpu_seconds
+        self.judge_calls = judge_calls
+        self.tier = tier
+        self._clock = clock
+        self._started_at = clock()
+        self._lock = threading.Lock()
+
+        # 📊 已用量
+        self.gpu_used = 0.0
+        self.judge_used = 0
+
+    @classmethod
+    def from_tier(cls, tier: str, **overrides) -> "SessionBudget":
+        """按档位创建（overrides 中非 None 的项覆盖档位默认值，须为正数；可能来自客户端输入）"""
+        if tier not in SESSION_TIERS:
+            raise ValueError(f"未知的预算档位: {tier}（可选: {', '.join(SESSION_TIERS)}）")
+        for key, value in overrides.items():
+            if value is None:
+                continue
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or not math.isfinite(value) or value <= 0):
+                raise ValueError(f"预算项 {key} 必须为正数: {value!r}")
+        limits = dict(SESSION_TIERS[tier])
+        limits.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(tier=tier, **limits)
+
+    def elapsed(self) -> float:
+        return self._clock() - self._started_at
+
+    def charge_gpu(self, seconds: float) -> None:
+        with self._lock:
+            self.gpu_used += max(0.0, seconds)
+
+    def charge_judge(self, calls: int = 1) -> None:
+        with self._lock:
+            self.judge_used += calls
+
+    def judge_remaining(self) -> Optional[int]:
+        """剩余评分调用次数（None 表示不限）"""
+        with self._lock:
+            return None if self.judge_calls is None else max(0, self.judge_calls - self.judge_used)
+
+    def exhausted_reason(self) -> Optional[str]:
+        """已耗尽的预算项（"wall" / "gpu" / "judge"），均未耗尽返回 None"""
+        with self._lock:
+            if self.wall_seconds is not None and self.elapsed() >= self.wall_seconds:
+                return "wall"
+            if self.gpu_seconds is not None and self.gpu_used >= self.gpu_seconds:
+                return "gpu"
+            if self.judge_calls is not None and self.judge_used >= self.judge_calls:
+                return "judge"
+        return None
+
+    @property
+    def exhausted(self) -> bool:
+        return self.exhausted_reason() is not None
+
+    def affordable_iterations(self, iterations_done: int) -> Optional[int]:
+        """按已用量的平均速率估算剩余预算还够几次迭代（None 表示不限）"""
+        limits = []
+        with self._lock:
+            if self.judge_calls is not None:
+                limits.append(self.judge_calls - self.judge_used)
+            if iterations_done > 0:
+                elapsed = self.elapsed()
+                if self.wall_seconds is not None and elapsed > 0:
+                    limits.append(int((self.wall_seconds - elapsed) / (elapsed / iterations_done)))
+                if self.gpu_seconds is not None and self.gpu_used > 0:
+                    limits.append(int((self.gpu_seconds - self.gpu_used) / (self.gpu_used / iterations_done)))
+        return max(0, min(limits)) if limits else None
+
+    def iteration_deadline(self, cap: Optional[float] = None) -> Deadline:
+        """单次迭代的 Deadline：不超过 cap，也不超过会话剩余墙钟时间"""
+        limits = [] if cap is None else [cap]
+        if self.wall_seconds is not None:
+            limits.append(max(0.0, self.wall_seconds - self.elapsed()))
+        return Deadline(min(limits) if limits else None, clock=self._clock)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前用量与上限（供 API 返回）"""
+        with self._lock:
+            return {
+                "tier": self.tier,
+                "wall_seconds": {"used": round(self.elapsed(), 1), "limit": self.wall_seconds},
+                "gpu_seconds": {"used": round(self.gpu_used, 1), "limit": self.gpu_seconds},
+                "judge_calls": {"used": self.judge_used, "limit": self.judge_calls},
+            }
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+底模生命周期管理 - 预加载、显存压力下卸载与切换耗时记录
+
+引擎通过 override_settings 指定底模时，底模切换发生在生成请求内部，整段加载时间都
+算在关键路径上。这里由引擎预测下一轮要用的底模，在评分与构思期间（GPU 空闲）经
+/sdapi/v1/options 在各后端后台加载；加载前读取 /sdapi/v1/memory，空闲显存不足时先
+卸载当前底模。同一后端的预加载按提交顺序依次执行。生成前 ensure() 等待预加载完成
+（未预加载的后端就地加载；等待超时仍在加载的后端不再切换，交给生成请求的
+override_settings）。每次切换的耗时、是否预加载与前后显存写入 JSONL 日志，供分析
+切换代价。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pkg.infrastructure.config import CHECKPOINT_PREFETCH_ENABLED, CHECKPOINT_SWITCH_LOG, CHECKPOINT_VRAM_MIN_FREE
+from pkg.infrastructure.forge_client import ForgeBackend, ForgeClient, get_forge_client
+
+logger = logging.getLogger(__name__)
+
+# 查询接口超时（秒）
+QUERY_TIMEOUT = 5
+# 加载底模的超时（秒，大模型首次从磁盘加载可能较慢）
+LOAD_TIMEOUT = 300
+
+
+@dataclass
+class SwitchRecord:
+    """一次底模切换"""
+    backend: str
+    from_checkpoint: Optional[str]
+    to_checkpoint: str
+    seconds: float
+    prefetched: bool                        # True: 空闲时预加载；False: 在关键路径上加载
+    unloaded: bool = False                  # 加载前是否因显存压力先卸载
+    vram_free_before: Optional[float] = None
+    vram_free_after: Optional[float] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+def same_checkpoint(loaded: Optional[str], wanted: str) -> bool:
+    """options 返回的底模名带路径与 " [hash]" 后缀，只比较文件名"""
+    if not loaded:
+        return False
+
+    def name(value: str) -> str:
+        return os.path.basename(value.split(" [")[0].replace("\\", "/")).strip()
+
+    return name(loaded) == name(wanted)
+
+
+def vram_free_ratio(memory: Dict[str, Any]) -> Optional[float]:
+    """从 /sdapi/v1/memory 的响应中取空闲显存比例（无 CUDA 信息时返回 None）"""
+    system = (memory.get("cuda") or {}).get("system") or {}
+    total = system.get("total") or 0
+    if total <= 0 or "free" not in system:
+        return None
+    return float(system["free"]) / float(total)
+
+
+class CheckpointManager:
+    """多后端的底模预加载与切换记录"""
+
+    def __init__(self, client: ForgeClient, log_path: str = CHECKPOINT_SWITCH_LOG,
+                 vram_min_free: float = CHECKPOINT_VRAM_MIN_FREE):
+        """
+        Args:
+            client: Forge 客户端（预加载覆盖其全部后端）
+            log_path: 切换记录 JSONL 文件（空字符串表示不写文件）
+            vram_min_free: 空闲显存比例阈值，低于该值时加载前先卸载
+        """
+        self.client = client
+        self.log_path = log_path
+        self.vram_min_free = vram_min_free
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], threading.Thread] = {}  # (后端 URL, 底模) → 预加载线程
+        self.records: List[SwitchRecord] = []
+
+    def loaded(self, backend: ForgeBackend) -> Optional[str]:
+        """后端当前加载的底模（查询失败返回 None）"""
+        try:
+            return self.client.get("/sdapi/v1/options", backend, timeout=QUERY_TIMEOUT).get("sd_model_checkpoint")
+        except Exception as e:
+            logger.warning(f"⚠️ 查询 {backend.url} 当前底模失败: {e}")
+            return None
+
+    def vram_free(self, backend: ForgeBackend) -> Optional[float]:
+        """后端空闲显存比例（查询失败或无 CUDA 信息返回 None）"""
+        try:
+            return vram_free_ratio(self.client.get("/sdapi/v1/memory", backend, timeout=QUERY_TIMEOUT))
+        except Exception as e:
+            logger.warning(f"⚠️ 查询 {backend.url} 显存失败: {e}")
+            return None
+
+    def prefetch(self, checkpoint: str) -> None:
+        """在后台把各后端切换到 checkpoint（该后端已在加载同一底模时跳过；在加载其他底模时排在其后）"""
+        with self._lock:
+            for backend in self.client.backends:
+                if self._is_pending(backend.url, checkpoint):
+                    continue
+                before = self._pending_for(backend.url)
+                thread = threading.Thread(target=self._prefetch_after, args=(before, backend, checkpoint), daemon=True)
+                self._pending[(backend.url, checkpoint)] = thread
+                thread.start()
+
+    def ensure(self, checkpoint: str, timeout: Optional[float] = None) -> None:
+        """
+        生成前确保各后端已加载 checkpoint：等待该后端进行中的预加载，未加载的后端就地切换；
+        超时后仍在预加载的后端不切换（并发的 options 请求会互相覆盖），由生成请求的 override_settings 加载
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for backend in self.client.backends:
+            with self._lock:
+                pending = self._pending_for(backend.url)
+            for thread in pending:
+                thread.join(None if deadline is None else max(0.0, deadline - time.time()))
+            if any(thread.is_alive() for thread in pending):
+                print(f"⏳ [底模管理] {backend.url} 预加载未完成，交由生成请求加载 {checkpoint}")
+                continue
+            self._switch(backend, checkpoint, False)
+
+    def _is_pending(self, url: str, checkpoint: str) -> bool:
+        thread = self._pending.get((url, checkpoint))
+        return thread is not None and thread.is_alive()
+
+    def _pending_for(self, url: str) -> List[threading.Thread]:
+        """该后端仍在进行的预加载（调用方持有 _lock），顺带清理已结束的线程"""
+        for key in [key for key, thread in self._pending.items() if not thread.is_alive()]:
+            del self._pending[key]
+        return [thread for (backend_url, _), thread in self._pending.items() if backend_url == url]
+
+    def _prefetch_after(self, before: List[threading.Thread], backend: ForgeBackend, checkpoint: str) -> None:
+        for thread in before:
+            thread.join()
+        self._switch(backend, checkpoint, True)
+
+    def _switch(self, backend: ForgeBackend, checkpoint: str, prefetched: bool) -> None:
+        current = self.loaded(backend)
+        if current is None or same_checkpoint(current, checkpoint):
+            return
+        record = SwitchRecord(backend=backend.url, from_checkpoint=current, to_checkpoint=checkpoint,
+                              seconds=0.0, prefetched=prefetched, vram_free_before=self.vram_free(backend))
+        start = time.time()
+        try:
+            if record.vram_free_before is not None and record.vram_free_before < self.vram_min_free:
+                self.client.post("/sdapi/v1/unload-checkpoint", {}, timeout=LOAD_TIMEOUT, backend=backend)
+                record.unloaded = True
+            self.client.post("/sdapi/v1/options", {"sd_model_checkpoint": checkpoint}, timeout=LOAD_TIMEOUT,
+                             backend=backend)
+        except Exception as e:
+            record.error = str(e)
+        record.seconds = time.time() - start
+        record.vram_free_after = self.vram_free(backend)
+
+        tag = "预加载" if prefetched else "关键路径加载"
+        if record.error:
+            print(f"⚠️ [底模管理] {backend.url} {tag} {checkpoint} 失败: {record.error}")
+        else:
+            print(f"🗂️ [底模管理] {backend.url} {tag} {checkpoint} 用时 {record.seconds:.1f}s"
+                  + (" (显存不足，已先卸载)" if record.unloaded else ""))
+        self._record(record)
+
+    def _record(self, record: SwitchRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+            if not self.log_path:
+                return
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+            except Exception as e:
+                logger.warning(f"⚠️ 底模切换记录写入失败: {e}")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按是否预加载汇总切换次数与平均耗时（只统计成功的切换）"""
+        with self._lock:
+            records = [r for r in self.records if r.error is None]
+        summary = {}
+        for key, prefetched in (("prefetched", True), ("critical_path", False)):
+            seconds = [r.seconds for r in records if r.prefetched is prefetched]
+            summary[key] = {"count": len(seconds), "mean_seconds": sum(seconds) / len(seconds) if seconds else 0.0}
+        return summary
+
+
+_shared_manager: Optional[CheckpointManager] = None
+_shared_lock = threading.Lock()
+
+
+def get_checkpoint_manager() -> Optional[CheckpointManager]:
+    """进程内共享的底模管理器（CHECKPOINT_PREFETCH_ENABLED=false 时返回 None）"""
+    global _shared_manager
+    if not CHECKPOINT_PREFETCH_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = CheckpointManager(get_forge_client())
+        return _shared_manager
@@ -25,19 +25,112 @@ def _get_float(name: str, default: float) -> float:
 
 # Forge / Control loop
 FORGE_URL = _get_env("FORGE_URL", "http://127.0.0.1:7860")
+# 多个 Forge 后端（逗号分隔，多 GPU / 多机并发渲染；默认只用 FORGE_URL）
+FORGE_URLS = [u.strip() for u in _get_env("FORGE_URLS", FORGE_URL).split(",") if u.strip()]
 FORGE_TIMEOUT = _get_int("FORGE_TIMEOUT", 90)
 FORGE_HEARTBEAT_INTERVAL = _get_int("FORGE_HEARTBEAT_INTERVAL", 5)
+ENGINE_INIT_DEADLINE = _get_float("ENGINE_INIT_DEADLINE", 20.0)  # 引擎并发初始化的共享截止时间（秒）
+ITERATION_DEADLINE = _get_float("ITERATION_DEADLINE", 180.0)  # 单次迭代（构思+生成+评分）的时间预算（秒），<=0 不限时
+SESSION_BUDGET_TIER = _get_env("SESSION_BUDGET_TIER", "unlimited")  # 会话预算默认档位（preview/standard/premium/unlimited）
 
 TARGET_SCORE = _get_float("TARGET_SCORE", 0.90)
 MAX_ITERATIONS = _get_int("MAX_ITERATIONS", 15)
 CONVERGENCE_PATIENCE = _get_int("CONVERGENCE_PATIENCE", 3)
 CONVERGENCE_THRESHOLD = _get_float("CONVERGENCE_THRESHOLD", 0.005)
 
+# 🔮 收敛预测（达标概率过低的会话提前停止）
+CONVERGENCE_PREDICTOR_ENABLED = _get_env("CONVERGENCE_PREDICTOR_ENABLED", "false").lower() == "true"
+CONVERGENCE_MIN_PROBABILITY = _get_float("CONVERGENCE_MIN_PROBABILITY", 0.05)  # 低于该概率即停止
+CONVERGENCE_MIN_OBSERVATIONS = _get_int("CONVERGENCE_MIN_OBSERVATIONS", 5)     # 至少观测到的评分数
+CONVERGENCE_PRIOR_PATH = _get_env("CONVERGENCE_PRIOR_PATH", os.path.join("cache", "convergence_prior.json"))
+# 🧪 EXPLORE/OPTIMIZE 阶段的参数控制器：pcontrol（原固定增益 P-Control，默认）/ bayes（GP 代理模型 + 期望改进）
+PARAM_CONTROLLER = _get_env("PARAM_CONTROLLER", "pcontrol").lower()
+
+# 🎰 艺术透镜多臂老虎机（按本会话评分 Thompson 采样透镜，按主题簇热启动）
+LENS_BANDIT_ENABLED = _get_env("LENS_BANDIT_ENABLED", "false").lower() == "true"
+LENS_STATS_PATH = _get_env("LENS_STATS_PATH", os.path.join("cache", "lens_stats.json"))
+
+# 📚 运行历史热启动（相似主题的高分运行提供底模 / Prompt 骨架 / 参数 / seed）
+RUN_HISTORY_ENABLED = _get_env("RUN_HISTORY_ENABLED", "false").lower() == "true"
+RUN_HISTORY_PATH = _get_env("RUN_HISTORY_PATH", os.path.join("cache", "run_history.json"))
+RUN_HISTORY_MIN_SIMILARITY = _get_float("RUN_HISTORY_MIN_SIMILARITY", 0.9)  # 主题 CLIP 文本嵌入余弦相似度
+RUN_HISTORY_MIN_SCORE = _get_float("RUN_HISTORY_MIN_SCORE", 0.78)  # 只从达到该分数的运行热启动
+
+# 🧬 EXPLORE 种群模式（每轮并发渲染/评分一代个体；1 = 关闭，沿用单轨迹探索）
+POPULATION_SIZE = _get_int("POPULATION_SIZE", 1)
+POPULATION_ELITE = _get_int("POPULATION_ELITE", 2)  # 每代直接保留的精英数
+
+# 🎯 FINETUNE 子种子邻域搜索（锁定最佳 seed，一次批量渲染多个 subseed 变体，CLIP 初筛后只评审最佳一张）
+SUBSEED_SEARCH_BATCH = _get_int("SUBSEED_SEARCH_BATCH", 1)  # 每轮变体数（<=1 关闭，沿用随机换 seed；建议 4）
+SUBSEED_STRENGTH = _get_float("SUBSEED_STRENGTH", 0.15)     # 初始扰动强度（无改进时逐步放大）
+
+# 🪄 img2img 精修（OPTIMIZE/FINETUNE 阶段基于最佳图低重绘，代替从零 txt2img）
+IMG2IMG_REFINE_ENABLED = _get_env("IMG2IMG_REFINE_ENABLED", "false").lower() == "true"
+IMG2IMG_MIN_SCORE = _get_float("IMG2IMG_MIN_SCORE", 0.8)  # 最佳图总分与内容分都达到该值才精修（低重绘修不了主体/构图）
+IMG2IMG_DENOISE = _get_float("IMG2IMG_DENOISE", 0.3)      # 初始重绘强度（精修无改进时逐步降低）
+IMG2IMG_PATIENCE = _get_int("IMG2IMG_PATIENCE", 2)        # 连续无改进的精修次数，达到后回到 txt2img 直到出现新的最佳图
+
+# 🩹 局部缺陷修复（评审理由指出手部/面部/伪影等局部问题时，只对缺陷区域做蒙版重绘）
+INPAINT_REPAIR_ENABLED = _get_env("INPAINT_REPAIR_ENABLED", "false").lower() == "true"
+INPAINT_MIN_CONCEPT = _get_float("INPAINT_MIN_CONCEPT", 0.75)  # 最佳图内容分达到该值才修复（主体不对时局部修复无意义）
+INPAINT_DENOISE = _get_float("INPAINT_DENOISE", 0.5)           # 蒙版区域的重绘强度
+
+# 📐 延迟高清化（迭代期按基础分辨率渲染与评审，结束后只对前 k 张做高清化）
+DEFERRED_HIRES = _get_env("DEFERRED_HIRES", "off").lower()   # off / hires（同 seed 开 HR 重渲染）/ upscale（extras 放大）
+DEFERRED_HIRES_TOP_K = _get_int("DEFERRED_HIRES_TOP_K", 1)
+DEFERRED_UPSCALER = _get_env("DEFERRED_UPSCALER", "R-ESRGAN 4x+")  # upscale 模式及 img2img 结果使用的放大器
+DEFERRED_HIRES_VALIDATE = _get_env("DEFERRED_HIRES_VALIDATE", "true").lower() == "true"  # 高清图再评审一次，记录评审对分辨率的敏感度
+
+# 🔻 两级预览漏斗（目标底模、目标尺寸、少步数批量初筛，CLIP 排序后只完整渲染前 k 个 seed；不切换底模）
+PREVIEW_FUNNEL_SIZE = _get_int("PREVIEW_FUNNEL_SIZE", 1)                  # 每轮初筛候选数（<=1 关闭）
+PREVIEW_FUNNEL_KEEP = _get_int("PREVIEW_FUNNEL_KEEP", 1)                  # 完整渲染的候选数
+PREVIEW_FUNNEL_STEP_SCALE = _get_float("PREVIEW_FUNNEL_STEP_SCALE", 0.5)  # 初筛步数相对目标步数的比例
+
+# 🗂️ 底模生命周期管理（预测下一轮底模并在空闲时预加载，显存紧张时先卸载，记录切换耗时）
+CHECKPOINT_PREFETCH_ENABLED = _get_env("CHECKPOINT_PREFETCH_ENABLED", "true").lower() == "true"
+CHECKPOINT_VRAM_MIN_FREE = _get_float("CHECKPOINT_VRAM_MIN_FREE", 0.15)  # 空闲显存比例低于该值时加载前先卸载当前底模
+CHECKPOINT_SWITCH_LOG = _get_env("CHECKPOINT_SWITCH_LOG", os.path.join("cache", "checkpoint_switches.jsonl"))
+
+# ⏱️ Forge 延迟模型（按渲染工作量预测耗时：自适应超时、多后端排队 ETA、前端进度预估）
+LATENCY_MODEL_ENABLED = _get_env("LATENCY_MODEL_ENABLED", "true").lower() == "true"
+LATENCY_MODEL_PATH = _get_env("LATENCY_MODEL_PATH", os.path.join("cache", "latency_model.json"))
+LATENCY_MIN_SAMPLES = _get_int("LATENCY_MIN_SAMPLES", 5)          # 观测数达到该值才用预测代替 FORGE_TIMEOUT
+LATENCY_TIMEOUT_FACTOR = _get_float("LATENCY_TIMEOUT_FACTOR", 2.0)  # 超时 = p99 × 系数
+LATENCY_MIN_TIMEOUT = _get_float("LATENCY_MIN_TIMEOUT", 10.0)
+LATENCY_MAX_TIMEOUT = _get_float("LATENCY_MAX_TIMEOUT", 300.0)
+
 # Creative Brain (DeepSeek)
 DEEPSEEK_MODEL = _get_env("DEEPSEEK_MODEL", "deepseek-ai/DeepSeek-V3")
 DEEPSEEK_MAX_RETRIES = _get_int("DEEPSEEK_MAX_RETRIES", 5)
 DEEPSEEK_TIMEOUT = _get_int("DEEPSEEK_TIMEOUT", 30)
 
+# 🧭 主题→底模本地分类器（CLIP 文本原型，置信时跳过 DeepSeek 推荐）
+THEME_CLASSIFIER_ENABLED = _get_env("THEME_CLASSIFIER_ENABLED", "false").lower() == "true"
+THEME_CLASSIFIER_MIN_CONFIDENCE = _get_float("THEME_CLASSIFIER_MIN_CONFIDENCE", 0.85)
+THEME_CLASSIFIER_MIN_SAMPLES = _get_int("THEME_CLASSIFIER_MIN_SAMPLES", 5)  # 积累足够历史样本后才本地决策
+THEME_CLASSIFIER_MIN_MARGIN = _get_float("THEME_CLASSIFIER_MIN_MARGIN", 0.03)  # 最近与次近质心的余弦相似度之差下限
+THEME_CLASSIFIER_PATH = _get_env("THEME_CLASSIFIER_PATH", os.path.join("cache", "theme_prototypes.json"))
+
+# 🎱 Prompt 候选池（一次调用批量构思多条，跨迭代消费）
+PROMPT_POOL_ENABLED = _get_env("PROMPT_POOL_ENABLED", "false").lower() == "true"
+PROMPT_POOL_SIZE = _get_int("PROMPT_POOL_SIZE", 6)           # 每次批量生成的数量
+PROMPT_POOL_REFILL_AT = _get_int("PROMPT_POOL_REFILL_AT", 1)  # 剩余 <= 该值时后台补充
+PROMPT_POOL_SCORE_DELTA = _get_float("PROMPT_POOL_SCORE_DELTA", 0.1)  # 分数较入池时变化超过该值则整池失效
+
+# ✂️ Prompt 压缩（按 CLIP 75-token chunk 预算裁剪最终 Prompt）
+PROMPT_COMPACTOR_ENABLED = _get_env("PROMPT_COMPACTOR_ENABLED", "false").lower() == "true"
+PROMPT_TOKEN_CHUNKS = _get_int("PROMPT_TOKEN_CHUNKS", 1)  # 允许的 chunk 数（1 = 75 tokens）
+
+# 🔁 Prompt 新颖度检查（跳过与已评分 Prompt 近重复的渲染）
+PROMPT_NOVELTY_ENABLED = _get_env("PROMPT_NOVELTY_ENABLED", "false").lower() == "true"
+PROMPT_NOVELTY_THRESHOLD = _get_float("PROMPT_NOVELTY_THRESHOLD", 0.97)  # CLIP 文本嵌入余弦相似度
+
+# 💾 DeepSeek 响应磁盘缓存（模型推荐 / LoRA 推荐 / 项目命名）
+LLM_CACHE_ENABLED = _get_env("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = _get_env("LLM_CACHE_PATH", os.path.join("cache", "llm_cache.sqlite3"))
+LLM_CACHE_TTL_HOURS = _get_float("LLM_CACHE_TTL_HOURS", 168.0)  # 默认 7 天
+LLM_CACHE_MAX_ENTRIES = _get_int("LLM_CACHE_MAX_ENTRIES", 5000)
+
 # Judge (Qwen) - 多模型评分池以充分利用2000次/天免费额度
 # 每个模型限额500次/天，轮换使用4个模型可达2000次/天
 # 📊 评分模型池 - 200B+多模态模型（更强推理与一致性）
@@ -56,6 +149,21 @@ JUDGE_MODEL_ROTATION_ENABLED = _get_env("JUDGE_MODEL_ROTATION_ENABLED", "true").
 JUDGE_MODEL_DAILY_LIMIT = _get_int("JUDGE_MODEL_DAILY_LIMIT", 500)  # 单个模型每日限制
 JUDGE_MODEL_ROTATION_INTERVAL = _get_int("JUDGE_MODEL_ROTATION_INTERVAL", 150)  # 每150次评分轮换
 
+# 🏁 多模态参考图分析：同时在途的候选模型数（1 = 逐个顺序尝试）
+MULTIMODAL_RACE_WIDTH = _get_int("MULTIMODAL_RACE_WIDTH", 2)
+
+# 🧮 CLIP 推理服务（跨会话微批处理）
+CLIP_BATCHING_ENABLED = _get_env("CLIP_BATCHING_ENABLED", "true").lower() == "true"
+CLIP_BATCH_MAX_SIZE = _get_int("CLIP_BATCH_MAX_SIZE", 16)        # 单批最多合并的请求数
+CLIP_BATCH_MAX_WAIT_MS = _get_float("CLIP_BATCH_MAX_WAIT_MS", 4.0)  # 攒批最长等待（毫秒）
+
+# 🛰️ CLIP 边车进程（多 worker 部署共享一份模型；为空则在本进程加载）
+CLIP_SIDECAR_SOCKET = _get_env("CLIP_SIDECAR_SOCKET", "")
+CLIP_SIDECAR_TIMEOUT = _get_float("CLIP_SIDECAR_TIMEOUT", 30.0)
+
+# 📚 参考图标签词表（tag_vocabulary build 的输出目录；为空则使用内置 DEFAULT_TAG_BANK）
+TAG_VOCAB_PATH = _get_env("TAG_VOCAB_PATH", "")
+
 # Logging
 LOG_LEVEL = _get_env("LOG_LEVEL", "INFO")
 LOG_FILE = _get_env("LOG_FILE", "pygmalion.log")
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Forge 客户端 - 多后端调度的 SD WebUI API 调用
+
+FORGE_URLS 可配置多个 Forge 实例（多 GPU / 多机）。每个请求分配给排队 ETA 最小的后端
+（有延迟模型预测时按在途请求的预测耗时之和，否则按在途请求数）；生成请求未显式指定
+超时时按延迟模型的 p99 加上所选后端的排队 ETA 设定（可由 timeout_cap 封顶，如迭代剩余时间），
+成功后把耗时计入延迟模型。客户端记录经它切换到各后端的
+底模，请求指定的底模不是后端已知加载的底模时（耗时可能包含加载底模），既不按延迟模型
+设定超时，也不记录耗时。map_txt2img 按后端数并发
+提交一组请求，并按完成顺序返回结果，调用方可以边渲染边评分。单后端时行为与直接
+requests.post 一致。img2img 用于基于已有图片的低重绘精修，upscale 用于最终图的后处理放大。
+生成类响应以流式读取，图片 base64 边读边解码（见 forge_stream），不在内存中保留完整响应。
+"""
+from __future__ import annotations
+
+import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import requests
+
+from pkg.infrastructure.config import FORGE_TIMEOUT, FORGE_URLS
+from pkg.infrastructure.forge_stream import CHUNK_SIZE, decode_response
+from pkg.infrastructure.latency_model import LatencyModel, get_latency_model
+
+# 小于该字节数的图片视为异常（Forge 出错时可能返回占位小图）
+MIN_IMAGE_BYTES = 1000
+
+
+class ForgeError(RuntimeError):
+    """Forge 返回了错误或无效结果"""
+
+
+@dataclass
+class ForgeResult:
+    """一次生成请求的结果"""
+    images: List[bytes]
+    backend: str
+    elapsed: float
+    info: Dict[str, Any] = field(default_factory=dict)  # 响应中图片以外的字段（info/parameters 需 include_info）
+
+
+class ForgeBackend:
+    """单个 Forge 实例（记录在途请求数用于负载均衡）"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.inflight = 0
+        self.served = 0
+        self.pending_seconds = 0.0  # 在途请求的预测耗时之和（排队 ETA）
+        self.checkpoint: Optional[str] = None  # 已知加载的底模（经本客户端切换后记录，未知为 None）
+
+
+class ForgeClient:
+    """多后端 Forge API 客户端"""
+
+    def __init__(self, urls: Optional[Sequence[str]] = None, timeout: float = FORGE_TIMEOUT,
+                 latency: Optional[LatencyModel] = None):
+        """
+        Args:
+            urls: Forge 地址列表（默认 FORGE_URLS）
+            timeout: 默认请求超时（秒；延迟模型样本不足时使用）
+            latency: 延迟模型（None 时按在途请求数调度、使用固定超时）
+        """
+        urls = list(urls or FORGE_URLS)
+        if not urls:
+            raise ValueError("至少需要一个 Forge 地址")
+        self.backends = [ForgeBackend(url) for url in urls]
+        self.timeout = timeout
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def _expected(self, payload: Optional[Dict[str, Any]], backend: ForgeBackend) -> float:
+        if self.latency is None or not payload:
+            return 0.0
+        estimate = self.latency.predict(payload, backend.url)
+        return estimate.expected if estimate is not None else 0.0
+
+    def _acquire(self, payload: Optional[Dict[str, Any]] = None) -> Tuple[ForgeBackend, float]:
+        """选择排队 ETA（在途预测耗时 + 本请求预测耗时）最小的后端，无预测时即在途请求最少者"""
+        expected = {b.url: self._expected(payload, b) for b in self.backends}
+        with self._lock:
+            backend = min(self.backends, key=lambda b: (b.pending_seconds + expected[b.url], b.inflight, b.served))
+            backend.inflight += 1
+            backend.served += 1
+            backend.pending_seconds += expected[backend.url]
+            return backend, expected[backend.url]
+
+    def _release(self, backend: ForgeBackend, expected: float = 0.0) -> None:
+        with self._lock:
+            backend.inflight -= 1
+            backend.pending_seconds = max(0.0, backend.pending_seconds - expected)
+
+    def may_switch(self, payload: Dict[str, Any], backend: Optional[str] = None) -> bool:
+        """请求指定的底模是否可能需要加载（backend 为 None 时任一后端未知已加载即视为可能）"""
+        checkpoint = (payload.get("override_settings") or {}).get("sd_model_checkpoint")
+        if not checkpoint:
+            return False
+        return any(b.checkpoint != checkpoint for b in self.backends if backend is None or b.url == backend)
+
+    def _note_checkpoint(self, backend: ForgeBackend, endpoint: str, payload: Dict[str, Any], ok: bool) -> None:
+        """请求结束后更新后端已知加载的底模（失败时状态未知）"""
+        if endpoint == "/sdapi/v1/unload-checkpoint":
+            backend.checkpoint = None
+            return
+        if endpoint == "/sdapi/v1/options":
+            checkpoint = payload.get("sd_model_checkpoint")
+        elif payload.get("override_settings_restore_afterwards", True) is False:
+            checkpoint = (payload.get("override_settings") or {}).get("sd_model_checkpoint")
+        else:
+            return  # 请求结束后 Forge 恢复原底模
+        if checkpoint:
+            backend.checkpoint = checkpoint if ok else None
+
+    def timeout_for(self, payload: Dict[str, Any], backend: Optional[str] = None) -> float:
+        """生成请求的超时：延迟模型的 p99 × 系数；无预测或可能需要加载底模时为默认超时"""
+        if self.latency is None or self.may_switch(payload, backend):
+            return self.timeout
+        return self.latency.timeout_for(payload, backend, default=self.timeout)
+
+    def eta(self, payload: Dict[str, Any]) -> Optional[float]:
+        """该请求从提交到完成的预计秒数（含排队；无预测或可能需要加载底模时返回 None）"""
+        if self.latency is None or self.may_switch(payload) or self.latency.predict(payload) is None:
+            return None
+        with self._lock:
+            pending = {b.url: b.pending_seconds for b in self.backends}
+        return min(pending[b.url] + self._expected(payload, b) for b in self.backends)
+
+    def post(self, endpoint: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+             backend: Optional[ForgeBackend] = None, render: bool = False,
+             parse: Optional[Callable[[requests.Response], Any]] = None,
+             timeout_cap: Optional[float] = None) -> Tuple[Any, str, float]:
+        """
+        向一个后端发送 JSON 请求
+
+        Args:
+            render: 是否为生成请求（未指定超时时按延迟模型设定并加上所选后端的排队 ETA；
+                成功、未排队且无需加载底模时记录耗时）
+            parse: 响应解析函数（默认 resp.json()；指定时以流式读取响应）
+            timeout_cap: 超时上限（如迭代剩余时间；None 不设上限）
+
+        Returns:
+            (Any, str, float): (解析结果, 后端地址, 耗时秒数)
+
+        Raises:
+            ForgeError: HTTP 非 200；requests.Timeout 等网络异常原样抛出
+        """
+        chosen, expected = (backend, 0.0) if backend is not None else self._acquire(payload if render else None)
+        queued = chosen.inflight > 1
+        switching = render and self.may_switch(payload, chosen.url)
+        if timeout is None and render:
+            # 选定后端后才知道排在前面的在途请求：其预测耗时之和计入本请求的超时
+            with self._lock:
+                ahead = max(0.0, chosen.pending_seconds - expected)
+            timeout = self.timeout_for(payload, chosen.url) + ahead
+        elif timeout is None:
+            timeout = self.timeout
+        if timeout_cap is not None:
+            timeout = min(timeout, timeout_cap)
+        start = time.time()
+        ok = False
+        try:
+            with requests.post(f"{chosen.url}{endpoint}", json=payload, timeout=timeout,
+                               stream=parse is not None) as resp:
+                if resp.status_code != 200:
+                    raise ForgeError(f"Forge HTTP {resp.status_code}")
+                data = resp.json() if parse is None else parse(resp)
+            ok = True
+            elapsed = time.time() - start
+            # 耗时含排队（同一后端上有其他在途请求）或底模加载时间时不计入延迟模型
+            if render and self.latency is not None and not queued and not switching:
+                self.latency.observe(chosen.url, payload, elapsed)
+            return data, chosen.url, elapsed
+        finally:
+            self._note_checkpoint(chosen, endpoint, payload, ok)
+            if backend is None:
+                self._release(chosen, expected)
+
+    def get(self, endpoint: str, backend: ForgeBackend, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        向指定后端发送 GET 请求（查询类接口，不计入负载均衡）
+
+        Raises:
+            ForgeError: HTTP 非 200
+        """
+        resp = requests.get(f"{backend.url}{endpoint}", timeout=self.timeout if timeout is None else timeout)
+        if resp.status_code != 200:
+            raise ForgeError(f"Forge HTTP {resp.status_code}")
+        return resp.json()
+
+    def txt2img(self, payload: Dict[str, Any], timeout: Optional[float] = None,
+                include_info: bool = False, timeout_cap: Optional[float] = None) -> ForgeResult:
+        """
+        文生图
+
+        Args:
+            timeout: 显式超时（None 时按延迟模型 p99 + 排队 ETA）
+            include_info: 是否解析响应中的 info / parameters（默认跳过）
+            timeout_cap: 超时上限（如迭代剩余时间）
+
+        Raises:
+            ForgeError: HTTP 错误、返回空 images、图片过小或响应不完整
+        """
+        return self._render("/sdapi/v1/txt2img", payload, timeout, include_info, timeout_cap=timeout_cap)
+
+    def img2img(self, payload: Dict[str, Any], timeout: Optional[float] = None,
+                include_info: bool = False, timeout_cap: Optional[float] = None) -> ForgeResult:
+        """
+        图生图（payload 需包含 init_images 与 denoising_strength；超时参数同 txt2img）
+
+        Raises:
+            ForgeError: HTTP 错误、返回空 images、图片过小或响应不完整
+        """
+        return self._render("/sdapi/v1/img2img", payload, timeout, include_info, timeout_cap=timeout_cap)
+
+    def _render(self, endpoint: str, payload: Dict[str, Any], timeout: Optional[float],
+                include_info: bool, render: bool = True, timeout_cap: Optional[float] = None) -> ForgeResult:
+        def parse(resp: requests.Response):
+            try:
+                return decode_response(resp.iter_content(CHUNK_SIZE), include_info=include_info)
+            except ValueError as e:  # StreamError、JSON 与 base64 解码错误
+                raise ForgeError(f"Forge 响应解析失败: {e}") from e
+
+        (images, fields), url, elapsed = self.post(endpoint, payload, timeout, render=render, parse=parse,
+                                                   timeout_cap=timeout_cap)
+        return ForgeResult(images=self._check_images(images), backend=url, elapsed=elapsed, info=fields)
+
+    def upscale(self, image: str, factor: float, upscaler: str, timeout: Optional[float] = None) -> ForgeResult:
+        """
+        后处理放大（extras，不经扩散模型）
+
+        Args:
+            image: base64 图片
+            factor: 放大倍率
+            upscaler: 放大器名称（如 "R-ESRGAN 4x+"）
+
+        Raises:
+            ForgeError: HTTP 错误、返回空图片或图片过小
+        """
+        payload = {"image": image, "resize_mode": 0, "upscaling_resize": factor, "upscaler_1": upscaler}
+        return self._render("/sdapi/v1/extra-single-image", payload, timeout, include_info=False, render=False)
+
+    def map_txt2img(self, payloads: Sequence[Dict[str, Any]], timeout: Optional[float] = None,
+                    timeout_cap: Optional[float] = None) -> Iterator[Tuple[int, Union[ForgeResult, Exception], float]]:
+        """
+        并发提交一组文生图请求（并发数 = 后端数），按完成顺序产出；超时参数同 txt2img
+
+        Yields:
+            (int, ForgeResult | Exception, float): (请求下标, 结果或异常, 请求耗时)
+        """
+        def submit(index: int):
+            start = time.time()
+            try:
+                return index, self.txt2img(payloads[index], timeout, timeout_cap=timeout_cap), time.time() - start
+            except Exception as e:
+                return index, e, time.time() - start
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.backends))) as executor:
+            futures = [executor.submit(submit, i) for i in range(len(payloads))]
+            for future in as_completed(futures):
+                yield future.result()
+
+    @staticmethod
+    def _check_images(images: List[bytes]) -> List[bytes]:
+        if not images:
+            raise ForgeError("Forge 返回空 images，疑似故障")
+        if len(images[0]) < MIN_IMAGE_BYTES:
+            raise ForgeError(f"Forge 返回的图片过小 ({len(images[0])} bytes)，疑似异常")
+        return images
+
+
+def encode_image(path: str) -> str:
+    """读取图片文件为 API 所需的 base64 字符串"""
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+
+_shared_client: Optional[ForgeClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_forge_client() -> ForgeClient:
+    """进程内共享的 Forge 客户端（后端在途计数跨会话共享）"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = ForgeClient(latency=get_latency_model())
+        return _shared_client
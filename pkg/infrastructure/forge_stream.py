@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Forge 响应的流式解析 - 边读边把 base64 图片解码为字节
+
+生成接口的响应是一个 JSON 对象，images 中每张图是数 MB 的 base64 字符串（批量或
+HR 输出更大）。resp.json() 需要同时持有响应文本、解析后的 dict 与解码后的字节。这里
+按块读取响应体，只对顶层对象做增量解析：图片字段（images 数组 / 单个 image）的字符串
+按 4 字符对齐分段直接解码进字节缓冲；info 与 parameters（img2img 会回传 init_images）
+默认跳过不保留，其余小字段照常解析。峰值内存约为解码后的图片本身。
+"""
+from __future__ import annotations
+
+import base64
+import codecs
+import io
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 每次从响应读取的字节数
+CHUNK_SIZE = 256 * 1024
+# 图片字段（txt2img/img2img 为数组，extra-single-image 为单个字符串）
+IMAGE_KEYS = ("images", "image")
+# 体积可能很大、默认不解析的字段
+LARGE_KEYS = ("info", "parameters")
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class StreamError(ValueError):
+    """响应不完整或不是预期的 JSON 结构"""
+
+
+class _Base64Sink:
+    """增量 base64 解码：每次只解码 4 的整数倍个字符，余下的留给下一段"""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._rest = ""
+
+    def write(self, text: str) -> None:
+        text = self._rest + text
+        cut = len(text) - len(text) % 4
+        if cut:
+            self._buffer.write(base64.b64decode(text[:cut]))
+        self._rest = text[cut:]
+
+    def getvalue(self) -> bytes:
+        if self._rest:
+            self._buffer.write(base64.b64decode(self._rest + "=" * (-len(self._rest) % 4)))
+            self._rest = ""
+        return self._buffer.getvalue()
+
+
+class _JsonStream:
+    """按块输入的 JSON 文本读取器（只保留尚未消费的部分）"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self) -> str:
+        while self.pos >= len(self.buf):
+            if not self._fill():
+                raise StreamError("响应不完整")
+        return self.buf[self.pos]
+
+    def next(self) -> str:
+        ch = self.peek()
+        self.pos += 1
+        return ch
+
+    def skip_ws(self) -> None:
+        while self.peek() in " \t\r\n":
+            self.pos += 1
+
+    def expect(self, expected: str) -> None:
+        self.skip_ws()
+        if self.next() != expected:
+            raise StreamError(f"期望 {expected!r}")
+
+    def string(self, sink: Optional[Callable[[str], None]], raw: bool) -> None:
+        """
+        读取一个字符串
+
+        Args:
+            sink: 接收内容的回调（None 表示跳过）
+            raw: True 时交给 sink 原始 JSON 文本（含引号与转义）；False 时只交出内容（仅还原 \\/）
+        """
+        self.expect('"')
+        if sink is not None and raw:
+            sink('"')
+        while True:
+            match = _STRING_SPECIAL.search(self.buf, self.pos)
+            end = match.start() if match else len(self.buf)
+            if sink is not None and end > self.pos:
+                sink(self.buf[self.pos:end])
+            self.pos = end
+            if match is None:
+                self.peek()
+                continue
+            if self.next() == '"':
+                if sink is not None and raw:
+                    sink('"')
+                return
+            escaped = self.next()
+            if sink is not None:
+                if raw:
+                    sink("\\" + escaped)
+                elif escaped == "/":
+                    sink("/")
+
+    def value(self, sink: Optional[Callable[[str], None]]) -> None:
+        """读取任意 JSON 值，把原始文本交给 sink（None 表示跳过）"""
+        self.skip_ws()
+        ch = self.peek()
+        if ch == '"':
+            self.string(sink, raw=True)
+            return
+        if ch in "{[":
+            depth = 0
+            while True:
+                ch = self.peek()
+                if ch == '"':
+                    self.string(sink, raw=True)
+                    continue
+                self.pos += 1
+                if sink is not None:
+                    sink(ch)
+                if ch in "{[":
+                    depth += 1
+                elif ch in "}]":
+                    depth -= 1
+                    if depth == 0:
+                        return
+        while self.peek() not in ",}] \t\r\n":
+            ch = self.next()
+            if sink is not None:
+                sink(ch)
+
+
+def _read_image(stream: _JsonStream) -> bytes:
+    sink = _Base64Sink()
+    stream.string(sink.write, raw=False)
+    return sink.getvalue()
+
+
+def decode_response(chunks: Iterable[bytes], include_info: bool = False) -> Tuple[List[bytes], Dict[str, Any]]:
+    """
+    流式解析 Forge 生成接口的响应
+
+    Args:
+        chunks: 响应体的字节块（如 resp.iter_content(CHUNK_SIZE)）
+        include_info: 是否解析 info / parameters
+
+    Returns:
+        (list[bytes], dict): (解码后的图片, 其余字段)
+
+    Raises:
+        StreamError: 响应不完整或顶层不是 JSON 对象
+    """
+    stream = _JsonStream(chunks)
+    images: List[bytes] = []
+    fields: Dict[str, Any] = {}
+    stream.expect("{")
+    stream.skip_ws()
+    if stream.peek() == "}":
+        return images, fields
+    while True:
+        key_parts: List[str] = []
+        stream.string(key_parts.append, raw=False)
+        key = "".join(key_parts)
+        stream.expect(":")
+        stream.skip_ws()
+        if key in IMAGE_KEYS and stream.peek() == '"':
+            images.append(_read_image(stream))
+        elif key in IMAGE_KEYS and stream.peek() == "[":
+            stream.next()
+            stream.skip_ws()
+            if stream.peek() == "]":
+                stream.next()
+            else:
+                while True:
+                    images.append(_read_image(stream))
+                    stream.skip_ws()
+                    if stream.next() == "]":
+                        break
+        elif include_info or key not in LARGE_KEYS:
+            parts: List[str] = []
+            stream.value(parts.append)
+            fields[key] = json.loads("".join(parts))
+        else:
+            stream.value(None)
+        stream.skip_ws()
+        ch = stream.next()
+        if ch == "}":
+            return images, fields
+        if ch != ",":
+            raise StreamError(f"意外的字符 {ch!r}")
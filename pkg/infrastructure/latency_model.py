@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Forge 延迟模型 - 按渲染工作量预测请求耗时，给出自适应超时与排队 ETA
+
+固定的 FORGE_TIMEOUT 对 1 步 Turbo 预览过长（卡死要白等），对 28 步 + HR 的动漫渲染
+在繁忙节点上又可能误判超时。这里按 (后端, 底模) 记录实际耗时，以渲染工作量（步数 ×
+像素数，HR 第二遍、img2img 重绘强度与批量数折算在内）做线性回归：预测期望耗时，
+按近期观测的耗时/预测比的高分位得到 p99，超时取 p99 × 系数。单个后端样本不足时回退到
+同底模的全部后端，仍不足则沿用 FORGE_TIMEOUT。可能包含底模加载时间的请求由 ForgeClient
+排除在观测与预测之外。观测每积累 SAVE_EVERY 条写一次文件，进程退出时写入剩余观测。
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from pkg.infrastructure.config import (
+    FORGE_TIMEOUT,
+    LATENCY_MAX_TIMEOUT,
+    LATENCY_MIN_SAMPLES,
+    LATENCY_MIN_TIMEOUT,
+    LATENCY_MODEL_ENABLED,
+    LATENCY_MODEL_PATH,
+    LATENCY_TIMEOUT_FACTOR,
+)
+
+logger = logging.getLogger(__name__)
+
+# 每个 (后端, 底模) 保留的最近观测数
+MAX_SAMPLES = 200
+# 每积累多少条新观测写一次文件
+SAVE_EVERY = 20
+# 工作量的参考像素数（1024×1024 记为 1）
+REFERENCE_PIXELS = 1024 * 1024
+
+
+@dataclass
+class LatencyEstimate:
+    """一次请求的耗时预测（秒）"""
+    expected: float
+    p99: float
+    samples: int
+
+
+def checkpoint_of(payload: Dict[str, Any]) -> str:
+    return (payload.get("override_settings") or {}).get("sd_model_checkpoint") or "default"
+
+
+def render_cost(payload: Dict[str, Any]) -> float:
+    """渲染工作量：步数 × 像素数（参考 1024²），含 HR 第二遍与 img2img 重绘强度，乘以批量数"""
+    pixels = payload.get("width", 1024) * payload.get("height", 1024) / REFERENCE_PIXELS
+    steps = payload.get("steps", 20)
+    if payload.get("init_images"):
+        # img2img 实际执行的步数约为 steps × 重绘强度
+        steps *= payload.get("denoising_strength", 0.75)
+    cost = steps * pixels
+    if payload.get("enable_hr"):
+        scale = payload.get("hr_scale", 2.0)
+        second_steps = payload.get("hr_second_pass_steps") or payload.get("steps", 20)
+        cost += second_steps * payload.get("denoising_strength", 0.7) * pixels * scale * scale
+    return cost * max(1, payload.get("batch_size", 1))
+
+
+class LatencyModel:
+    """按 (后端, 底模) 分组的耗时观测与预测（JSON 持久化）"""
+
+    def __init__(self, path: str = LATENCY_MODEL_PATH, min_samples: int = LATENCY_MIN_SAMPLES,
+                 save_every: int = SAVE_EVERY):
+        """
+        Args:
+            path: 持久化文件（空字符串表示不持久化）
+            min_samples: 用于预测的最少观测数
+            save_every: 每积累多少条新观测写一次文件
+        """
+        self.path = path
+        self.min_samples = max(2, min_samples)
+        self.save_every = max(1, save_every)
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[List[float]]] = self._load()
+
+    @staticmethod
+    def _key(backend: str, checkpoint: str) -> str:
+        return f"{backend}|{checkpoint}"
+
+    def observe(self, backend: str, payload: Dict[str, Any], seconds: float) -> None:
+        """记录一次成功请求的耗时"""
+        key = self._key(backend, checkpoint_of(payload))
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append([render_cost(payload), float(seconds)])
+            del samples[:-MAX_SAMPLES]
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save_locked()
+
+    def flush(self) -> None:
+        """写入尚未保存的观测"""
+        with self._lock:
+            if self._unsaved:
+                self._save_locked()
+
+    def predict(self, payload: Dict[str, Any], backend: Optional[str] = None) -> Optional[LatencyEstimate]:
+        """
+        预测请求耗时
+
+        Args:
+            payload: 生成参数
+            backend: 后端地址（None 时按同底模的全部后端预测）
+
+        Returns:
+            LatencyEstimate | None: 样本不足时返回 None
+        """
+        checkpoint = checkpoint_of(payload)
+        with self._lock:
+            groups = []
+            if backend is not None:
+                groups.append(self._samples.get(self._key(backend, checkpoint), []))
+            groups.append([s for k, v in self._samples.items() if k.endswith(f"|{checkpoint}") for s in v])
+        for samples in groups:
+            if len(samples) >= self.min_samples:
+                return self._estimate(np.asarray(samples, dtype=np.float64), render_cost(payload))
+        return None
+
+    @staticmethod
+    def _estimate(samples: np.ndarray, cost: float) -> LatencyEstimate:
+        """耗时 = a + b × 工作量 的最小二乘拟合；p99 取观测耗时/拟合值之比的 99 分位"""
+        costs, seconds = samples[:, 0], samples[:, 1]
+        if np.ptp(costs) > 1e-9:
+            slope, intercept = np.polyfit(costs, seconds, 1)
+            slope, intercept = max(0.0, slope), max(0.0, intercept)
+        else:
+            # 工作量都相同：按单位工作量耗时外推
+            slope, intercept = float(np.mean(seconds)) / max(float(costs[0]), 1e-9), 0.0
+        fitted = np.maximum(intercept + slope * costs, 1e-3)
+        expected = max(intercept + slope * cost, 1e-3)
+        ratio = float(np.quantile(seconds / fitted, 0.99))
+        return LatencyEstimate(expected=expected, p99=expected * max(1.0, ratio), samples=len(samples))
+
+    def timeout_for(self, payload: Dict[str, Any], backend: Optional[str] = None,
+                    default: float = FORGE_TIMEOUT) -> float:
+        """请求超时：p99 × LATENCY_TIMEOUT_FACTOR，限制在 [LATENCY_MIN_TIMEOUT, LATENCY_MAX_TIMEOUT]；无预测时用 default"""
+        estimate = self.predict(payload, backend)
+        if estimate is None:
+            return default
+        return min(LATENCY_MAX_TIMEOUT, max(LATENCY_MIN_TIMEOUT, estimate.p99 * LATENCY_TIMEOUT_FACTOR))
+
+    def _load(self) -> Dict[str, List[List[float]]]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("samples", {})
+        except Exception as e:
+            logger.warning(f"⚠️ 延迟模型读取失败，重新开始记录: {e}")
+            return {}
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "samples": self._samples}, f)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+        except Exception as e:
+            logger.warning(f"⚠️ 延迟模型写入失败: {e}")
+
+
+_shared_model: Optional[LatencyModel] = None
+_shared_lock = threading.Lock()
+
+
+def get_latency_model() -> Optional[LatencyModel]:
+    """进程内共享的延迟模型（LATENCY_MODEL_ENABLED=false 时返回 None）"""
+    global _shared_model
+    if not LATENCY_MODEL_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_model is None:
+            _shared_model = LatencyModel()
+            atexit.register(_shared_model.flush)
+        return _shared_model
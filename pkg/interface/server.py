@@ -25,7 +25,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 
 try:
     from pkg.system.engine import DiffuServoV4
-    from pkg.infrastructure.config.settings import JUDGE_MODELS
+    from pkg.infrastructure.config.settings import JUDGE_MODELS, SESSION_BUDGET_TIER
+    from pkg.infrastructure.budget import SESSION_TIERS, SessionBudget
+    from pkg.system.modules.creator.llm_cache import get_llm_cache
+    from pkg.system.strategies.convergence_predictor import get_convergence_predictor
     CORE_AVAILABLE = True
 except ImportError as e:
     logger_temp = logging.getLogger(__name__)
@@ -187,7 +190,7 @@ def start_cleanup_thread():
 class GenerationSession:
     """生成会话管理类"""
     
-    def __init__(self, session_id, theme, target_score, max_iterations, quick_mode, reference_image_path=None):
+    def __init__(self, session_id, theme, target_score, max_iterations, quick_mode, reference_image_path=None, budget=None):
         self.session_id = session_id
         self.theme = theme
         self.target_score = target_score
@@ -203,6 +206,9 @@ class GenerationSession:
         self.created_at = datetime.now()
         self.client_sid = None
         self.feedback = [] # 存储用户实时反馈
+        self.budget = budget  # 💰 会话预算（SessionBudget，核心不可用时为 None）
+        self.reach_probability = None  # 🔮 剩余预算内达到目标分数的预测概率
+        self.final_image = None  # 📐 延迟高清化后的最佳图片
         
     def log_event(self, event_type, content):
         """记录事件"""
@@ -232,7 +238,9 @@ class GenerationSession:
             'best_image': self.best_image,
             'image_count': len(self.images),
             'is_running': self.is_running,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'budget': self.budget.snapshot() if self.budget else None,
+            'reach_probability': self.reach_probability
         }
 
 
@@ -273,15 +281,25 @@ def index():
 @app.route('/api/status')
 def get_status():
     """获取系统状态"""
+    llm_cache = get_llm_cache() if CORE_AVAILABLE else None
     return jsonify({
         'status': 'running' if pygmalion_core else 'initializing',
         'active_sessions': len(active_sessions),
         'system_info': {
             'judgeModels': list(JUDGE_MODELS.keys()) if CORE_AVAILABLE else [],
+            'llmCache': llm_cache.stats() if llm_cache else None,
         }
     })
 
 
+@app.route('/api/budget_tiers', methods=['GET'])
+def list_budget_tiers():
+    """获取可选的会话预算档位"""
+    if not CORE_AVAILABLE:
+        return jsonify({'tiers': {}, 'default': None})
+    return jsonify({'tiers': SESSION_TIERS, 'default': SESSION_BUDGET_TIER})
+
+
 @app.route('/api/sessions', methods=['GET'])
 def list_sessions():
     """获取所有会话"""
@@ -299,6 +317,22 @@ def get_session(session_id):
     return jsonify(session.to_dict())
 
 
+@app.route('/api/sessions/<session_id>/best', methods=['GET'])
+def get_session_best(session_id):
+    """获取会话当前最佳结果（生成过程中随时可用）"""
+    if session_id not in active_sessions:
+        return jsonify({'error': '会话不存在'}), 404
+    
+    session = active_sessions[session_id]
+    return jsonify({
+        'best_score': session.best_score,
+        'best_image': _path_to_url(session.best_image),
+        'current_iteration': session.current_iteration,
+        'is_running': session.is_running,
+        'budget': session.budget.snapshot() if session.budget else None
+    })
+
+
 @app.route('/api/sessions/<session_id>/history', methods=['GET'])
 def get_session_history(session_id):
     """获取会话历史"""
@@ -354,9 +388,24 @@ def handle_start_generation(data):
             emit('error', {'message': '主题不能为空'})
             return
         
+        # 💰 会话预算：按档位创建，可单项覆盖
+        budget = None
+        if CORE_AVAILABLE:
+            try:
+                budget = SessionBudget.from_tier(
+                    data.get('budget_tier') or SESSION_BUDGET_TIER,
+                    wall_seconds=data.get('wall_seconds'),
+                    gpu_seconds=data.get('gpu_seconds'),
+                    judge_calls=data.get('judge_calls'),
+                )
+            except ValueError as e:
+                # 未知档位或非正数的预算项：客户端参数错误
+                emit('error', {'message': str(e), 'code': 400})
+                return
+        
         # 创建新会话（包含参考图路径）
         session_id = str(uuid.uuid4())
-        session = GenerationSession(session_id, theme, target_score, max_iterations, quick_mode, reference_image_path)
+        session = GenerationSession(session_id, theme, target_score, max_iterations, quick_mode, reference_image_path, budget)
         session.client_sid = request.sid
         active_sessions[session_id] = session
         
@@ -420,11 +469,14 @@ def run_generation(session_id, session, theme):
     try:
         # 为本次生成创建或配置核心系统
         session_core = None
+        predictor = get_convergence_predictor() if CORE_AVAILABLE else None
         if CORE_AVAILABLE:
             try:
                 session_core = DiffuServoV4(theme=theme)
                 session_core.target_score = session.target_score
                 session_core.max_iterations = session.max_iterations
+                if session.budget is not None:
+                    session_core.session_budget = session.budget
                 # 传递参考图路径
                 if session.reference_image_path:
                     session_core._session_reference_image = session.reference_image_path
@@ -459,6 +511,15 @@ def run_generation(session_id, session, theme):
         
         # 第 2-N 步: 迭代生成和评分
         for iteration in range(1, session.max_iterations + 1):
+            exhausted = session.budget.exhausted_reason() if session.budget else None
+            if exhausted:
+                session.emit_message('status_update', {
+                    'status': f'💰 会话预算耗尽（{exhausted}），交付当前最佳结果'
+                })
+                session.log_event('budget_exhausted', exhausted)
+                logger.info(f"[{session_id}] 💰 会话预算耗尽: {exhausted}")
+                break
+
             session.current_iteration = iteration
             session.log_event('iteration_start', f'第 {iteration}/{session.max_iterations} 次迭代')
             
@@ -469,9 +530,11 @@ def run_generation(session_id, session, theme):
             
             logger.info(f"[{session_id}] 🎨 第 {iteration}/{session.max_iterations} 次迭代")
             
-            # 生成图片（调用真实生成器）
+            # 生成图片（调用真实生成器）；⏱️ 延迟模型按上一轮参数预估渲染耗时，供前端显示进度
+            eta = session_core.forge.eta(session_core.params) if session_core is not None else None
             session.emit_message('status_update', {
-                'status': f'🎨 正在生成第 {iteration} 张图片...'
+                'status': f'🎨 正在生成第 {iteration} 张图片...' + (f'（预计约 {eta:.0f} 秒）' if eta is not None else ''),
+                'eta_seconds': round(eta, 1) if eta is not None else None
             })
             
             # 处理实时反馈：如果有新需求，合并到当前的创意建议中
@@ -509,6 +572,8 @@ def run_generation(session_id, session, theme):
             scores = _evaluate_image(image_path, session_core, reference_image_path=session.reference_image_path)
             # 修复：不再取最大值，而是取 evaluator 返回的 final_score
             current_score = scores.get('final_score', 0.0) if scores else 0.0
+            # 🧮 本地 CLIP 估算分与评审分量纲不同：不参与最佳结果、达标判断与收敛预测
+            estimated = bool(scores and scores.get('estimated'))
             
             session.log_event('evaluation_complete', {
                 'scores': scores,
@@ -520,10 +585,11 @@ def run_generation(session_id, session, theme):
                 'iteration': iteration,
                 'path': image_path,
                 'score': current_score,
-                'scores_detail': scores
+                'scores_detail': scores,
+                'estimated': estimated
             })
             
-            if current_score > session.best_score:
+            if not estimated and current_score > session.best_score:
                 session.best_score = current_score
                 session.best_image = image_path
             
@@ -541,7 +607,7 @@ def run_generation(session_id, session, theme):
                 'iteration': iteration,
                 'current_score': current_score,
                 'image_path': _path_to_url(image_path),
-                'is_best': current_score == session.best_score,
+                'is_best': not estimated and current_score == session.best_score,
                 'max_iterations': session.max_iterations,
                 'scores_detail': {
                     'concept': scores.get('concept', 0),
@@ -561,28 +627,80 @@ def run_generation(session_id, session, theme):
                     'character_consistency': scores.get('character_consistency', 0)
                 }
             
+            # 🔮 收敛预测：剩余预算内的达标概率（供前端与调度参考）
+            stop_early = False
+            if predictor is not None:
+                remaining = session.max_iterations - iteration
+                affordable = session.budget.affordable_iterations(iteration) if session.budget else None
+                if affordable is not None:
+                    remaining = min(remaining, affordable)
+                history_scores = [img['score'] for img in session.images if not img.get('estimated')]
+                stop_early, session.reach_probability = predictor.should_stop(
+                    history_scores, session.target_score, remaining
+                )
+                score_update['reach_probability'] = session.reach_probability
+
             session.emit_message('score_update', score_update)
             
             logger.info(f"[{session_id}] 📊 迭代 {iteration} 完成，分数: {current_score:.3f}")
             
             # 检查是否达到目标分数
-            if current_score >= session.target_score:
+            if not estimated and current_score >= session.target_score:
                 session.emit_message('status_update', {
                     'status': f'✅ 已达到目标分数 {session.target_score} !'
                 })
                 session.log_event('target_reached', f'达到目标分数 {session.target_score}')
                 logger.info(f"[{session_id}] ✅ 已达到目标分数!")
                 break
+
+            if stop_early:
+                message = f'剩余 {remaining} 次迭代内达到目标 {session.target_score} 的概率仅 {session.reach_probability:.1%}'
+                session.emit_message('status_update', {
+                    'status': f'🔮 {message}，提前停止并交付当前最佳结果'
+                })
+                session.log_event('early_stop', message)
+                logger.info(f"[{session_id}] 🔮 {message}，提前停止")
+                break
             
+            # 🗂️ 下一轮底模在构思阶段后台预加载
+            if session_core is not None:
+                session_core.prefetch_next_checkpoint(current_score)
+
             # 短暂延迟，避免过快轮询
             time.sleep(0.5)
         
+        if session_core is not None:
+            try:
+                session_core.record_model_outcome(best_score=session.best_score)
+            except Exception as e:
+                logger.warning(f"[{session_id}] ⚠️ 记录主题样本失败: {e}")
+            try:
+                session_core.record_lens_outcome()
+            except Exception as e:
+                logger.warning(f"[{session_id}] ⚠️ 记录透镜统计失败: {e}")
+            try:
+                session_core.record_run_history()
+            except Exception as e:
+                logger.warning(f"[{session_id}] ⚠️ 记录运行历史失败: {e}")
+            if session_core.deferred_hires:
+                session.emit_message('status_update', {'status': '📐 正在对最佳图片做高清化...'})
+                try:
+                    final_images = session_core.finalize_hires()
+                    if final_images:
+                        session.final_image = final_images[0]['path']
+                except Exception as e:
+                    logger.warning(f"[{session_id}] ⚠️ 延迟高清化失败: {e}")
+        if predictor is not None:
+            predictor.record_run([img['score'] for img in session.images if not img.get('estimated')])
+
         # 完成
         session.emit_message('completion', {
             'best_score': session.best_score,
             'best_image': _path_to_url(session.best_image),
+            'final_image': _path_to_url(session.final_image),
             'total_iterations': session.current_iteration,
-            'total_images': len(session.images)
+            'total_images': len(session.images),
+            'budget': session.budget.snapshot() if session.budget else None
         })
         
         session.log_event('completed', f'最终分数: {session.best_score:.3f}')
@@ -695,16 +813,12 @@ def _evaluate_image(image_path, core_system=None, reference_image_path=None):
     try:
         logger.info(f"📊 调用评分器: 图片='{image_path}'" + (f" | 参考图='{reference_image_path}'" if reference_image_path else ""))
         
-        # 导入评分函数
-        from pkg.system.modules.evaluator.core import rate_image
-        
         # 获取参考图路径（从core_system或参数）
         ref_image = reference_image_path or getattr(core_system, '_session_reference_image', None)
         
-        # 调用评分器进行多模型评分
-        result = rate_image(
-            image_path=image_path,
-            target_concept=core_system.theme,
+        # 调用评分器进行多模型评分（近重复 prompt 复用已知结果）
+        result = core_system.rate_generated(
+            image_path,
             concept_weight=0.5,
             reference_image_path=ref_image
         )
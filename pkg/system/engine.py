@@ -6,30 +6,67 @@ DiffuServo V4 - 自适应扩散模型控制系统
 import time
 import os
 import requests
-import base64
 import random
 import datetime
 import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pkg.infrastructure.config import (
         FORGE_URL,
         TARGET_SCORE,
         MAX_ITERATIONS,
         FORGE_TIMEOUT,
         FORGE_HEARTBEAT_INTERVAL,
+        ITERATION_DEADLINE,
+        SESSION_BUDGET_TIER,
         CONVERGENCE_PATIENCE,
         CONVERGENCE_THRESHOLD,
         BASE_MODELS,
         MODEL_CONFIGS,
         MODEL_SWITCH_SCORE_THRESHOLD,
         MODEL_SWITCH_MIN_ITERATIONS,
+        PROMPT_POOL_ENABLED,
+        PROMPT_COMPACTOR_ENABLED,
+        PROMPT_NOVELTY_ENABLED,
+        PARAM_CONTROLLER,
+        POPULATION_SIZE,
+        POPULATION_ELITE,
+        SUBSEED_SEARCH_BATCH,
+        SUBSEED_STRENGTH,
+        IMG2IMG_REFINE_ENABLED,
+        IMG2IMG_MIN_SCORE,
+        IMG2IMG_DENOISE,
+        IMG2IMG_PATIENCE,
+        INPAINT_REPAIR_ENABLED,
+        INPAINT_MIN_CONCEPT,
+        INPAINT_DENOISE,
+        DEFERRED_HIRES,
+        DEFERRED_HIRES_TOP_K,
+        DEFERRED_UPSCALER,
+        DEFERRED_HIRES_VALIDATE,
+        PREVIEW_FUNNEL_SIZE,
+        PREVIEW_FUNNEL_KEEP,
+        PREVIEW_FUNNEL_STEP_SCALE,
 )
-from pkg.system.modules.creator import CreativeDirector
+from pkg.system.modules.creator import CreativeDirector, PromptPool
 from pkg.system.modules.evaluator import rate_image
+from pkg.system.modules.evaluator.local_scorer import rank_by_clip
 from pkg.infrastructure.health import check_forge_health
+from pkg.infrastructure.budget import SessionBudget
+from pkg.infrastructure.forge_client import ForgeError, encode_image, get_forge_client
+from pkg.infrastructure.checkpoint_manager import get_checkpoint_manager
 from pkg.infrastructure.utils import compute_gradient
 from pkg.system.builders import ControlNetBuilder
 from pkg.system.modules.reference import analyze_reference_style_with_multimodal
 from pkg.system.initializer import EngineInitializer
+from pkg.system.strategies.prompt_compactor import PromptCompactor
+from pkg.system.strategies.novelty_index import PromptNoveltyIndex, params_signature, perturb_prompt
+from pkg.system.strategies.convergence_predictor import get_convergence_predictor
+from pkg.system.strategies.bayes_optimizer import BayesianParameterOptimizer, PARAM_SPACES
+from pkg.system.strategies.lens_bandit import LensBandit, get_lens_stats_store
+from pkg.system.strategies.run_history import WARM_PARAM_KEYS, get_run_history, summarize_run
+from pkg.system.strategies.population import Individual, mutate_params, next_generation
+from pkg.system.strategies.defect_repair import FIX_HINTS, build_mask, crop_resolution, detect_local_defects, locate_regions
 
 OUTPUT_DIR = "evolution_history"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -52,25 +89,72 @@ class DiffuServoV4:
         self.reference_fusion = None
         self.user_request = theme
         
-        # 🎯 初始化参考图和模型选择
-        init_result = EngineInitializer.initialize_reference_model(
-            self.brain, theme, reference_image_path
+        # ⚡ 并发初始化：模型选择 / 项目命名 / Forge 健康检查（共享截止时间）
+        concurrent_init = EngineInitializer.initialize_concurrently(
+            self.brain, theme, reference_image_path, health_check=check_forge_health
         )
+        # 🩺 Forge 不可用时直接失败，不等待其余调用
+        if not concurrent_init["forge_ok"]:
+            raise RuntimeError(f"Forge 不可用，请检查: {FORGE_URL}")
+
+        # 🎯 参考图和模型选择
+        init_result = concurrent_init["reference"]
         self.initial_model_choice = init_result["initial_model_choice"]
         self.model_locked = init_result["model_locked"]
         self.locked_model = init_result["locked_model"]
         self.reference_style_analysis = init_result["reference_style_analysis"]
+
+        # 📚 运行历史热启动：相似主题的高分运行提供底模、Prompt 骨架、参数与 seed
+        self.run_history = get_run_history()
+        self.warm_start = None
+        self.scored_renders = []  # 本次运行每次评分的 (分数, 模式, seed, prompt, 参数, 图片)，结束后写入运行历史
+        if self.run_history is not None:
+            match = self.run_history.nearest(theme)
+            if match is not None:
+                self.warm_start, similarity = match
+                print(f"📚 [历史热启动] 相似主题「{self.warm_start.theme}」(相似度 {similarity:.2f}，"
+                      f"最佳 {self.warm_start.best_score:.2f}，用时 {self.warm_start.iterations} 次迭代)")
+                if (not self.model_locked and self.warm_start.model in MODEL_CONFIGS
+                        and self.warm_start.model != self.initial_model_choice):
+                    print(f"📚 [历史热启动] 底模 {self.initial_model_choice} → {self.warm_start.model}")
+                    self.initial_model_choice = self.warm_start.model
+        self.warm_seed_cursor = 0  # 已尝试的历史 seed 数（iteration 在 run() 与 generate() 中各自递增，不能用作下标）
+
+        # 🎰 透镜老虎机：按本会话评分选择构思透镜，用同一主题簇（推荐底模）的历史统计热启动
+        self.lens_stats = get_lens_stats_store()
+        self.lens_cluster = self.initial_model_choice
+        self.lens_bandit = None
+        if self.lens_stats is not None:
+            self.lens_bandit = LensBandit(CreativeDirector.UNIVERSAL_LENSES,
+                                          warm_start=self.lens_stats.get(self.lens_cluster))
+        self.brain.lens_bandit = self.lens_bandit
+        self.current_lens = None  # 本轮 prompt 所用透镜（评分后更新老虎机）
         
         # 🎯 参考图约束配置
         self.reference_match_min = 0.70  # 基础阈值
         self.reference_controlnet_weight = 1.0  # 基础权重
         self.keep_unchanged_intent = False
         
-        # 🏷️ 生成项目 ID
-        self.project_id = EngineInitializer.generate_project_id(self.brain, self.theme)
+        # 🏷️ 项目 ID（命名超时则使用主题 slug）
+        self.project_id = concurrent_init["project_id"]
         
         # 📋 初始化参数
         self.params = EngineInitializer.get_default_params(theme)
+
+        # 🎱 Prompt 候选池：批量构思，大部分迭代无需等待 DeepSeek
+        self.prompt_pool = PromptPool(self.brain, theme) if PROMPT_POOL_ENABLED else None
+        self.feedback_score = None  # 本轮构思所依据的上一轮分数
+
+        # ✂️ Prompt 压缩器：控制在 CLIP chunk 预算内，避免多编码一个 75-token chunk
+        self.prompt_compactor = PromptCompactor() if PROMPT_COMPACTOR_ENABLED else None
+
+        # 🔁 Prompt 新颖度索引：不为已评分过的近重复 Prompt 重复渲染
+        self.novelty_index = PromptNoveltyIndex() if PROMPT_NOVELTY_ENABLED else None
+        self.reused_result = None  # 本轮复用的已知评分结果（跳过渲染与评分）
+        # 💰 会话预算（墙钟 / GPU 秒 / 评分次数），耗尽即停止并交付当前最佳
+        self.session_budget = SessionBudget.from_tier(SESSION_BUDGET_TIER)
+        self.iteration_deadline = self.session_budget.iteration_deadline()  # 本轮迭代的时间预算（generate 开始时重置）
+        self._novelty_key = None   # 本轮 (prompt, 签名)，评分后写入索引
         
         # 🔴 状态追踪
         self.state = self.STATE_INIT
@@ -90,6 +174,46 @@ class DiffuServoV4:
         self.no_improvement_count = 0
         self.convergence_patience = 10  # 【改进】从CONVERGENCE_PATIENCE→10步，更保守
         self.convergence_threshold = CONVERGENCE_THRESHOLD
+        # 🔮 收敛预测：估计剩余预算内达标概率，过低则提前停止
+        self.convergence_predictor = get_convergence_predictor()
+        self.reach_probability = None
+        # 🧪 参数控制器：贝叶斯优化（按模型模式记录参数-评分观测）或原 P-Control
+        self.param_optimizer = BayesianParameterOptimizer() if PARAM_CONTROLLER == "bayes" else None
+        self.current_mode = None  # 本轮渲染使用的模型模式（观测按模式分组）
+        if self.param_optimizer is not None and self.warm_start is not None:
+            # 历史最佳参数作为先验观测，EXPLORE 从其附近开始搜索
+            self.param_optimizer.observe(self.warm_start.model, self.warm_start.best_params, self.warm_start.best_score)
+
+        # 🧬 EXPLORE 种群模式：每轮并发渲染/评分一代个体（POPULATION_SIZE=1 时关闭）
+        self.forge = get_forge_client()
+        self.population_size = max(1, POPULATION_SIZE)
+        self.population_elite = max(0, min(POPULATION_ELITE, self.population_size - 1))
+        self.population = []        # 上一代（已评分）
+        self.population_mode = None  # 上一代的模型模式（模式切换后参数不可比，种群重建）
+
+        # 🎯 FINETUNE 子种子邻域搜索：锁定最佳 seed，只做 subseed 小扰动（强度随有无改进自适应）
+        self.subseed_batch = SUBSEED_SEARCH_BATCH
+        self.subseed_strength = SUBSEED_STRENGTH
+
+        # 🪄 img2img 精修：最佳图只差细节时低重绘精修，连续无改进则回到 txt2img
+        self.refine_denoise = IMG2IMG_DENOISE
+        self.refine_failures = 0
+        self.last_render_mode = "txt2img"
+
+        # 🩹 局部缺陷修复：评审理由指出局部缺陷时只重绘缺陷区域（每张底图只修一次）
+        self.repaired_sources = set()
+
+        # 📐 延迟高清化：迭代期不开 HR，结束后只对前 k 张高清化（render_payloads 记录 txt2img 图片的完整参数以便重渲染）
+        self.deferred_hires = DEFERRED_HIRES if DEFERRED_HIRES in ("hires", "upscale") else None
+        self.render_payloads = {}
+        self.final_images = []
+
+        # 🔻 两级预览漏斗：目标底模少步数批量初筛 → 只完整渲染前 k 个 seed（PREVIEW_FUNNEL_SIZE<=1 时关闭）
+        self.funnel_size = max(1, PREVIEW_FUNNEL_SIZE)
+        self.funnel_keep = max(1, min(PREVIEW_FUNNEL_KEEP, self.funnel_size))
+
+        # 🗂️ 底模生命周期：评分后预加载下一轮底模，生成前只等待未完成的加载
+        self.checkpoints = get_checkpoint_manager()
         
         # 🟣 【新增】Prompt缓存与镜头锁定（用于稳定收敛）
         self.best_prompt = None  # 历史最佳prompt
@@ -118,10 +242,6 @@ class DiffuServoV4:
         self.adaptive_factor = 1.0
         self.heartbeat_interval = max(1, FORGE_HEARTBEAT_INTERVAL)
 
-        # 🩺 启动前快速健康检查
-        if not check_forge_health():
-            raise RuntimeError(f"Forge 不可用，请检查: {FORGE_URL}")
-
     def state_transition(self, current_score, concept, quality, aesthetics=None, reasonableness=None):
         """状态机：根据分数自动切换策略 + 停滞检测 (改进版)"""
         avg_grad, volatility = compute_gradient(self.score_buffer)
@@ -187,6 +307,18 @@ class DiffuServoV4:
         concept = result.get('concept_score', 0)
         quality = result.get('quality_score', 0)
         
+        # 🪄 img2img 精修反馈：无改进则降低重绘强度，连续失败后暂停精修；新的 txt2img 最佳图重新开放精修
+        if self.last_render_mode == "img2img":
+            if current_score > self.best_score:
+                self.refine_failures = 0
+            else:
+                self.refine_failures += 1
+                self.refine_denoise = max(0.15, self.refine_denoise - 0.05)
+                print("🪄 精修无改进(%d/%d)，重绘强度→%.2f" % (self.refine_failures, IMG2IMG_PATIENCE, self.refine_denoise))
+        elif current_score > self.best_score:
+            self.refine_failures = 0
+            self.refine_denoise = IMG2IMG_DENOISE
+
         # 注意：score_buffer 在 run() 方法中追加，此处不重复追加（避免梯度污染）
         avg_grad, volatility = compute_gradient(self.score_buffer)
         
@@ -210,6 +342,10 @@ class DiffuServoV4:
             print("🔄 初始化阶段，Reroll Seed")
             self.params['seed'] = random.randint(1, 9999999999)
         
+        elif self.param_optimizer is not None and self.state in (self.STATE_EXPLORE, self.STATE_OPTIMIZE):
+            # 数值参数由贝叶斯优化器在下一轮 generate 中给出，这里只换 Seed
+            self.params['seed'] = random.randint(1, 9999999999)
+
         elif self.state == self.STATE_EXPLORE:
             if quality < concept:
                 step_delta = error * self.Kp_steps * self.adaptive_factor
@@ -238,20 +374,37 @@ class DiffuServoV4:
             
             self.params['seed'] = random.randint(1, 9999999999)
         
+        elif self.state == self.STATE_FINETUNE and self.subseed_batch > 1:
+            # 有改进：在更小的邻域内细化；无改进：扩大扰动范围
+            if current_score > self.best_score:
+                self.subseed_strength = max(0.05, self.subseed_strength * 0.7)
+            else:
+                self.subseed_strength = min(0.5, self.subseed_strength * 1.3)
+            print("🎯 [FINETUNE] 锁定最佳Seed，子种子强度→%.2f" % self.subseed_strength)
+
         elif self.state == self.STATE_FINETUNE:
             print("🎯 [FINETUNE] 锁定参数，Reroll Seed")
             self.params['seed'] = random.randint(1, 9999999999)
     
-    def check_convergence(self, current_score):
-        """收敛检测"""
+    def check_convergence(self, current_score, rendered_params=None):
+        """收敛检测（rendered_params: 本轮图片实际使用的参数，默认取当前 params）"""
         if current_score > self.best_score:
             self.best_score = current_score
-            self.best_params = self.params.copy()
+            self.best_params = dict(rendered_params) if rendered_params is not None else self.params.copy()
             self.no_improvement_count = 0
             print(f"🏆 新纪录: {current_score:.2f}")
             return False
         
         self.no_improvement_count += 1
+
+        # 🔮 轨迹预测：剩余预算内几乎不可能达标时不必等到固定规则触发
+        if self.convergence_predictor is not None:
+            remaining = self.remaining_iterations()
+            scores = [h['score'] for h in self.history]
+            stop, self.reach_probability = self.convergence_predictor.should_stop(scores, self.target_score, remaining)
+            if stop:
+                print(f"\n🔮 收敛预测：剩余 {remaining} 次迭代内达到 {self.target_score} 的概率仅 {self.reach_probability:.1%}，提前停止")
+                return True
         
         # 【改进】延迟收敛检测，至少运行15步后才判断真正收敛
         if self.iteration < 15:
@@ -270,7 +423,17 @@ class DiffuServoV4:
         
         return False
     
-    def generate(self, prev_score=None, prev_feedback=None, best_dimensions=None, external_suggestion=None, reference_image_path=None):
+    def remaining_iterations(self):
+        """剩余可用迭代次数（迭代上限与会话预算中较紧者）"""
+        remaining = self.max_iterations - self.iteration
+        affordable = self.session_budget.affordable_iterations(self.iteration)
+        return remaining if affordable is None else min(remaining, affordable)
+
+    def new_iteration_deadline(self):
+        """单次迭代的时间预算（ITERATION_DEADLINE <= 0 时不限时；不超过会话剩余墙钟时间）"""
+        return self.session_budget.iteration_deadline(ITERATION_DEADLINE if ITERATION_DEADLINE > 0 else None)
+
+    def generate(self, prev_score=None, prev_feedback=None, best_dimensions=None, external_suggestion=None, reference_image_path=None, deadline=None):
         """生成图片 (单模型版 + 评分反馈循环 + Prompt缓存)
         Args:
             prev_score: 前一次迭代的得分(用于反馈)
@@ -278,9 +441,14 @@ class DiffuServoV4:
             best_dimensions: 历史最佳维度分数(用于反馈)
             external_suggestion: [新增] 外部传入的创意建议或用户反馈
             reference_image_path: [新增] 参考图片路径（用于Prompt融合）
+            deadline: 本轮迭代的 Deadline 预算（默认 ITERATION_DEADLINE），同时约束随后的 rate_generated
         """
         # [关键修复] 增加内部迭代计数，确保模型切换逻辑生效
         self.iteration += 1
+        self.reused_result = None
+        # ⏱️ 迭代预算：各阶段按剩余时间确定超时/重试，不足时降级
+        deadline = deadline if deadline is not None else self.new_iteration_deadline()
+        self.iteration_deadline = deadline
         
         # 🎯 检测external_suggestion中的"保持不变"意图
         if external_suggestion and reference_image_path:
@@ -295,7 +463,9 @@ class DiffuServoV4:
         # 🎯 [核心改进] 如果收到重大用户建议，尝试重新分析模型意图
         if external_suggestion and len(external_suggestion) > 10:
             print(f"🔄 [动态分析] 收到重大反馈，尝试重新评估模型建议...")
-            re_rec = self.brain.analyze_theme_and_recommend_model(f"{self.theme} (Feedback: {external_suggestion})")
+            re_rec = self.brain.analyze_theme_and_recommend_model(
+                f"{self.theme} (Feedback: {external_suggestion})", deadline=deadline.sub(fraction=0.1)
+            )
             new_model = re_rec.get("model", "PREVIEW")
             if self.model_locked:
                 print(f"🔒 [模型锁定] 已锁定为 {self.locked_model}，忽略反馈切换到 {new_model}")
@@ -305,6 +475,7 @@ class DiffuServoV4:
 
         # 🎯 【改进】反馈机制优化：既要改进弱项，也要保持强项
         feedback_context = ""
+        self.feedback_score = prev_score
         
         # 优先使用外部建议
         if external_suggestion:
@@ -324,13 +495,18 @@ class DiffuServoV4:
         # [新增] 处理外部创意建议或用户实时反馈
         if external_suggestion:
             feedback_context = f"{feedback_context}\nExternal Insight/User Request: {external_suggestion}"
+
+        # 📚 本会话尚未超过相似主题的历史最佳时，把当时的最佳 Prompt 作为骨架参考
+        if self.warm_start is not None and self.best_score < self.warm_start.best_score:
+            feedback_context += (f"\nProven prompt for a similar concept (scored {self.warm_start.best_score:.2f}), "
+                                 f"reuse its structure and keywords where they fit: {self.warm_start.best_prompt}")
         
         # 🎨 [新增] 多模态参考图风格分析（替代硬编码检测）
         style_context = ""
         if reference_image_path and self.reference_style_analysis is None:
             try:
                 print("🔄 [多模态分析] 分析参考图像风格...")
-                analysis = analyze_reference_style_with_multimodal(reference_image_path)
+                analysis = analyze_reference_style_with_multimodal(reference_image_path, deadline=deadline.sub(fraction=0.2))
                 self.reference_style_analysis = analysis
                 
                 style_category = analysis.get("style_category", "unknown")
@@ -356,23 +532,41 @@ class DiffuServoV4:
                 print(f"⚠️ [多模态分析异常] {e}，继续使用默认选择")
         
         # 【关键改进】OPTIMIZE阶段禁用随机镜头，使用最佳方向
-        if self.state == "OPTIMIZE" and self.locked_lens == "BEST_ACHIEVED":
-            core_prompt = self.brain.brainstorm_prompt(self.theme, feedback_context=feedback_context + style_context, use_random=False)
+        use_random = not (self.state == "OPTIMIZE" and self.locked_lens == "BEST_ACHIEVED")
+        if self.prompt_pool is not None:
+            # 新的参考图分析或用户反馈属于实质性变化，旧候选作废
+            if style_context:
+                self.prompt_pool.invalidate()
+            core_prompt = self.prompt_pool.next_prompt(
+                feedback_context + style_context,
+                use_random=use_random,
+                invalidation_key=external_suggestion or "",
+                deadline=deadline.sub(fraction=0.25),
+                score=prev_score,
+            )
         else:
-            core_prompt = self.brain.brainstorm_prompt(self.theme, feedback_context=feedback_context + style_context, use_random=True)                                   
+            core_prompt = self.brain.brainstorm_prompt(
+                self.theme, feedback_context=feedback_context + style_context, use_random=use_random,
+                deadline=deadline.sub(fraction=0.25),
+            )
+        
+        self.current_lens = self.prompt_pool.last_lens if self.prompt_pool is not None else self.brain.last_lens
         
         # 【改进】Prompt缓存：如果生成失败或停滞，回退到历史最佳
         if self.stagnation_count > 0 and self.best_prompt is not None:
             print(f"🔄 检测到停滞，使用历史最佳prompt（分数：{self.best_prompt_score:.2f}）")
             core_prompt = self.best_prompt
+            self.current_lens = None  # 非本轮透镜的产出，不计入老虎机
         else:
             # 【记录】每次都保存prompt用于后续回退
             if prev_score and prev_score > self.best_prompt_score:
                 self.best_prompt = core_prompt
                 self.best_prompt_score = prev_score if prev_score else 0.0
 
-        # 🖼️ [新增] 参考图Prompt融合（可选）
-        if reference_image_path:
+        # 🖼️ [新增] 参考图Prompt融合（可选；前序阶段已耗去一半以上预算时跳过，为生成与评分留时间）
+        if reference_image_path and not deadline.unlimited and not deadline.allows(deadline.seconds * 0.5):
+            print(f"⏱️ 迭代预算剩余 {deadline.remaining():.0f}s，跳过参考图融合")
+        elif reference_image_path:
             try:
                 if self.reference_fusion is None:
                     from pkg.system.modules.reference import ReferencePromptFusion
@@ -386,6 +580,11 @@ class DiffuServoV4:
         
         if self.params['seed'] == -1 or self.iteration > 1:
             self.params['seed'] = random.randint(1, 9999999999)
+        # 📚 初始阶段依次尝试历史运行中得分最高的 seed
+        if (self.warm_start is not None and self.state == self.STATE_INIT
+                and self.warm_seed_cursor < len(self.warm_start.top_seeds)):
+            self.params['seed'] = self.warm_start.top_seeds[self.warm_seed_cursor]
+            self.warm_seed_cursor += 1
         
         # 🎯 [改进] 智能模型选择：初始使用DeepSeek推荐，持续使用相同风格
         if self.iteration == 1:
@@ -409,7 +608,7 @@ class DiffuServoV4:
             quality_suffix = ", masterpiece, best quality, highly detailed, vibrant colors, official art"
         else:
             quality_suffix = ", 8k resolution, masterpiece, photorealistic, sharp focus, highly detailed, cinematic lighting"
-        self.params['prompt'] = f"{core_prompt}, {quality_suffix}"
+        self.params['prompt'] = self._compose_prompt(core_prompt, quality_suffix)
         
         # 应用模型配置
         current_config = MODEL_CONFIGS[target_mode]
@@ -420,12 +619,40 @@ class DiffuServoV4:
             self.params['hr_scale'] = current_config.get('hr_scale', 2.0)
             self.params['hr_second_pass_steps'] = current_config.get('hr_second_pass_steps', 3)
             self.params['denoising_strength'] = current_config.get('denoising_strength', 0.35)
+        self.current_mode = target_mode
+        if self.deferred_hires and self.params['enable_hr']:
+            # HR 参数保留在 params 中，结束时的高清化沿用
+            self.params['enable_hr'] = False
+
+        # 📚 初始阶段直接采用历史最佳参数（同一底模时）
+        if (self.warm_start is not None and self.state == self.STATE_INIT
+                and target_mode == self.warm_start.model and self.warm_start.best_params):
+            warm_params = {k: v for k, v in self.warm_start.best_params.items()
+                           if self.params.get('enable_hr') or k in ('steps', 'cfg_scale')}
+            self.params.update(warm_params)
+            print(f"📚 [历史热启动] 参数: {', '.join(f'{k}={v}' for k, v in warm_params.items())}")
+
+        # 🧪 贝叶斯调参：EXPLORE/OPTIMIZE 取期望改进最大的参数，FINETUNE 锁定该模式下的最佳参数
+        if self.param_optimizer is not None:
+            if self.state in (self.STATE_EXPLORE, self.STATE_OPTIMIZE):
+                tuned = self.param_optimizer.propose(target_mode, self.params)
+            elif self.state == self.STATE_FINETUNE:
+                tuned = self.param_optimizer.best_params(target_mode)
+            else:
+                tuned = None
+            if tuned:
+                if not self.params.get('enable_hr'):
+                    tuned = {k: v for k, v in tuned.items() if not k.startswith('hr_') and k != 'denoising_strength'}
+                self.params.update(tuned)
+                print(f"🧪 [贝叶斯调参] {', '.join(f'{k}={v}' for k, v in tuned.items())}")
         
         # 设置模型文件
         target_model_file = BASE_MODELS[target_mode]
         self.params['override_settings'] = {
             "sd_model_checkpoint": target_model_file
         }
+        # 底模留在后端（不在请求结束后恢复为全局设置），下一轮同底模时无需重新加载
+        self.params['override_settings_restore_afterwards'] = False
         
         # 🎨 [新增] ControlNet约束（如果有参考图）
         if reference_image_path:
@@ -446,66 +673,532 @@ class DiffuServoV4:
                 print(f"🎨 ControlNet 已激活: type=canny, weight=0.8, ref={reference_image_path}")
             except Exception as e:
                 print(f"⚠️ ControlNet 激活失败: {e}，将继续使用纯文本约束")
+
+        # 子种子只在本轮邻域搜索的结果上保留，其余渲染不带
+        self.params.pop('subseed', None)
+        self.params.pop('subseed_strength', None)
+        
+        # 🩹 局部缺陷修复：最佳图主体正确但有局部缺陷时，只重绘缺陷区域（优先于整图精修）
+        best_checkpoint = (self.best_params.get('override_settings') or {}).get('sd_model_checkpoint')
+        repair = self._repair_source() if best_checkpoint == target_model_file else None
+        if repair is not None:
+            return self._repair_image(*repair, deadline)
+
+        # 🪄 img2img 精修：最佳图已接近目标、只差细节时，基于它低重绘而不是从零生成
+        refine_source = self._refine_source() if best_checkpoint == target_model_file else None
+        if refine_source is not None:
+            return self._refine_image(refine_source, deadline)
+        self.last_render_mode = "txt2img"
+
+        # 🎯 子种子邻域搜索：FINETUNE 阶段围绕最佳图片的 seed 做小扰动
+        if (self.state == self.STATE_FINETUNE and self.subseed_batch > 1
+                and self.best_params.get('seed', -1) != -1 and best_checkpoint == target_model_file):
+            return self._subseed_search(deadline)
         
+        # 🧬 种群模式：EXPLORE 阶段并发探索一代个体，最优个体作为本轮结果
+        if self.population_size > 1 and self.state == self.STATE_EXPLORE:
+            return self._explore_population(core_prompt, quality_suffix, target_mode,
+                                            feedback_context + style_context, external_suggestion or "", deadline)
+
+        # 🔁 新颖度检查：同底模同参数下与已评分 prompt 近重复时
+        #    - 已知结果接近最佳：值得在其附近探索 → 有意扰动 prompt 与 seed
+        #    - 已知结果一般：重复渲染没有信息增量 → 直接复用已知结果
+        # （FINETUNE 阶段本就锁定 prompt 只换 Seed，不做检查）
+        signature = params_signature(self.params)
+        if self.novelty_index is not None and self.state != self.STATE_FINETUNE:
+            duplicate = self.novelty_index.find_duplicate(self.params['prompt'], signature)
+            if duplicate is not None:
+                entry, similarity = duplicate
+                # 已知结果的图片可能已被清理：无法复用，按扰动处理
+                if entry.score >= self.best_score - 0.05 or not os.path.exists(entry.image_path):
+                    print(f"🔁 [新颖度] 与已评分 prompt 近重复（相似度 {similarity:.3f}，分数 {entry.score:.2f}），扰动 prompt 与 seed")
+                    self.params['prompt'] = perturb_prompt(self.params['prompt'])
+                    self.params['seed'] = random.randint(1, 9999999999)
+                else:
+                    print(f"♻️ [新颖度] 与已评分 prompt 近重复（相似度 {similarity:.3f}），复用已知结果 {entry.score:.2f}，跳过渲染")
+                    self.reused_result = entry.result
+                    self._novelty_key = None
+                    return entry.image_path
+        self._novelty_key = (self.params['prompt'], signature)
+
+        # 🔻 两级漏斗：RENDER/ANIME 阶段先低分辨率批量初筛，只完整渲染最有希望的候选（FINETUNE 锁定 seed，不走漏斗）
+        if self.funnel_size > 1 and target_mode != "PREVIEW" and self.state != self.STATE_FINETUNE:
+            return self._preview_funnel(target_mode, deadline)
+
         # 📊 状态日志
         hr_status = "[HR ON]" if self.params.get('enable_hr') else "[HR OFF]"
         state_tag = f"[{self.state}]"
         print(f"\n⚡ [Iter {self.iteration}] {state_tag} [{target_mode}] {hr_status} Steps={self.params['steps']}, CFG={self.params['cfg_scale']:.2f}")
         print(f"📦 模型: {target_model_file}")
-        print(f"⏳ 正在生成图片... (超时限制: {FORGE_TIMEOUT}秒)")
+        if not deadline.allows():
+            print("⏱️ 迭代预算已耗尽，跳过本轮生成")
+            return None
+        self._use_checkpoint(target_model_file, deadline)
+        # 超时由 Forge 客户端在选定后端后按延迟模型 + 排队 ETA 设定，这里只以迭代剩余时间封顶
+        eta = self.forge.eta(self.params)
+        print(f"⏳ 正在生成图片...{f' (预计 {eta:.0f}秒)' if eta is not None else ''}")
         
+        forge_start = time.time()
         try:
-            resp = requests.post(f"{FORGE_URL}/sdapi/v1/txt2img", json=self.params, timeout=FORGE_TIMEOUT)
-            if resp.status_code != 200:
-                print(f"❌ Forge HTTP {resp.status_code}")
-                return None
-
-            data = resp.json()
-            images = data.get('images') or []
-            if not images:
-                print("⚠️ Forge 返回空 images，疑似故障")
-                return None
-
-            img_data = base64.b64decode(images[0])
-            if len(img_data) < 1000:
-                print(f"⚠️ Forge 返回的图片过小 ({len(img_data)} bytes)，疑似异常")
-                return None
-
-            # 🛠️ 存储路径：ProjectName_Time/ProjectName_Time_iterX.png
-            theme_dir = os.path.join(OUTPUT_DIR, self.project_id)
-            os.makedirs(theme_dir, exist_ok=True)
-
-            filename = f"{self.project_id}_iter{self.iteration}.png"
-            path = os.path.join(theme_dir, filename)
-            
-            with open(path, "wb") as f:
-                f.write(img_data)
+            result = self.forge.txt2img(self.params, timeout_cap=deadline.remaining())
+            return self._save_image(result.images[0], f"{self.project_id}_iter{self.iteration}.png", self.params)
+        except ForgeError as e:
+            print(f"❌ {e}")
+        except requests.Timeout:
+            print("⏱️ Forge 请求超时，可能已卡死")
+        except Exception as e:
+            print(f"❌ API Error: {e}")
+        finally:
+            # 💰 以 Forge 请求耗时计 GPU 秒（失败/超时同样占用了 GPU）
+            self.session_budget.charge_gpu(time.time() - forge_start)
+        return None
 
-            # 📦 仅保留最近 20 张图片，删除更早的
-            try:
-                images = [
-                    os.path.join(theme_dir, p)
-                    for p in os.listdir(theme_dir)
-                    if p.lower().endswith(".png")
-                ]
-                images.sort(key=lambda p: os.path.getmtime(p))
-                while len(images) > 20:
-                    old_path = images.pop(0)
-                    try:
-                        os.remove(old_path)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-
-            return path
+    def _refine_source(self):
+        """
+        txt2img → img2img 切换策略：OPTIMIZE/FINETUNE 阶段、最佳图总分与内容分均达到 IMG2IMG_MIN_SCORE
+        （主体/构图已正确，只差画质细节）、且最近精修未连续 IMG2IMG_PATIENCE 次无改进
+        
+        Returns:
+            dict | None: 作为精修底图的历史记录
+        """
+        if not IMG2IMG_REFINE_ENABLED or self.state not in (self.STATE_OPTIMIZE, self.STATE_FINETUNE):
+            return None
+        if self.refine_failures >= IMG2IMG_PATIENCE:
+            return None
+        scored = [h for h in self.history if h.get('image_path')]
+        if not scored:
+            return None
+        best = max(scored, key=lambda h: h['score'])
+        if best['score'] < IMG2IMG_MIN_SCORE or best['concept'] < IMG2IMG_MIN_SCORE:
+            return None
+        return best if os.path.exists(best['image_path']) else None
+
+    def _refine_image(self, source, deadline):
+        """基于最佳图的低重绘 img2img 精修（有效步数 ≈ steps × 重绘强度）"""
+        from PIL import Image
+
+        # 本轮沿用最佳图的 prompt/参数（不使用本轮新构思的 prompt）
+        self.params.update({k: self.best_params[k] for k in ('prompt', 'seed', *WARM_PARAM_KEYS) if k in self.best_params})
+        with Image.open(source['image_path']) as img:
+            width, height = img.size
+        payload = {k: self.params[k] for k in ('prompt', 'negative_prompt', 'steps', 'cfg_scale', 'sampler_name',
+                                               'scheduler', 'override_settings', 'override_settings_restore_afterwards',
+                                               'alwayson_scripts') if k in self.params}
+        payload.update(init_images=[encode_image(source['image_path'])], denoising_strength=round(self.refine_denoise, 2),
+                       width=width, height=height, seed=random.randint(1, 9999999999))
+
+        print(f"\n🪄 [Iter {self.iteration}] [{self.state} img2img 精修] 底图 iter{source['iter']} ({source['score']:.2f})，"
+              f"重绘强度 {payload['denoising_strength']:.2f}，有效步数≈{int(payload['steps'] * payload['denoising_strength'])}")
+        self.last_render_mode = "img2img"
+        self.current_lens = None  # 沿用最佳图的 prompt，非本轮透镜的产出
+        if not deadline.allows():
+            print("⏱️ 迭代预算已耗尽，跳过本轮生成")
+            return None
+        self._use_checkpoint(payload['override_settings']['sd_model_checkpoint'], deadline)
+
+        forge_start = time.time()
+        try:
+            result = self.forge.img2img(payload, timeout_cap=deadline.remaining())
+            self._novelty_key = None
+            return self._save_image(result.images[0], f"{self.project_id}_iter{self.iteration}_refine.png")
+        except ForgeError as e:
+            print(f"❌ {e}")
         except requests.Timeout:
             print("⏱️ Forge 请求超时，可能已卡死")
         except Exception as e:
             print(f"❌ API Error: {e}")
+        finally:
+            self.session_budget.charge_gpu(time.time() - forge_start)
         return None
+
+    def _repair_source(self):
+        """
+        局部修复策略：EXPLORE 之后、最佳图内容分达到 INPAINT_MIN_CONCEPT（主体/构图已正确）、
+        评审理由指出可局部修复的缺陷、且该图尚未修复过
+        
+        Returns:
+            (dict, list[str], list[tuple]) | None: (底图历史记录, 缺陷类别, 重绘区域 (x, y, w, h))
+        """
+        if not INPAINT_REPAIR_ENABLED or self.state == self.STATE_INIT:
+            return None
+        scored = [h for h in self.history if h.get('image_path')]
+        if not scored:
+            return None
+        best = max(scored, key=lambda h: h['score'])
+        if best['concept'] < INPAINT_MIN_CONCEPT or best['image_path'] in self.repaired_sources:
+            return None
+        categories = detect_local_defects(best.get('reason', ''))
+        if not categories or not os.path.exists(best['image_path']):
+            return None
+        self.repaired_sources.add(best['image_path'])
+        try:
+            boxes = locate_regions(best['image_path'], categories)
+        except Exception as e:
+            print(f"⚠️ 缺陷定位失败，本轮改为常规生成: {e}")
+            return None
+        return best, categories, boxes
+
+    def _repair_image(self, source, categories, boxes, deadline):
+        """对缺陷区域做蒙版重绘（仅重绘蒙版区域，按裁剪区域分辨率渲染）"""
+        from PIL import Image
+
+        # 本轮沿用最佳图的 prompt/参数，修复提示只加在本次请求上
+        self.params.update({k: self.best_params[k] for k in ('prompt', 'seed', *WARM_PARAM_KEYS) if k in self.best_params})
+        with Image.open(source['image_path']) as img:
+            size = img.size
+        width, height = crop_resolution(boxes, size)
+        # 底模驻留与 ControlNet 约束与 txt2img 保持一致
+        payload = {k: self.params[k] for k in ('prompt', 'negative_prompt', 'steps', 'cfg_scale', 'sampler_name',
+                                               'scheduler', 'override_settings', 'override_settings_restore_afterwards',
+                                               'alwayson_scripts') if k in self.params}
+        positive = ", ".join(FIX_HINTS[c][0] for c in categories)
+        negative = ", ".join(FIX_HINTS[c][1] for c in categories)
+        payload.update(
+            prompt=f"{payload.get('prompt', '')}, {positive}",
+            negative_prompt=f"{payload.get('negative_prompt', '')}, {negative}".strip(", "),
+            init_images=[encode_image(source['image_path'])],
+            mask=build_mask(size, boxes),
+            mask_blur=8, inpainting_fill=1, inpaint_full_res=True, inpaint_full_res_padding=32,
+            denoising_strength=INPAINT_DENOISE, width=width, height=height,
+            seed=random.randint(1, 9999999999),
+        )
+
+        print(f"\n🩹 [Iter {self.iteration}] [{self.state} 局部修复] 底图 iter{source['iter']} ({source['score']:.2f})，"
+              f"缺陷: {'/'.join(categories)}，区域 {len(boxes)} 处，重绘分辨率 {width}x{height}")
+        self.last_render_mode = "inpaint"
+        self.current_lens = None  # 沿用最佳图的 prompt，非本轮透镜的产出
+        if not deadline.allows():
+            print("⏱️ 迭代预算已耗尽，跳过本轮生成")
+            return None
+        self._use_checkpoint(payload['override_settings']['sd_model_checkpoint'], deadline)
+
+        forge_start = time.time()
+        try:
+            result = self.forge.img2img(payload, timeout_cap=deadline.remaining())
+            self._novelty_key = None
+            return self._save_image(result.images[0], f"{self.project_id}_iter{self.iteration}_repair.png")
+        except ForgeError as e:
+            print(f"❌ {e}")
+        except requests.Timeout:
+            print("⏱️ Forge 请求超时，可能已卡死")
+        except Exception as e:
+            print(f"❌ API Error: {e}")
+        finally:
+            self.session_budget.charge_gpu(time.time() - forge_start)
+        return None
+
+    def _subseed_search(self, deadline):
+        """
+        子种子邻域搜索：最佳图片的 prompt/参数/seed 不变，单次批量请求渲染多个 subseed 变体
+        （subseed_strength > 0 时 Forge 批内 seed 保持不变、subseed 递增），CLIP 初筛后只返回最佳一张
+        
+        Returns:
+            str | None: 选中变体的图片路径（随后按常规流程送评审）
+        """
+        count = self.subseed_batch
+        payload = dict(self.params, **{k: self.best_params[k] for k in ('prompt', 'seed', *WARM_PARAM_KEYS)
+                                       if k in self.best_params})
+        payload.update(subseed=random.randint(1, 9999999999), subseed_strength=round(self.subseed_strength, 3),
+                       batch_size=count)
+        self.current_lens = None  # 沿用最佳图的 prompt，非本轮透镜的产出
+
+        print(f"\n🎯 [Iter {self.iteration}] [FINETUNE 子种子] seed={payload['seed']} "
+              f"强度={payload['subseed_strength']:.2f} 变体 {count} 个")
+        if not deadline.allows():
+            print("⏱️ 迭代预算已耗尽，跳过本轮生成")
+            return None
+        self._use_checkpoint(payload['override_settings']['sd_model_checkpoint'], deadline)
+
+        forge_start = time.time()
+        try:
+            result = self.forge.txt2img(payload, timeout_cap=deadline.remaining())
+        except ForgeError as e:
+            print(f"❌ {e}")
+            return None
+        except requests.Timeout:
+            print("⏱️ Forge 请求超时，可能已卡死")
+            return None
+        except Exception as e:
+            print(f"❌ API Error: {e}")
+            return None
+        finally:
+            self.session_budget.charge_gpu(time.time() - forge_start)
+
+        # 批量时 Forge 可能在最前面附带一张拼图
+        images = result.images[-count:]
+        paths = [self._save_image(img, f"{self.project_id}_iter{self.iteration}_v{k + 1}.png")
+                 for k, img in enumerate(images)]
+        order = rank_by_clip(paths, self.theme) if len(paths) > 1 else None
+        pick = order[0] if order else 0
+
+        # 记录选中变体的完整参数（subseed 在批内按下标递增）
+        payload.pop('batch_size')
+        self.params.update(payload, subseed=payload['subseed'] + pick)
+        self.render_payloads[paths[pick]] = dict(self.params)
+        self._novelty_key = None
+        return paths[pick]
+
+    def _preview_funnel(self, mode, deadline):
+        """
+        两级漏斗：目标底模以目标尺寸、PREVIEW_FUNNEL_STEP_SCALE 步数一次批量渲染 N 个 seed 的候选，
+        CLIP 本地排序后只把前 k 个 seed 以完整参数 txt2img 重渲染（同尺寸同 seed 的初始噪声一致，构图在前几步即已确定），
+        k > 1 时再用 CLIP 选出一张送评审。最终图的参数与常规渲染无异（只换 seed），best_params 可直接复现；
+        全程使用同一底模，不引入底模切换；初筛失败时退化为单张常规渲染
+        
+        Returns:
+            str | None: 送评审的图片路径
+        """
+        count, keep = self.funnel_size, self.funnel_keep
+        base_seed = random.randint(1, 9999999999)
+        # 初筛与最终图同尺寸：缩小尺寸时噪声无法等比对应，重渲染得到的是另一种构图
+        screen = {k: self.params[k] for k in ('prompt', 'negative_prompt', 'cfg_scale', 'sampler_name', 'scheduler',
+                                              'width', 'height', 'override_settings',
+                                              'override_settings_restore_afterwards', 'alwayson_scripts')
+                  if k in self.params}
+        screen.update(steps=max(1, round(self.params['steps'] * PREVIEW_FUNNEL_STEP_SCALE)), enable_hr=False,
+                      seed=base_seed, batch_size=count)
+
+        print(f"\n🔻 [Iter {self.iteration}] [{self.state} 预览漏斗] [{mode}] 初筛 {count} 张 "
+              f"{screen['width']}x{screen['height']} / {screen['steps']} 步，重渲染前 {keep} 张")
+        if not deadline.allows():
+            print("⏱️ 迭代预算已耗尽，跳过本轮生成")
+            return None
+        self._use_checkpoint(self.params['override_settings']['sd_model_checkpoint'], deadline)
+
+        order = None
+        forge_start = time.time()
+        try:
+            result = self.forge.txt2img(screen, timeout_cap=deadline.remaining())
+            # 初筛图只用于排序，放在临时目录（不占用输出目录的保留名额）；批量时 Forge 可能在最前面附带一张拼图，批内 seed 按下标递增
+            with tempfile.TemporaryDirectory(prefix="funnel_") as preview_dir:
+                previews = []
+                for k, img in enumerate(result.images[-count:]):
+                    previews.append(os.path.join(preview_dir, f"s{k + 1}.png"))
+                    with open(previews[-1], "wb") as f:
+                        f.write(img)
+                order = (rank_by_clip(previews, self.theme) if len(previews) > 1 else None) or list(range(len(previews)))
+        except Exception as e:
+            print(f"❌ 预览初筛失败，改为单张常规渲染: {e}")
+        finally:
+            self.session_budget.charge_gpu(time.time() - forge_start)
+        if not order:
+            order, keep = [0], 1
+
+        finals = []
+        for index in order[:keep]:
+            if not deadline.allows():
+                break
+            payload = dict(self.params, seed=base_seed + index)
+            forge_start = time.time()
+            try:
+                rendered = self.forge.txt2img(payload, timeout_cap=deadline.remaining())
+                finals.append((payload, self._save_image(
+                    rendered.images[0], f"{self.project_id}_iter{self.iteration}_f{len(finals) + 1}.png", payload)))
+            except Exception as e:
+                print(f"❌ 候选 {index + 1} 重渲染失败: {e}")
+            finally:
+                self.session_budget.charge_gpu(time.time() - forge_start)
+        if not finals:
+            return None
+
+        pick = (rank_by_clip([path for _, path in finals], self.theme) or [0])[0] if len(finals) > 1 else 0
+        self.params['seed'] = finals[pick][0]['seed']
+        return finals[pick][1]
+
+    def _use_checkpoint(self, checkpoint, deadline):
+        """生成前确保后端已加载该底模（等待进行中的预加载；未预加载的后端就地切换，耗时计入 GPU）"""
+        if self.checkpoints is None:
+            return
+        start = time.time()
+        self.checkpoints.ensure(checkpoint, timeout=deadline.timeout(FORGE_TIMEOUT))
+        self.session_budget.charge_gpu(time.time() - start)
+
+    def predict_next_checkpoint(self, score):
+        """
+        下一轮生成使用的底模（与 generate 的底模选择规则一致）
+
+        Args:
+            score: 本轮评分（尚未计入 best_score 时也纳入判断）
+        """
+        mode = self.initial_model_choice
+        if (mode == "PREVIEW" and max(self.best_score, score) >= MODEL_SWITCH_SCORE_THRESHOLD
+                and self.iteration + 1 >= MODEL_SWITCH_MIN_ITERATIONS):
+            mode = "RENDER"
+        return BASE_MODELS[mode]
+
+    def prefetch_next_checkpoint(self, score):
+        """评分后在后台预加载下一轮的底模（与下一轮的构思阶段重叠，不占生成的关键路径）"""
+        if self.checkpoints is not None:
+            self.checkpoints.prefetch(self.predict_next_checkpoint(score))
+
+    def _compose_prompt(self, core_prompt, quality_suffix):
+        """核心 prompt + 质量后缀（启用压缩器时按 CLIP chunk 预算裁剪）"""
+        if self.prompt_compactor is None:
+            return f"{core_prompt.rstrip(', ')}{quality_suffix}"
+        compacted = self.prompt_compactor.compact(core_prompt, suffix=quality_suffix, subject=self.theme)
+        estimate_mark = "" if compacted.exact else "≈"
+        print(f"✂️ [Prompt压缩] tokens {estimate_mark}{compacted.tokens_before}→{estimate_mark}{compacted.tokens_after} "
+              f"(chunks {compacted.chunks_before}→{compacted.chunks_after}，移除 {len(compacted.dropped)} 个短语)")
+        return compacted.prompt
+
+    def _protected_images(self):
+        """仍会被复用的图片（种群个体、历史最佳），清理旧图时保留"""
+        protected = {ind.image_path for ind in self.population if ind.image_path}
+        scored = [h for h in self.history if h.get('image_path')]
+        if scored:
+            protected.add(max(scored, key=lambda h: h['score'])['image_path'])
+        return {os.path.abspath(p) for p in protected}
+
+    def _save_image(self, img_data, filename, payload=None):
+        """保存到 ProjectName_Time/ 目录，仅保留最近 20 张（种群个体与历史最佳不计入清理）；payload 为生成该图的 txt2img 参数"""
+        theme_dir = os.path.join(OUTPUT_DIR, self.project_id)
+        os.makedirs(theme_dir, exist_ok=True)
+        path = os.path.join(theme_dir, filename)
+        with open(path, "wb") as f:
+            f.write(img_data)
+        if payload is not None:
+            self.render_payloads[path] = dict(payload)
+
+        # 📦 仅保留最近 20 张图片，删除更早的
+        try:
+            images = [
+                os.path.join(theme_dir, p)
+                for p in os.listdir(theme_dir)
+                if p.lower().endswith(".png")
+            ]
+            protected = self._protected_images() | {os.path.abspath(path)}
+            removable = sorted((p for p in images if os.path.abspath(p) not in protected), key=os.path.getmtime)
+            excess = len(images) - 20
+            while excess > 0 and removable:
+                excess -= 1
+                old_path = removable.pop(0)
+                try:
+                    os.remove(old_path)
+                except Exception:
+                    pass
+        except Exception:
+            pass
+        return path
+
+    def _fresh_individuals(self, count, mode, feedback_context, pool_key, deadline):
+        """新构思 count 个个体（Prompt 池 / 批量构思 + 参数变异）"""
+        base = {name: self.params[name] for name, *_ in PARAM_SPACES.get(mode, []) if name in self.params}
+        prompts = []
+        if self.prompt_pool is not None:
+            for _ in range(count):
+                prompt = self.prompt_pool.next_prompt(feedback_context, use_random=True, invalidation_key=pool_key,
+                                                      deadline=deadline.sub(fraction=0.1), score=self.feedback_score)
+                prompts.append((self.prompt_pool.last_lens, prompt))
+        elif count > 0:
+            prompts = self.brain.brainstorm_batch(self.theme, feedback_context=feedback_context, count=count,
+                                                  deadline=deadline.sub(fraction=0.25))
+        return [Individual(core_prompt=prompt, params=mutate_params(base, mode), seed=random.randint(1, 9999999999),
+                           lens=lens) for lens, prompt in prompts]
+
+    def _explore_population(self, core_prompt, quality_suffix, mode, feedback_context, pool_key, deadline):
+        """
+        EXPLORE 种群模式：渲染与评分并发（按完成顺序边渲染边评分），精英保留 + 交叉变异
+        
+        Returns:
+            str | None: 最优个体的图片路径（其评分经 reused_result 交给 rate_generated，不重复评分）
+        """
+        if mode != self.population_mode:
+            self.population, self.population_mode = [], mode
+        base_params = {name: self.params[name] for name, *_ in PARAM_SPACES.get(mode, []) if name in self.params}
+        immigrants = [Individual(core_prompt=core_prompt, params=base_params, seed=self.params['seed'],
+                                 lens=self.current_lens)]
+        if not self.population:
+            immigrants += self._fresh_individuals(self.population_size - 1, mode, feedback_context, pool_key, deadline)
+        generation = next_generation(self.population, self.population_size, self.population_elite, mode,
+                                     immigrants=immigrants)
+        pending = [ind for ind in generation if ind.score is None]
+        # 💰 每个新个体各需一次评审：只渲染剩余评审次数评得完的个体（其余本代不参与）
+        judge_left = self.session_budget.judge_remaining()
+        if judge_left is not None and len(pending) > judge_left:
+            print(f"💰 剩余评审次数 {judge_left}，本代只渲染 {judge_left}/{len(pending)} 个新个体")
+            pending = pending[:judge_left]
+        for ind in pending:
+            ind.payload = dict(self.params, prompt=self._compose_prompt(ind.core_prompt, quality_suffix),
+                               seed=ind.seed, **ind.params)
+
+        if not deadline.allows():
+            print("⏱️ 迭代预算已耗尽，跳过本轮生成")
+            return None
+        print(f"\n🧬 [Iter {self.iteration}] [EXPLORE 种群] [{mode}] 渲染 {len(pending)} 个个体 "
+              f"(保留精英 {sum(ind.score is not None for ind in generation)}，后端 {len(self.forge)})")
+
+        self._use_checkpoint(self.params['override_settings']['sd_model_checkpoint'], deadline)
+
+        def rate(ind):
+            return ind, rate_image(ind.image_path, self.theme, concept_weight=0.5,
+                                   reference_image_path=self.reference_image_path, deadline=deadline)
+
+        with ThreadPoolExecutor(max_workers=len(pending) or 1) as judges:
+            ratings = []
+            payloads = [ind.payload for ind in pending]
+            for index, outcome, elapsed in self.forge.map_txt2img(payloads, timeout_cap=deadline.remaining()):
+                self.session_budget.charge_gpu(elapsed)
+                if isinstance(outcome, Exception):
+                    print(f"❌ 个体 {index + 1} 渲染失败: {outcome}")
+                    continue
+                ind = pending[index]
+                ind.image_path = self._save_image(outcome.images[0], f"{self.project_id}_iter{self.iteration}_p{index + 1}.png",
+                                                  ind.payload)
+                ratings.append(judges.submit(rate, ind))
+
+            for future in as_completed(ratings):
+                try:
+                    ind, res = future.result()
+                except Exception as e:
+                    print(f"⚠️ 个体评分失败: {e}")
+                    continue
+                self._record_individual(ind, res, mode)
+
+        # 精英的图片可能已被清理（早于保护生效的旧代）：不再参与复用
+        scored = [ind for ind in generation
+                  if ind.score is not None and ind.image_path and os.path.exists(ind.image_path)]
+        if not scored:
+            return None
+        self.population = scored
+        best = max(scored, key=lambda ind: ind.score)
+        print(f"🧬 [种群] 本代最佳 {best.score:.2f}（{len(scored)} 个有效个体，"
+              f"分数 {', '.join(f'{ind.score:.2f}' for ind in sorted(scored, key=lambda i: -i.score))}）")
+
+        # 精英的 Prompt 与参数成为后续 OPTIMIZE/FINETUNE 的起点
+        self.params.update({k: v for k, v in best.payload.items() if k in ('prompt', 'seed', *best.params)})
+        if best.score > self.best_prompt_score:
+            self.best_prompt, self.best_prompt_score = best.core_prompt, best.score
+        self.reused_result = best.result
+        self._novelty_key = None
+        return best.image_path
+
+    def _record_individual(self, ind, res, mode):
+        """种群个体评分后的记账：预算 / 参数观测 / 透镜奖励 / 运行历史 / 新颖度索引"""
+        if not isinstance(res, dict) or res.get('final_score', -1) < 0:
+            return
+        if res.get('api_used') != 'local':
+            self.session_budget.charge_judge()
+        ind.score, ind.result = float(res['final_score']), res
+        if res.get('estimated'):
+            return
+        if self.param_optimizer is not None:
+            self.param_optimizer.observe(mode, ind.params, ind.score)
+        if self.lens_bandit is not None:
+            self.lens_bandit.update(ind.lens, ind.score)
+        self.scored_renders.append({'score': ind.score, 'mode': mode, 'seed': ind.seed,
+                                    'prompt': ind.payload.get('prompt'), 'params': dict(ind.params),
+                                    'image_path': ind.image_path})
+        if self.novelty_index is not None:
+            self.novelty_index.add(ind.payload['prompt'], params_signature(ind.payload), ind.image_path, res)
     
-    def run(self, target_score=None, max_iterations=None, reference_image_path=None):
+    def run(self, target_score=None, max_iterations=None, reference_image_path=None, budget=None):
+        """
+        Args:
+            budget: 可选的 SessionBudget（默认使用 SESSION_BUDGET_TIER 档位）
+        """
+        if budget is not None:
+            self.session_budget = budget
+
         # 更新参考图路径（如果提供）
         if reference_image_path is not None:
             self.reference_image_path = reference_image_path
@@ -533,8 +1226,15 @@ class DiffuServoV4:
         
         converged = False
         early_stopped = False
+        budget_stopped = False
         
         for self.iteration in range(1, self.max_iterations + 1):
+            exhausted = self.session_budget.exhausted_reason()
+            if exhausted:
+                print(f"💰 会话预算耗尽（{exhausted}），交付当前最佳结果")
+                budget_stopped = True
+                break
+
             if self.iteration % self.heartbeat_interval == 0:
                 if not check_forge_health():
                     print("💥 Forge 健康检查失败，提前停止")
@@ -569,7 +1269,7 @@ class DiffuServoV4:
             # 🎯 固定权重：保证评分的可比性
             concept_weight = 0.5  # 所有阶段使用统一权重
             
-            res = rate_image(img_path, self.theme, concept_weight=concept_weight, reference_image_path=self.reference_image_path)
+            res = self.rate_generated(img_path, concept_weight=concept_weight, reference_image_path=self.reference_image_path)
             if not isinstance(res, dict) or 'final_score' not in res:
                 print("⚠️ 评分失败，跳过")
                 continue
@@ -592,6 +1292,11 @@ class DiffuServoV4:
                 print("⚠️ 检测到无效分数，跳过梯度更新")
                 continue
 
+            # 🧮 本地 CLIP 估算分与评审分量纲不同：不进入历史、状态迁移、收敛判断与最佳结果
+            if res.get('estimated'):
+                print(f"🧮 评审不可用，本地估算分 {current_score:.2f} 不计入历史与收敛判断")
+                continue
+
             history_entry = {
                 'iter': self.iteration,
                 'score': current_score,
@@ -601,6 +1306,7 @@ class DiffuServoV4:
                 'reasonableness': reasonableness,
                 'state': self.state,
                 'image_path': img_path,
+                'reason': res.get('reason', ''),
                 'params_summary': {
                     'steps': self.params['steps'],
                     'cfg_scale': self.params['cfg_scale'],
@@ -643,27 +1349,186 @@ class DiffuServoV4:
             else:
                 print()
             
+            # 本轮图片实际使用的参数（adaptive_control 会为下一轮改写 params 的 seed/prompt/steps/cfg）
+            rendered_params = dict(self.render_payloads.get(img_path) or self.params)
             self.adaptive_control(res)
             
-            if self.check_convergence(current_score):
+            if self.check_convergence(current_score, rendered_params):
                 early_stopped = True
                 break
+            self.prefetch_next_checkpoint(current_score)
             
             time.sleep(1)
         
-        self._print_final_report(converged, early_stopped)
+        self.record_model_outcome()
+        self.record_lens_outcome()
+        self.record_run_history()
+        if self.convergence_predictor is not None:
+            self.convergence_predictor.record_run([h['score'] for h in self.history])
+        self.finalize_hires()
+        self._print_final_report(converged, early_stopped, budget_stopped)
+
+    def rate_generated(self, img_path, concept_weight=0.5, reference_image_path=None):
+        """评分本轮生成的图片（受本轮迭代预算约束）；复用已知结果时直接返回，新结果写入新颖度索引"""
+        if self.reused_result is not None:
+            res, self.reused_result = dict(self.reused_result), None
+            return res
+
+        res = rate_image(img_path, self.theme, concept_weight=concept_weight, reference_image_path=reference_image_path,
+                         deadline=self.iteration_deadline)
+        if not (isinstance(res, dict) and res.get('api_used') == 'local'):
+            self.session_budget.charge_judge()
+        # 🧪 参数观测 / 🎰 透镜奖励 / 📚 运行历史：只用 txt2img 渲染的评审分
+        #    （本地估算分量纲不同；img2img 精修与局部修复的分数不反映本轮参数与透镜）
+        if (self.last_render_mode == "txt2img" and isinstance(res, dict)
+                and res.get('final_score', -1) >= 0 and not res.get('estimated')):
+            if self.param_optimizer is not None and self.current_mode is not None:
+                self.param_optimizer.observe(self.current_mode, self.params, res['final_score'])
+            self.scored_renders.append({
+                'score': res['final_score'],
+                'mode': self.current_mode,
+                'seed': self.params.get('seed'),
+                'prompt': self.params.get('prompt'),
+                'params': {k: self.params[k] for k in WARM_PARAM_KEYS if k in self.params},
+                'image_path': img_path,
+            })
+            if self.lens_bandit is not None:
+                self.lens_bandit.update(self.current_lens, res['final_score'])
+                self.current_lens = None
+        # 🧬 新颖度索引缓存的结果会被原样复用，估算分不能冒充评审分
+        if (self.novelty_index is not None and self._novelty_key is not None
+                and isinstance(res, dict) and res.get('final_score', -1) >= 0 and not res.get('estimated')):
+            prompt, signature = self._novelty_key
+            self.novelty_index.add(prompt, signature, img_path, res)
+        self._novelty_key = None
+        return res
+
+    def best_result(self):
+        """当前最佳结果（运行中随时可取）；尚无有效评分时返回 None"""
+        scored = [h for h in self.history if h.get('image_path')]
+        if not scored:
+            return None
+        best = max(scored, key=lambda h: h['score'])
+        return {
+            'score': best['score'],
+            'image_path': best['image_path'],
+            'iteration': best['iter'],
+            'params_summary': best.get('params_summary', {}),
+            'budget': self.session_budget.snapshot(),
+        }
+
+    def record_model_outcome(self, best_score=None):
+        """高分结束的运行把 (主题, 底模) 作为正样本回灌本地主题分类器
+
+        Args:
+            best_score: 本次运行最高分（默认取 self.best_score；Web 会话在外部统计分数）
+        """
+        best_score = self.best_score if best_score is None else best_score
+        classifier = self.brain.theme_classifier
+        if classifier is None or best_score < MODEL_SWITCH_SCORE_THRESHOLD:
+            return
+        # 实际产出好结果的证据强于一次 DeepSeek 判断
+        classifier.record(self.theme, self.initial_model_choice, weight=2.0)
+
+    def record_run_history(self):
+        """把本次运行写入运行历史库，供相似主题的后续会话热启动"""
+        if self.run_history is None:
+            return
+        record = summarize_run(self.theme, self.scored_renders, self.iteration)
+        if record is not None:
+            self.run_history.add(record)
+
+    def finalize_hires(self):
+        """
+        延迟高清化：对本次运行评分最高的 DEFERRED_HIRES_TOP_K 张图做高清化
+        （hires 模式：同参数同 seed 开 HR 重渲染，img2img 产出或 PREVIEW 图改用放大器；upscale 模式：放大器），
+        并可再评审一次高清图，记录评审对分辨率的敏感度
+        
+        Returns:
+            list[dict]: [{'source', 'path', 'method', 'base_score', 'hires_score'}]，未启用时为空
+        """
+        if not self.deferred_hires:
+            return []
+        exhausted = self.session_budget.exhausted_reason()
+        if exhausted:
+            print(f"💰 会话预算耗尽（{exhausted}），跳过延迟高清化")
+            return []
+        # ⏱️ 高清化同样受会话剩余墙钟时间约束（不限时档位沿用各请求的默认超时）
+        deadline = self.session_budget.iteration_deadline()
+        ranked, seen = [], set()
+        for render in sorted(self.scored_renders, key=lambda r: r['score'], reverse=True):
+            path = render.get('image_path')
+            if path and path not in seen and (path in self.render_payloads or os.path.exists(path)):
+                seen.add(path)
+                ranked.append(render)
+        for rank, render in enumerate(ranked[:max(1, DEFERRED_HIRES_TOP_K)], 1):
+            source = render['image_path']
+            payload = self.render_payloads.get(source)
+            rerender = (self.deferred_hires == "hires" and payload is not None
+                        and MODEL_CONFIGS.get(render['mode'], {}).get('enable_hr'))
+            if not rerender and not os.path.exists(source):
+                continue
+            if self.session_budget.exhausted or not deadline.allows():
+                print("💰 预算不足，停止延迟高清化")
+                break
+            method = "hires" if rerender else "upscale"
+            print(f"📐 [延迟高清化] 第 {rank} 名 ({render['score']:.2f}) → {method}")
+            forge_start = time.time()
+            try:
+                if rerender:
+                    hires_payload = dict(payload, enable_hr=True)
+                    result = self.forge.txt2img(hires_payload, timeout_cap=deadline.remaining())
+                else:
+                    factor = (payload or {}).get('hr_scale') or MODEL_CONFIGS["RENDER"]["hr_scale"]
+                    result = self.forge.upscale(encode_image(source), factor, DEFERRED_UPSCALER,
+                                                timeout=deadline.timeout(FORGE_TIMEOUT))
+            except Exception as e:
+                print(f"❌ 高清化失败: {e}")
+                continue
+            finally:
+                self.session_budget.charge_gpu(time.time() - forge_start)
+            path = self._save_image(result.images[0], f"{self.project_id}_final{rank}_{method}.png")
+            entry = {'source': source, 'path': path, 'method': method,
+                     'base_score': render['score'], 'hires_score': None}
+
+            # 🔬 评审分辨率敏感度：同一张图基础分辨率与高清版本的分差
+            if DEFERRED_HIRES_VALIDATE and not self.session_budget.exhausted and deadline.allows():
+                res = rate_image(path, self.theme, concept_weight=0.5, reference_image_path=self.reference_image_path,
+                                 deadline=deadline)
+                if not (isinstance(res, dict) and res.get('api_used') == 'local'):
+                    self.session_budget.charge_judge()
+                if isinstance(res, dict) and res.get('final_score', -1) >= 0 and not res.get('estimated'):
+                    entry['hires_score'] = res['final_score']
+                    print(f"🔬 [分辨率敏感度] 基础 {entry['base_score']:.2f} → 高清 {entry['hires_score']:.2f} "
+                          f"(Δ{entry['hires_score'] - entry['base_score']:+.2f})")
+            self.final_images.append(entry)
+        return self.final_images
+
+    def record_lens_outcome(self):
+        """把本会话的透镜奖励统计并入同一主题簇的全局统计"""
+        if self.lens_stats is None or self.lens_bandit is None:
+            return
+        self.lens_stats.merge(self.lens_cluster, self.lens_bandit.session_stats)
+        means = self.lens_bandit.posterior_means()
+        top = max(means, key=means.get)
+        print(f"🎰 [透镜统计] 最佳透镜: {top.replace('Emphasis on ', '')} (后验均值 {means[top]:.2f})")
     
-    def _print_final_report(self, converged, early_stopped):
+    def _print_final_report(self, converged, early_stopped, budget_stopped=False):
         print("\n" + "="*70)
         if converged:
             print("✅ 结果：达到目标分数")
         elif early_stopped:
             print("⏸️ 结果：早停触发（收敛判定）")
+        elif budget_stopped:
+            print("💰 结果：会话预算耗尽")
         else:
             print("⏹️ 结果：达到最大迭代次数")
         
         print("="*70)
         print(f"🏆 最优分数: {self.best_score:.2f}")
+        usage = self.session_budget.snapshot()
+        print(f"💰 预算用量 [{usage['tier']}]: 墙钟 {usage['wall_seconds']['used']}s | "
+              f"GPU {usage['gpu_seconds']['used']}s | 评分 {usage['judge_calls']['used']} 次")
         
         if self.best_score > 0:
             best_iter_list = [h for h in self.history if h['score'] == self.best_score]
@@ -671,6 +1536,12 @@ class DiffuServoV4:
                 best_entry = best_iter_list[0]
                 print(f"📍 最优方案来自第 {best_entry['iter']} 代")
                 print(f"💾 最优图片路径: {best_entry.get('image_path', 'N/A')}")
+        for entry in self.final_images:
+            print(f"📐 高清版本 ({entry['method']}): {entry['path']}")
+        if self.checkpoints is not None:
+            switches = self.checkpoints.summary()
+            print(f"🗂️ 底模切换（本进程）: 预加载 {switches['prefetched']['count']} 次 (平均 {switches['prefetched']['mean_seconds']:.1f}s) | "
+                  f"关键路径 {switches['critical_path']['count']} 次 (平均 {switches['critical_path']['mean_seconds']:.1f}s)")
         
         print("="*70)
 
@@ -4,13 +4,37 @@
 Engine 初始化模块 - 负责 DiffuServoV4 的初始化逻辑
 """
 import re
+import time
 import datetime
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pkg.infrastructure.config import ENGINE_INIT_DEADLINE
 from pkg.system.modules.reference import analyze_reference_style_with_multimodal
+from pkg.system.strategies.model_selector import ModelSelector
+
+# 项目名 slug 的最大长度（主题本身作为兜底名时可能很长）
+PROJECT_NAME_MAX_LENGTH = 40
 
 
 class EngineInitializer:
     """Engine 初始化工具类"""
 
+    @staticmethod
+    def default_reference_result(theme=None):
+        """
+        参考图/模型选择未完成时的本地兜底结果
+
+        Args:
+            theme: 用户主题；给出时按本地关键词启发式判断动漫主题（→ ANIME，否则 PREVIEW）
+        """
+        anime = bool(theme) and ModelSelector()._is_anime_theme(theme, use_classifier=False)
+        return {
+            "initial_model_choice": "ANIME" if anime else "PREVIEW",
+            "model_locked": False,
+            "locked_model": None,
+            "reference_style_analysis": None,
+        }
+
     @staticmethod
     def initialize_reference_model(brain, theme, reference_image_path):
         """
@@ -24,12 +48,7 @@ class EngineInitializer:
         Returns:
             dict: 包含 initial_model_choice, model_locked, locked_model, reference_style_analysis
         """
-        result = {
-            "initial_model_choice": "PREVIEW",
-            "model_locked": False,
-            "locked_model": None,
-            "reference_style_analysis": None,
-        }
+        result = EngineInitializer.default_reference_result()
 
         if not reference_image_path:
             # 无参考图时使用 DeepSeek 推荐
@@ -78,15 +97,100 @@ class EngineInitializer:
         Returns:
             str: 格式为 "safe_name_YYYYmmdd_HHMMSS"
         """
-        raw_name = brain.generate_project_name(theme)
-        raw_name = (raw_name or "untitled_project").strip()
+        return EngineInitializer.build_project_id(brain.generate_project_name(theme))
+
+    @staticmethod
+    def build_project_id(raw_name):
+        """
+        由名称构造项目 ID（保留英文、数字、下划线与中日韩文字，追加时间戳）
+        
+        过滤后为空（如纯符号名称）时使用名称的短哈希，避免不同主题共用同一个 ID。
+        
+        Args:
+            raw_name: 原始名称（DeepSeek 生成或主题本身）
+            
+        Returns:
+            str: 格式为 "safe_name_YYYYmmdd_HHMMSS"
+        """
+        raw_name = (raw_name or "").strip()
         safe_name = re.sub(r"\s+", "_", raw_name)
-        safe_name = re.sub(r"[^A-Za-z0-9_]+", "", safe_name)
+        safe_name = re.sub(r"[^A-Za-z0-9_\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+", "", safe_name)
+        safe_name = safe_name[:PROJECT_NAME_MAX_LENGTH].strip("_")
         if not safe_name:
-            safe_name = "untitled_project"
+            safe_name = (f"project_{hashlib.sha1(raw_name.encode('utf-8')).hexdigest()[:8]}"
+                         if raw_name else "untitled_project")
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         return f"{safe_name}_{timestamp}"
 
+    @staticmethod
+    def initialize_concurrently(brain, theme, reference_image_path, health_check, deadline=None):
+        """
+        并发执行互不依赖的初始化网络调用：模型选择、项目命名、Forge 健康检查
+        
+        启动耗时取决于最慢的一项而非总和；在共享截止时间内未完成的项使用本地兜底
+        （模型选择 → 关键词启发式 ANIME/PREVIEW，项目名 → 主题 slug）。健康检查自带短超时，始终等待其结果，
+        且一旦失败立即返回，不再等待其他调用。
+        
+        Args:
+            brain: CreativeDirector 实例
+            theme: 用户主题
+            reference_image_path: 参考图路径
+            health_check: 无参健康检查函数，返回 bool
+            deadline: 共享截止时间（秒），默认 ENGINE_INIT_DEADLINE
+            
+        Returns:
+            dict: reference（同 initialize_reference_model）、project_id、forge_ok、timed_out（超时项列表）
+        """
+        deadline = ENGINE_INIT_DEADLINE if deadline is None else deadline
+        start = time.time()
+        executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="engine-init")
+        try:
+            futures = {
+                executor.submit(EngineInitializer.initialize_reference_model, brain, theme, reference_image_path): "reference",
+                executor.submit(EngineInitializer.generate_project_id, brain, theme): "project_id",
+                executor.submit(health_check): "forge_ok",
+            }
+            results = {}
+            pending = set(futures)
+            while pending:
+                remaining = deadline - (time.time() - start)
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures[future]
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        print(f"⚠️ 初始化步骤 {name} 失败: {e}，使用本地兜底")
+                if results.get("forge_ok") is False:
+                    break
+
+            timed_out = [futures[f] for f in pending if futures[f] not in results]
+            if "forge_ok" not in results and "forge_ok" in timed_out:
+                # 健康检查决定能否启动，必须拿到结果（自身超时很短）
+                health_future = next(f for f, n in futures.items() if n == "forge_ok")
+                try:
+                    results["forge_ok"] = health_future.result()
+                except Exception:
+                    results["forge_ok"] = False
+                timed_out.remove("forge_ok")
+            if timed_out and results.get("forge_ok"):
+                print(f"⏱️ 初始化截止 {deadline:.0f}s 已到，以下步骤使用本地兜底: {', '.join(timed_out)}")
+        finally:
+            # 不等待超时的调用：其结果会被丢弃
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        reference = results.get("reference") or EngineInitializer.default_reference_result(theme)
+        project_id = results.get("project_id") or EngineInitializer.build_project_id(theme)
+        print(f"⚡ 并发初始化完成，用时 {time.time() - start:.1f}s")
+        return {
+            "reference": reference,
+            "project_id": project_id,
+            "forge_ok": bool(results.get("forge_ok")),
+            "timed_out": timed_out,
+        }
+
     @staticmethod
     def get_default_params(theme):
         """
@@ -1 +1,2 @@
 from .director import CreativeDirector
+from .prompt_pool import PromptPool
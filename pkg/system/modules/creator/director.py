@@ -1,28 +1,99 @@
+import hashlib
+import json
 import os
 import time
 import random
 import httpx
 from dotenv import load_dotenv
 from pkg.infrastructure.config import DEEPSEEK_MODEL, DEEPSEEK_MAX_RETRIES, DEEPSEEK_TIMEOUT
+from pkg.infrastructure.budget import Deadline
+from pkg.system.strategies.theme_classifier import has_feedback
+from .llm_cache import get_llm_cache
 
 # 加载环境变量
 load_dotenv()
 API_KEY = os.getenv("SILICON_KEY")
 
 class CreativeDirector:
-    def __init__(self):
+    # Prompt 模板版本：修改对应 system prompt 时递增，使旧缓存失效
+    PROMPT_VERSIONS = {
+        "recommend_model": 1,
+        "recommend_lora": 1,
+        "project_name": 1,
+    }
+
+    # 抽象艺术透镜（权重越高越常被选中，优先主体相关镜头）
+    UNIVERSAL_LENSES = [
+        ("Emphasis on Lighting & Atmosphere: (e.g., cinematic, volumetric, moody, golden hour, bioluminescent)", 25),
+        ("Emphasis on Material & Texture: (e.g., organic, metallic, fluid, rough, intricate details)", 25),
+        ("Emphasis on Color Palette: (e.g., monochromatic, vibrant contrast, pastel, dark & gritty)", 20),
+        ("Emphasis on Dynamic Action/Flow: (e.g., motion blur, wind blowing, exploding, floating)", 15),
+        ("Emphasis on Emotion/Vibe: (e.g., mysterious, peaceful, chaotic, horror, ethereal)", 10),
+        ("Emphasis on Composition & Perspective: (e.g., wide angle, macro, dutch angle, symmetry, depth of field)", 5)  # 降低权重，避免风景化
+    ]
+    # OPTIMIZE阶段：固定使用"高质量"镜头组合
+    OPTIMIZE_LENS = "Emphasis on Lighting & Atmosphere & Technical Excellence: Focus on cinematic volumetric lighting, sharp focus, intricate details, and professional-grade composition"
+
+    # Prompt 书写规则（单条与批量生成共用，第 1 条输出格式规则各自给出）
+    PROMPT_RULES = """        2. Format: English keywords, comma-separated.
+        3. **CRITICAL: The prompt MUST explicitly include core elements from the User Concept as concrete nouns/objects.**
+           - BAD: "sunrise colors" (too abstract)
+           - GOOD: "tequila sunrise cocktail in glass" (specific object)
+        4. ADAPTABILITY: Interpret the 'Constraint' specifically for the 'User Concept'.
+           - If concept is "Forest" + "Material": Focus on bark, moss, dew drops.
+           - If concept is "Robot" + "Material": Focus on rust, chrome, oil.
+           - If concept is "Tequila Sunrise" + "Composition": Focus on cocktail glass, layered colors, NOT landscape.
+        5. Length: Dense and rich (approx 40-70 words).
+        6. If feedback provided: Incorporate suggestions or corrections. 
+           - **CRITICAL**: If feedback identifies a PROBLEM (e.g. 'looks like a wall', 'blurry', 'bad eyes'), your prompt must EXPLICITLY solve it through descriptive keywords (e.g. 'deep depth of field', 'volumetric 3D space', 'razor sharp detail').
+           - Never repeat negative feedback in the prompt; instead, provide the positive solution."""
+
+    def __init__(self, cache=None, theme_classifier=None):
         self.api_key = API_KEY
         self.base_url = "https://api.siliconflow.cn/v1"
         self.model = DEEPSEEK_MODEL
         self.recommended_model = None  # 缓存推荐的模型
         self.theme_category = None     # 缓存主题分类 
+        # 💾 跨会话的磁盘响应缓存（默认共享实例，LLM_CACHE_ENABLED=false 时为 None）
+        self.cache = cache if cache is not None else get_llm_cache()
+        # 🧭 本地主题分类器（None 时在首次使用时获取共享实例）
+        self._theme_classifier = theme_classifier
+        # 🎰 透镜老虎机（由引擎按会话设置；None 时按设计权重随机抽样）
+        self.lens_bandit = None
+        self.last_lens = None  # 最近一次单条构思所用透镜
+
+    @property
+    def theme_classifier(self):
+        if self._theme_classifier is None:
+            from pkg.system.strategies.theme_classifier import get_theme_classifier
+            self._theme_classifier = get_theme_classifier() or False
+        return self._theme_classifier or None
+
+    def _cache_get(self, method, theme, extra=None):
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.get(method, theme, self.model, self.PROMPT_VERSIONS[method], extra)
+        except Exception as e:
+            print(f"⚠️ LLM 缓存读取失败: {e}")
+            return None
+
+    def _cache_set(self, method, theme, value, extra=None):
+        if self.cache is None:
+            return
+        try:
+            self.cache.set(method, theme, self.model, self.PROMPT_VERSIONS[method], value, extra)
+        except Exception as e:
+            print(f"⚠️ LLM 缓存写入失败: {e}")
 
-    def analyze_theme_and_recommend_model(self, theme):
+    def analyze_theme_and_recommend_model(self, theme, deadline=None):
         """
         使用 DeepSeek 分析主题意图并推荐最佳底模（三模型策略）。
         优先理解用户期望的艺术风格，而非简单分类主题内容。
+        deadline: 可选的 Deadline 预算，不足时放弃重试直接降级
         返回: {"intent": "...", "model": "PREVIEW/RENDER/ANIME", "reason": "..."}
         """
+        deadline = Deadline.ensure(deadline)
         system_prompt = """
 You are an AI model selector for Stable Diffusion image generation.
 
@@ -61,8 +132,27 @@ Output JSON ONLY (no markdown):
   "reason": "<25 words max explaining WHY this model fits the artistic intent>"
 }
 """
+        cached = self._cache_get("recommend_model", theme)
+        if cached is not None:
+            self.recommended_model = cached["model"]
+            self.theme_category = cached.get("intent", "unknown")
+            print(f"💾 [模型推荐·缓存] {cached.get('intent', 'N/A')} → {cached['model']}")
+            return cached
+
+        # 🧭 本地 CLIP 原型分类：置信时直接采用，模糊主题再问 DeepSeek（带用户反馈时须由 DeepSeek 结合反馈判断）
+        classifier = self.theme_classifier
+        if classifier is not None and not has_feedback(theme):
+            local = classifier.classify(theme)
+            if local is not None:
+                self.recommended_model = local["model"]
+                self.theme_category = local["intent"]
+                print(f"🧭 [模型推荐·本地] {local['intent']} → {local['model']} | {local['reason']}")
+                return local
         
         for attempt in range(3):  # 降低重试次数加快速度
+            if not deadline.allows():
+                print("⏱️ [模型推荐] 迭代预算不足，跳过 DeepSeek")
+                break
             try:
                 headers = {
                     "Authorization": f"Bearer {self.api_key}",
@@ -78,7 +168,7 @@ Output JSON ONLY (no markdown):
                     "max_tokens": 100
                 }
                 
-                with httpx.Client(timeout=15) as client:
+                with httpx.Client(timeout=deadline.timeout(15)) as client:
                     response = client.post(
                         f"{self.base_url}/chat/completions",
                         headers=headers,
@@ -99,19 +189,32 @@ Output JSON ONLY (no markdown):
                     self.recommended_model = result["model"]
                     self.theme_category = result.get("intent", "unknown")
                     print(f"🤖 [模型推荐] {result.get('intent', 'N/A')} → {result['model']} | {result['reason']}")
+                    self._cache_set("recommend_model", theme, result)
+                    if classifier is not None:
+                        # DeepSeek 的判断在后台作为样本回灌，逐步减少模糊主题
+                        classifier.record_async(theme, result["model"])
                     return result
                     
             except Exception as e:
-                if attempt < 2:
+                if attempt < 2 and deadline.can_retry_after(1):
                     time.sleep(1)
                 else:
                     print(f"⚠️ 模型推荐失败: {e}")
+                    break
         
         # 降级：默认使用PREVIEW（快速模式）
         fallback = {"intent": "unknown", "model": "PREVIEW", "reason": "Fallback to fast mode"}
         self.recommended_model = "PREVIEW"
         return fallback
 
+    @staticmethod
+    def _lora_library_key(available_loras):
+        """LoRA 库的缓存键：完整序列化后取哈希（字典的描述/权重变化也会使缓存失效）"""
+        if isinstance(available_loras, (set, frozenset)):
+            available_loras = sorted(available_loras, key=str)
+        raw = json.dumps(available_loras, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
     def recommend_lora(self, theme, available_loras):
         """
         使用 DeepSeek 根据主题推荐最佳 LoRA。
@@ -133,6 +236,10 @@ Output JSON ONLY (no markdown):
   "reason": "short explanation"
 }}
 """
+        lora_library = self._lora_library_key(available_loras)
+        cached = self._cache_get("recommend_lora", theme, extra=lora_library)
+        if cached is not None:
+            return cached
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -157,7 +264,9 @@ Output JSON ONLY (no markdown):
             content = content.replace("```json", "").replace("```", "").strip()
             
             import json
-            return json.loads(content)
+            result = json.loads(content)
+            self._cache_set("recommend_lora", theme, result, extra=lora_library)
+            return result
         except Exception as e:
             print(f"⚠️ [DeepSeek] 推荐LoRA失败: {e}")
             return {"lora_key": "NONE"}
@@ -171,6 +280,10 @@ Output JSON ONLY (no markdown):
         if not theme:
             return "untitled_project"
 
+        cached = self._cache_get("project_name", theme)
+        if cached:
+            return cached
+
         system_instructions = f"""
         Role: Creative naming assistant.
         Task: Generate a short English project name for image generation.
@@ -185,6 +298,9 @@ Output JSON ONLY (no markdown):
         """
 
         for attempt in range(DEEPSEEK_MAX_RETRIES):
+            if not deadline.allows():
+                print("⏱️ [DeepSeek] 迭代预算不足，放弃批量生成")
+                break
             try:
                 headers = {
                     "Authorization": f"Bearer {self.api_key}",
@@ -214,6 +330,7 @@ Output JSON ONLY (no markdown):
                 name = "".join(ch for ch in name if ch.isalpha() or ch == " ")
                 name = " ".join(name.split())
                 if name:
+                    self._cache_set("project_name", theme, name)
                     return name
             except Exception as e:
                 if attempt < DEEPSEEK_MAX_RETRIES - 1:
@@ -225,31 +342,40 @@ Output JSON ONLY (no markdown):
 
         return "untitled_project"
 
-    def brainstorm_prompt(self, base_theme="enchanted forest", feedback_context="", use_random=True):
+    def choose_lenses(self, count, use_random=True):
+        """
+        选择 count 个艺术透镜
+        
+        Args:
+            count: 数量
+            use_random: True 时按权重不放回抽样（超过透镜总数后循环），False 时全部使用 OPTIMIZE_LENS
+        """
+        if not use_random:
+            return [self.OPTIMIZE_LENS] * count
+        if self.lens_bandit is not None:
+            return self.lens_bandit.choose(count)
+        chosen = []
+        while len(chosen) < count:
+            remaining = list(self.UNIVERSAL_LENSES)
+            while remaining and len(chosen) < count:
+                lenses, weights = zip(*remaining)
+                lens = random.choices(lenses, weights=weights, k=1)[0]
+                chosen.append(lens)
+                remaining = [item for item in remaining if item[0] != lens]
+        return chosen
+
+    def brainstorm_prompt(self, base_theme="enchanted forest", feedback_context="", use_random=True, deadline=None):
         """
         通用版：通过'抽象艺术透镜'让 DeepSeek 适配任何主题
         Args:
             base_theme: 基础主题（由controller传入实际theme）
             feedback_context: 来自视觉模型的反馈信息 (用于持续优化)
             use_random: 是否使用随机镜头（OPTIMIZE阶段关闭以稳定收敛）
+            deadline: 可选的 Deadline 预算，超时与重试按剩余时间确定，不足时使用兜底 prompt
         """
-        # 【改进】OPTIMIZE期间使用固定镜头，避免随机导致方向偏离
-        if use_random:
-            # EXPLORE阶段：使用权重随机镜头，优先主体相关镜头
-            universal_lenses = [
-                ("Emphasis on Lighting & Atmosphere: (e.g., cinematic, volumetric, moody, golden hour, bioluminescent)", 25),
-                ("Emphasis on Material & Texture: (e.g., organic, metallic, fluid, rough, intricate details)", 25),
-                ("Emphasis on Color Palette: (e.g., monochromatic, vibrant contrast, pastel, dark & gritty)", 20),
-                ("Emphasis on Dynamic Action/Flow: (e.g., motion blur, wind blowing, exploding, floating)", 15),
-                ("Emphasis on Emotion/Vibe: (e.g., mysterious, peaceful, chaotic, horror, ethereal)", 10),
-                ("Emphasis on Composition & Perspective: (e.g., wide angle, macro, dutch angle, symmetry, depth of field)", 5)  # 降低权重，避免风景化
-            ]
-            # 加权随机选择
-            lenses, weights = zip(*universal_lenses)
-            chosen_lens = random.choices(lenses, weights=weights, k=1)[0]
-        else:
-            # OPTIMIZE阶段：固定使用"高质量"镜头组合
-            chosen_lens = "Emphasis on Lighting & Atmosphere & Technical Excellence: Focus on cinematic volumetric lighting, sharp focus, intricate details, and professional-grade composition"
+        deadline = Deadline.ensure(deadline)
+        chosen_lens = self.choose_lenses(1, use_random)[0]
+        self.last_lens = chosen_lens
         
         print(f"🤖 [DeepSeek] 思考切入点: {base_theme} + [{chosen_lens.split(':')[0]}]")
 
@@ -263,21 +389,13 @@ Output JSON ONLY (no markdown):
 
         Response Rules:
         1. Output pure prompt text ONLY. No intros, no markdown code blocks (no ```text, no ``` symbols).
-        2. Format: English keywords, comma-separated.
-        3. **CRITICAL: The prompt MUST explicitly include core elements from the User Concept as concrete nouns/objects.**
-           - BAD: "sunrise colors" (too abstract)
-           - GOOD: "tequila sunrise cocktail in glass" (specific object)
-        4. ADAPTABILITY: Interpret the 'Constraint' specifically for the 'User Concept'.
-           - If concept is "Forest" + "Material": Focus on bark, moss, dew drops.
-           - If concept is "Robot" + "Material": Focus on rust, chrome, oil.
-           - If concept is "Tequila Sunrise" + "Composition": Focus on cocktail glass, layered colors, NOT landscape.
-        5. Length: Dense and rich (approx 40-70 words).
-        6. If feedback provided: Incorporate suggestions or corrections. 
-           - **CRITICAL**: If feedback identifies a PROBLEM (e.g. 'looks like a wall', 'blurry', 'bad eyes'), your prompt must EXPLICITLY solve it through descriptive keywords (e.g. 'deep depth of field', 'volumetric 3D space', 'razor sharp detail').
-           - Never repeat negative feedback in the prompt; instead, provide the positive solution.
+{self.PROMPT_RULES}
         """
 
         for attempt in range(DEEPSEEK_MAX_RETRIES):
+            if not deadline.allows():
+                print("⏱️ [DeepSeek] 迭代预算不足，使用兜底 prompt")
+                break
             try:
                 # 使用httpx直接调用API，避免OpenAI库的平台检测问题
                 headers = {
@@ -295,7 +413,7 @@ Output JSON ONLY (no markdown):
                     "max_tokens": 200
                 }
                 
-                with httpx.Client(timeout=DEEPSEEK_TIMEOUT) as client:
+                with httpx.Client(timeout=deadline.timeout(DEEPSEEK_TIMEOUT)) as client:
                     response = client.post(
                         f"{self.base_url}/chat/completions",
                         headers=headers,
@@ -315,6 +433,9 @@ Output JSON ONLY (no markdown):
             except Exception as e:
                 if attempt < DEEPSEEK_MAX_RETRIES - 1:
                     wait = min(2 ** attempt, 10)
+                    if not deadline.can_retry_after(wait):
+                        print(f"⚠️ DeepSeek 失败({attempt+1}/{DEEPSEEK_MAX_RETRIES}): {e}，迭代预算不足，不再重试")
+                        break
                     print(f"⚠️ DeepSeek 失败({attempt+1}/{DEEPSEEK_MAX_RETRIES}): {e}，{wait}s后重试")
                     time.sleep(wait)
                 else:
@@ -322,3 +443,125 @@ Output JSON ONLY (no markdown):
 
         # 降级兜底：使用通用修饰词
         return f"cinematic shot of {base_theme}, highly detailed, masterpiece, 8k resolution, dynamic lighting"
+
+    @staticmethod
+    def _match_lens_prompts(lenses, items):
+        """
+        按 "lens" 键把批量响应对应回透镜
+        
+        Args:
+            lenses: 请求中的透镜列表（编号从 1 开始）
+            items: 解析后的 JSON 数组，元素为 {"lens": 编号或透镜名, "prompt": "..."}
+        
+        Returns:
+            list[tuple[str, str]]: 按透镜编号排序的 (透镜, prompt)；无法对应、重复或为空的项被丢弃
+        """
+        matched = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            prompt = item.get("prompt")
+            if not isinstance(prompt, str) or not prompt.strip():
+                continue
+            key = item.get("lens")
+            index = None
+            if isinstance(key, (int, float)) or (isinstance(key, str) and key.strip().isdigit()):
+                index = int(key) - 1
+            elif isinstance(key, str):
+                # 兼容直接回写透镜名称的情况：取第一个未被占用的同名透镜
+                label = key.split(":")[0].strip().lower()
+                index = next((i for i, lens in enumerate(lenses)
+                              if i not in matched and lens.split(":")[0].strip().lower() == label), None)
+            if index is None or not 0 <= index < len(lenses) or index in matched:
+                continue
+            matched[index] = prompt.strip()
+        return [(lenses[i], matched[i]) for i in sorted(matched)]
+
+    def brainstorm_batch(self, base_theme="enchanted forest", feedback_context="", count=6, use_random=True, deadline=None):
+        """
+        一次 DeepSeek 调用生成多条 Prompt（每条对应一个不同的艺术透镜），供 PromptPool 使用
+        
+        Args:
+            base_theme: 基础主题
+            feedback_context: 反馈上下文（与 brainstorm_prompt 相同）
+            count: 生成数量
+            use_random: 是否使用随机镜头（False 时全部使用 OPTIMIZE_LENS）
+            deadline: 可选的 Deadline 预算（后台补充时不限时）
+        
+        Returns:
+            list[tuple[str, str]]: (透镜, prompt) 列表；失败时返回空列表，由调用方回退到单条生成
+        
+        响应要求为 [{"lens": 约束编号, "prompt": "..."}]，按编号对应透镜（不依赖顺序与条数），
+        缺失的编号直接跳过，透镜统计不会记到别的透镜上。
+        """
+        import json
+        import re
+
+        deadline = Deadline.ensure(deadline)
+        lenses = self.choose_lenses(count, use_random)
+        lens_lines = "\n".join(f"        {i + 1}. {lens}" for i, lens in enumerate(lenses))
+        print(f"🤖 [DeepSeek] 批量构思 {count} 条: {base_theme} + [{', '.join(l.split(':')[0].replace('Emphasis on ', '') for l in lenses)}]")
+
+        system_instructions = f"""
+        Role: Expert Stable Diffusion Prompt Engineer.
+        Task: Create {count} distinct, vivid, high-quality prompts for the user's concept, one per artistic constraint below.
+
+        User Concept: "{base_theme}"
+        Artistic Constraints (numbered):
+{lens_lines}
+        {feedback_context}
+
+        Response Rules:
+        1. Output a JSON array ONLY, one object per constraint: [{{"lens": <constraint number>, "prompt": "<prompt text>"}}, ...].
+           No intros, no markdown code blocks.
+{self.PROMPT_RULES}
+        7. Each prompt must be clearly different from the others.
+        """
+
+        for attempt in range(DEEPSEEK_MAX_RETRIES):
+            try:
+                headers = {
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+                payload = {
+                    "model": self.model,
+                    "messages": [
+                        {"role": "system", "content": system_instructions},
+                        {"role": "user", "content": f"Generate {count} prompts."}
+                    ],
+                    "temperature": 1.2,
+                    "max_tokens": 200 * count
+                }
+                # 输出长度约为单条的 count 倍，超时相应放宽
+                with httpx.Client(timeout=deadline.timeout(DEEPSEEK_TIMEOUT * 2)) as client:
+                    response = client.post(
+                        f"{self.base_url}/chat/completions",
+                        headers=headers,
+                        json=payload
+                    )
+                    response.raise_for_status()
+                    data = response.json()
+
+                content = data['choices'][0]['message']['content'].strip()
+                content = content.replace("```json", "").replace("```", "").strip()
+                match = re.search(r'\[.*\]', content, re.DOTALL)
+                batch = self._match_lens_prompts(lenses, json.loads(match.group() if match else content))
+                if not batch:
+                    raise ValueError("响应中没有带透镜编号的有效 prompt")
+
+                print(f"✨ [批量灵感] 获得 {len(batch)}/{count} 条 prompt")
+                return batch
+
+            except Exception as e:
+                if attempt < DEEPSEEK_MAX_RETRIES - 1:
+                    wait = min(2 ** attempt, 10)
+                    if not deadline.can_retry_after(wait):
+                        print(f"⚠️ DeepSeek 批量生成失败({attempt+1}/{DEEPSEEK_MAX_RETRIES}): {e}，迭代预算不足，不再重试")
+                        break
+                    print(f"⚠️ DeepSeek 批量生成失败({attempt+1}/{DEEPSEEK_MAX_RETRIES}): {e}，{wait}s后重试")
+                    time.sleep(wait)
+                else:
+                    print(f"❌ DeepSeek 批量生成耗尽重试次数")
+
+        return []
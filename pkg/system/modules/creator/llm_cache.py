@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存 - 磁盘持久化（SQLite），跨会话/跨进程复用 DeepSeek 的确定性结果
+
+键: (方法名, 规范化主题, 模型, Prompt 模板版本, 附加参数)
+策略: TTL 过期 + 超出容量时按最近访问时间淘汰（LRU）
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pkg.infrastructure.config import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_HOURS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_theme(theme: str) -> str:
+    """主题规范化：去首尾空白、合并空白、小写"""
+    return " ".join((theme or "").split()).lower()
+
+
+class LLMResponseCache:
+    """基于 SQLite 的 LLM 响应缓存（线程安全）"""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: float = LLM_CACHE_TTL_HOURS * 3600,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+    ):
+        """
+        Args:
+            path: SQLite 文件路径（":memory:" 表示仅内存）
+            ttl_seconds: 条目有效期（秒），<=0 表示永不过期
+            max_entries: 最大条目数，超出后淘汰最久未访问的条目
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+
+        # 📊 命中统计（进程内）
+        self.hits = 0
+        self.misses = 0
+
+        if path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " method TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+
+    @staticmethod
+    def make_key(method: str, theme: str, model: str, version: int, extra: Any = None) -> str:
+        raw = json.dumps(
+            [method, normalize_theme(theme), model, version, extra],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, method: str, theme: str, model: str, version: int, extra: Any = None) -> Optional[Any]:
+        """读取缓存，未命中或已过期返回 None"""
+        key = self.make_key(method, theme, model, version, extra)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, method: str, theme: str, model: str, version: int, value: Any, extra: Any = None) -> None:
+        """写入缓存（超出容量时淘汰最久未访问的条目）"""
+        key = self.make_key(method, theme, model, version, extra)
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, method, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, method, payload, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "entries": size,
+        }
+
+
+_shared_cache: Optional[LLMResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """进程内共享的缓存实例（LLM_CACHE_ENABLED=false 或初始化失败时返回 None）"""
+    global _shared_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            try:
+                _shared_cache = LLMResponseCache()
+            except Exception as e:
+                logger.warning(f"⚠️ LLM 缓存初始化失败，禁用缓存: {e}")
+                return None
+        return _shared_cache
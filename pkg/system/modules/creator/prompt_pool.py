@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt 候选池 - 一次 DeepSeek 调用批量构思多条 Prompt，跨迭代消费
+
+池中剩余数量降到阈值时在后台线程异步补充；当"实质性"上下文（用户反馈、
+参考图分析、随机/固定镜头模式）变化时整池失效。每轮的分数反馈只在补充时
+带入；分数较候选入池时变化超过 score_delta 的候选被丢弃（其反馈已过时），
+小幅波动不触发失效，否则池子每轮都会被清空。
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Optional, Tuple
+
+from pkg.infrastructure.budget import Deadline
+from pkg.infrastructure.config import (
+    DEEPSEEK_TIMEOUT,
+    PROMPT_POOL_REFILL_AT,
+    PROMPT_POOL_SCORE_DELTA,
+    PROMPT_POOL_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PromptPool:
+    """单个会话的 Prompt 候选池"""
+
+    def __init__(self, brain, theme: str, size: int = PROMPT_POOL_SIZE, refill_at: int = PROMPT_POOL_REFILL_AT,
+                 score_delta: float = PROMPT_POOL_SCORE_DELTA):
+        """
+        Args:
+            brain: CreativeDirector 实例（需提供 brainstorm_batch / brainstorm_prompt）
+            theme: 会话主题
+            size: 每次批量生成的数量
+            refill_at: 剩余数量 <= 该值时触发异步补充
+            score_delta: 当前分数与候选入池时的分数相差超过该值时整池失效
+        """
+        self.brain = brain
+        self.theme = theme
+        self.size = max(1, int(size))
+        self.refill_at = max(0, int(refill_at))
+        self.score_delta = score_delta
+
+        self._items: Deque[Tuple[str, str, Optional[float]]] = deque()  # (透镜, prompt, 生成时的分数)
+        self._key: Any = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._refill_done: Optional[threading.Event] = None
+
+        self.last_lens: Optional[str] = None  # 最近一次取出的 prompt 所用透镜
+        # 📊 统计信息
+        self.llm_calls = 0
+        self.served = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def invalidate(self) -> None:
+        """丢弃池中全部候选（进行中的补充结果也会被丢弃）"""
+        with self._lock:
+            self._invalidate_locked()
+
+    def _invalidate_locked(self) -> None:
+        if self._items:
+            logger.info(f"🗑️ [Prompt池] 上下文变化，丢弃 {len(self._items)} 条候选")
+        self._items.clear()
+        self._generation += 1
+        self._refill_done = None
+
+    def next_prompt(self, feedback_context: str = "", use_random: bool = True, invalidation_key: Any = None,
+                    deadline: Optional[Deadline] = None, score: Optional[float] = None) -> str:
+        """
+        取出下一条 prompt
+
+        Args:
+            feedback_context: 当前反馈上下文（补充时带入 DeepSeek）
+            use_random: 是否使用随机镜头
+            invalidation_key: 实质性上下文标识，变化时整池失效（如用户反馈文本）
+            deadline: 可选的 Deadline 预算（限制等待补充与同步生成的时间；后台补充不受限）
+            score: 当前分数（随补充一起记录；丢弃生成时分数与之相差过大的候选）
+
+        Returns:
+            str: prompt 文本
+        """
+        deadline = Deadline.ensure(deadline)
+        key = (invalidation_key, use_random)
+        with self._lock:
+            if key != self._key:
+                self._invalidate_locked()
+                self._key = key
+            else:
+                self._drop_stale_locked(score)
+            prompt = self._pop_locked()
+            if prompt is not None:
+                if len(self._items) <= self.refill_at:
+                    self._start_refill_locked(feedback_context, use_random, score)
+                return prompt
+            pending = self._refill_done
+            generation = self._generation
+
+        # 池已空：等待进行中的补充，否则同步批量生成一次
+        if pending is not None:
+            pending.wait(timeout=deadline.timeout(DEEPSEEK_TIMEOUT * 2))
+        else:
+            self._fill(generation, feedback_context, use_random, score, deadline=deadline)
+
+        with self._lock:
+            prompt = self._pop_locked()
+            if prompt is not None:
+                if len(self._items) <= self.refill_at:
+                    self._start_refill_locked(feedback_context, use_random, score)
+                return prompt
+
+        # 批量生成失败：回退到单条生成
+        prompt = self.brain.brainstorm_prompt(
+            self.theme, feedback_context=feedback_context, use_random=use_random, deadline=deadline
+        )
+        self.last_lens = getattr(self.brain, "last_lens", None)
+        return prompt
+
+    def _drop_stale_locked(self, score: Optional[float]) -> None:
+        """丢弃基于与当前分数相差过大的反馈生成的候选"""
+        if score is None:
+            return
+        fresh = [item for item in self._items if item[2] is None or abs(score - item[2]) <= self.score_delta]
+        if len(fresh) < len(self._items):
+            logger.info(f"📈 [Prompt池] 分数变化超过 {self.score_delta:.2f}，丢弃 {len(self._items) - len(fresh)} 条过时候选")
+            self._items = deque(fresh)
+
+    def _pop_locked(self) -> Optional[str]:
+        if not self._items:
+            return None
+        lens, prompt, _ = self._items.popleft()
+        self.last_lens = lens
+        self.served += 1
+        print(f"♻️ [Prompt池] 使用预生成 prompt [{lens.split(':')[0]}]（剩余 {len(self._items)}）")
+        return prompt
+
+    def _start_refill_locked(self, feedback_context: str, use_random: bool, score: Optional[float]) -> None:
+        if self._refill_done is not None:
+            return
+        done = threading.Event()
+        self._refill_done = done
+        generation = self._generation
+
+        def worker():
+            try:
+                self._fill(generation, feedback_context, use_random, score)
+            finally:
+                done.set()
+                with self._lock:
+                    if self._refill_done is done:
+                        self._refill_done = None
+
+        threading.Thread(target=worker, name="prompt-pool-refill", daemon=True).start()
+
+    def _fill(self, generation: int, feedback_context: str, use_random: bool, score: Optional[float] = None,
+              deadline: Optional[Deadline] = None) -> None:
+        """批量生成并入池（期间若池已失效则丢弃结果）"""
+        try:
+            self.llm_calls += 1
+            batch = self.brain.brainstorm_batch(
+                self.theme, feedback_context=feedback_context, count=self.size, use_random=use_random,
+                deadline=deadline,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ [Prompt池] 批量生成失败: {e}")
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._items.extend((lens, prompt, score) for lens, prompt in batch)
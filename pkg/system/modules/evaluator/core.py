@@ -8,7 +8,9 @@ from pkg.infrastructure.config import (
     JUDGE_MODEL_NAME, JUDGE_MODELS, JUDGE_MAX_RETRIES, JUDGE_TIMEOUT, 
     LOG_LEVEL, LOG_FILE, JUDGE_MODEL_ROTATION_ENABLED, JUDGE_MODEL_ROTATION_INTERVAL
 )
+from pkg.infrastructure.budget import Deadline
 from .utils import encode_image, extract_json
+from .local_scorer import local_clip_score
 from pkg.system.modules.reference.image_matcher import ReferenceImageMatcher  # ← 新增
 
 load_dotenv()
@@ -194,7 +196,7 @@ class SmartAPIManager:
 # 全局API管理器实例
 api_manager = SmartAPIManager()
 
-def rate_image(image_path, target_concept, concept_weight=0.5, reference_image_path=None):
+def rate_image(image_path, target_concept, concept_weight=0.5, reference_image_path=None, deadline=None):
     """
     核心审图函数 (五维评分：4个基础维度 + 参考图维度)
     修复：
@@ -202,6 +204,7 @@ def rate_image(image_path, target_concept, concept_weight=0.5, reference_image_p
     2. 支持参考图评分维度（可选）
     :param concept_weight: 概念权重 (0-1)，其他维度按比例分配
     :param reference_image_path: 参考图路径（可选）
+    :param deadline: 可选的 Deadline 预算；请求超时按剩余时间收紧，预算耗尽时改用本地 CLIP 估算评分
     :return: dict 包含 final_score, concept_score, quality_score, aesthetics_score, reasonableness_score, 
              以及可选的参考图5个维度: style_consistency, pose_similarity, composition_match, character_consistency, reference_match_score
     """
@@ -288,7 +291,12 @@ OUTPUT (JSON ONLY, NO MARKDOWN):
 """
     user_prompt = "Rate this image."
 
+    deadline = Deadline.ensure(deadline)
+    budget_exhausted = False
     for attempt in range(JUDGE_MAX_RETRIES):
+        if not deadline.allows():
+            budget_exhausted = True
+            break
         try:
             api_config = api_manager.get_client()
             if not api_config:
@@ -323,7 +331,7 @@ OUTPUT (JSON ONLY, NO MARKDOWN):
                 "max_tokens": 250
             }
             
-            with httpx.Client(timeout=JUDGE_TIMEOUT) as client:
+            with httpx.Client(timeout=deadline.timeout(JUDGE_TIMEOUT)) as client:
                 response = client.post(
                     f"{api_config['url']}/chat/completions",
                     headers=headers,
@@ -334,7 +342,11 @@ OUTPUT (JSON ONLY, NO MARKDOWN):
                 if response.status_code == 429:
                     logger.warning(f"⚠️ API速率限制 (429) - 立即切换API (尝试{attempt+1}/{JUDGE_MAX_RETRIES})")
                     api_manager.handle_failure()
-                    time.sleep(2 + attempt * 0.5)  # 退避延迟
+                    wait = 2 + attempt * 0.5
+                    if not deadline.can_retry_after(wait):
+                        budget_exhausted = True
+                        break
+                    time.sleep(wait)  # 退避延迟
                     continue  # 跳过本次，直接进入下一次重试（会自动获取新API）
                 
                 response.raise_for_status()
@@ -420,8 +432,17 @@ OUTPUT (JSON ONLY, NO MARKDOWN):
         except Exception as e:
             logger.warning(f"API请求异常 (尝试{attempt+1}): {e}", exc_info=(attempt == JUDGE_MAX_RETRIES-1))
             api_manager.handle_failure()  # 记录失败,可能触发API切换
+            if not deadline.can_retry_after(1):
+                budget_exhausted = True
+                break
             time.sleep(1)
 
+    if budget_exhausted or deadline.expired():
+        logger.warning("⏱️ 迭代预算耗尽，改用本地 CLIP 估算评分")
+        local = local_clip_score(image_path, target_concept)
+        if local is not None:
+            return local
+
     logger.error("评分失败：多次重试后仍无法获取有效结果")
     return {"final_score": -1.0, "concept_score": -1.0, "quality_score": -1.0, "aesthetics_score": -1.0, "reasonableness_score": -1.0, "reason": "API failure"}
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地评分 - CLIP 图文相似度估算分数
+
+远程评审模型不可用或迭代预算耗尽时的降级评分：只衡量图片与主题的
+语义一致性（无法评估画质/美学/合理性），结果带 estimated 标记。
+也用于候选图的廉价初筛（rank_by_clip），只把排名最高的送去远程评审。
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from pkg.infrastructure.config import CLIP_SIDECAR_SOCKET
+
+logger = logging.getLogger(__name__)
+
+# CLIP 图文余弦相似度的经验区间：低于 LOW 基本不相关，高于 HIGH 视为高度匹配
+SIMILARITY_LOW = 0.15
+SIMILARITY_HIGH = 0.35
+
+
+def _clip_similarity(image_path: str, text: str) -> float:
+    """图片与文本的 CLIP 余弦相似度（优先边车，否则进程内推理服务）"""
+    if CLIP_SIDECAR_SOCKET:
+        try:
+            from pkg.system.modules.reference.clip_sidecar import CLIPSidecarClient
+            client = CLIPSidecarClient(CLIP_SIDECAR_SOCKET)
+            image_vec = np.asarray(client.embed_images([image_path])[0], dtype=np.float32)
+            text_vec = np.asarray(client.embed_texts([text])[0], dtype=np.float32)
+            return float(image_vec @ text_vec / (np.linalg.norm(image_vec) * np.linalg.norm(text_vec)))
+        except Exception as e:
+            logger.warning(f"⚠️ CLIP 边车不可用，回退本地推理: {e}")
+
+    from PIL import Image
+    from pkg.system.modules.reference.clip_service import CLIPInferenceService
+
+    service = CLIPInferenceService.get()
+    with Image.open(image_path) as img:
+        image_vec = service.encode_images([img.convert("RGB")])[0].cpu().numpy()
+    text_vec = service.encode_texts([text])[0].cpu().numpy()
+    return float(image_vec @ text_vec / (np.linalg.norm(image_vec) * np.linalg.norm(text_vec)))
+
+
+def _clip_similarities(image_paths: Sequence[str], text: str) -> List[float]:
+    """多张图片与同一文本的 CLIP 余弦相似度（一次批量编码）"""
+    if CLIP_SIDECAR_SOCKET:
+        try:
+            from pkg.system.modules.reference.clip_sidecar import CLIPSidecarClient
+            client = CLIPSidecarClient(CLIP_SIDECAR_SOCKET)
+            image_vecs = np.asarray(client.embed_images(list(image_paths)), dtype=np.float32)
+            text_vec = np.asarray(client.embed_texts([text])[0], dtype=np.float32)
+            return (image_vecs @ text_vec / (np.linalg.norm(image_vecs, axis=1) * np.linalg.norm(text_vec))).tolist()
+        except Exception as e:
+            logger.warning(f"⚠️ CLIP 边车不可用，回退本地推理: {e}")
+
+    from PIL import Image
+    from pkg.system.modules.reference.clip_service import CLIPInferenceService
+
+    service = CLIPInferenceService.get()
+    images = []
+    for path in image_paths:
+        with Image.open(path) as img:
+            images.append(img.convert("RGB"))
+    image_vecs = service.encode_images(images).cpu().numpy()
+    text_vec = service.encode_texts([text])[0].cpu().numpy()
+    return (image_vecs @ text_vec / (np.linalg.norm(image_vecs, axis=1) * np.linalg.norm(text_vec))).tolist()
+
+
+def rank_by_clip(image_paths: Sequence[str], target_concept: str) -> Optional[List[int]]:
+    """
+    按与主题的 CLIP 相似度对候选图降序排名（廉价初筛）
+
+    Returns:
+        list[int] | None: 候选下标（相似度从高到低）；CLIP 不可用时返回 None
+    """
+    try:
+        similarities = _clip_similarities(image_paths, target_concept)
+    except Exception as e:
+        logger.warning(f"⚠️ 本地 CLIP 初筛失败: {e}")
+        return None
+    order = sorted(range(len(similarities)), key=lambda i: similarities[i], reverse=True)
+    print(f"📐 [CLIP初筛] 相似度 {', '.join(f'{similarities[i]:.3f}' for i in range(len(similarities)))} → 选第 {order[0] + 1} 张")
+    return order
+
+
+def local_clip_score(image_path: str, target_concept: str) -> Optional[Dict[str, Any]]:
+    """
+    CLIP 估算评分，结构与 rate_image 的返回值一致
+
+    Returns:
+        dict | None: 评分结果（estimated=True）；CLIP 不可用时返回 None
+    """
+    try:
+        similarity = _clip_similarity(image_path, target_concept)
+    except Exception as e:
+        logger.warning(f"⚠️ 本地 CLIP 评分失败: {e}")
+        return None
+
+    score = (similarity - SIMILARITY_LOW) / (SIMILARITY_HIGH - SIMILARITY_LOW)
+    score = round(min(1.0, max(0.0, score)), 3)
+    print(f"📐 [本地评分] CLIP 相似度 {similarity:.3f} → 估算分数 {score:.2f}")
+    return {
+        "final_score": score,
+        "concept_score": score,
+        "quality_score": score,
+        "aesthetics_score": score,
+        "reasonableness_score": score,
+        "reason": f"Local CLIP estimate (similarity={similarity:.3f})",
+        "api_used": "local",
+        "judge_model": "clip",
+        "estimated": True,
+    }
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CLIP 推理服务 - 进程内微批处理队列
+
+每个 Web 会话运行在独立线程中，各自直接调用 CLIP 时前向计算只能在
+intra-op 线程池上串行执行。这里把图像/文本编码请求放进队列，由后台
+worker 在几毫秒窗口内攒成一批，执行一次批量前向，再通过 Future 把
+结果分发回调用方。
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+from PIL import Image
+from transformers import CLIPModel, CLIPProcessor
+
+from pkg.infrastructure.config import (
+    CLIP_BATCHING_ENABLED,
+    CLIP_BATCH_MAX_SIZE,
+    CLIP_BATCH_MAX_WAIT_MS,
+)
+from .reference_encoder import DEFAULT_MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """通用微批处理器：攒批 → 一次调用 batch_fn → 按顺序回填 Future"""
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = CLIP_BATCH_MAX_SIZE,
+        max_wait_ms: float = CLIP_BATCH_MAX_WAIT_MS,
+        name: str = "micro-batcher",
+    ):
+        """
+        Args:
+            batch_fn: 接收一批输入、返回等长结果序列的函数
+            max_batch_size: 单批最多合并的请求数
+            max_wait_ms: 收到首个请求后最多等待多少毫秒继续攒批
+            name: worker 线程名（便于排查）
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # 📊 统计信息
+        self.batches = 0
+        self.items = 0
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """提交单个请求，返回 Future"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} 已关闭")
+            self._queue.put((item, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """停止 worker（已入队的请求会先处理完）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join(timeout)
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _collect(self, first: Tuple[Any, Future]) -> Tuple[List[Tuple[Any, Future]], bool]:
+        """以首个请求为起点攒批，返回 (批次, 是否收到停止信号)"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch, stop = self._collect(entry)
+
+            # 跳过调用方已取消的请求
+            live = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not live:
+                continue
+
+            try:
+                results = self.batch_fn([item for item, _ in live])
+                if len(results) != len(live):
+                    raise RuntimeError(f"batch_fn 返回 {len(results)} 个结果，期望 {len(live)} 个")
+            except Exception as e:
+                for _, fut in live:
+                    fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(live)
+            for (_, fut), result in zip(live, results):
+                fut.set_result(result)
+
+
+class CLIPInferenceService:
+    """共享 CLIP 模型 + 按请求类型分队列的微批推理服务（每个模型/设备一个实例）"""
+
+    _instances: Dict[Tuple[str, str], "CLIPInferenceService"] = {}
+    _instances_lock = threading.Lock()
+
+    # 请求类型：图像特征 / 文本特征 / 视觉编码器隐藏层均值（姿态相似度使用）
+    KIND_IMAGE = "image"
+    KIND_TEXT = "text"
+    KIND_VISION_MEAN = "vision_mean"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        device: Optional[str] = None,
+        batching: bool = CLIP_BATCHING_ENABLED,
+        max_batch_size: int = CLIP_BATCH_MAX_SIZE,
+        max_wait_ms: float = CLIP_BATCH_MAX_WAIT_MS,
+    ):
+        self.model_name = model_name
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.batching = batching
+
+        logger.info(f"🔄 加载 CLIP 模型 {model_name} 到 {self.device}...")
+        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
+        self.model.eval()
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        logger.info("✅ CLIP 推理服务已就绪" + (" (微批处理)" if batching else " (直连)"))
+
+        handlers = {
+            self.KIND_IMAGE: self._forward_images,
+            self.KIND_TEXT: self._forward_texts,
+            self.KIND_VISION_MEAN: self._forward_vision_mean,
+        }
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._handlers = handlers
+        # 直连模式下仍需串行化，避免多个线程同时调用 processor
+        self._inline_lock = threading.Lock()
+        if batching:
+            for kind, fn in handlers.items():
+                self._batchers[kind] = MicroBatcher(
+                    fn,
+                    max_batch_size=max_batch_size,
+                    max_wait_ms=max_wait_ms,
+                    name=f"clip-{kind}-batcher",
+                )
+
+    @classmethod
+    def get(cls, model_name: str = DEFAULT_MODEL_NAME, device: Optional[str] = None) -> "CLIPInferenceService":
+        """获取（或懒创建）指定模型/设备的共享服务实例"""
+        resolved = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        key = (model_name, resolved)
+        with cls._instances_lock:
+            service = cls._instances.get(key)
+            if service is None:
+                service = cls(model_name=model_name, device=resolved)
+                cls._instances[key] = service
+            return service
+
+    # ------------------------------------------------------------------
+    # 对外接口：submit_* 返回 Future，encode_* 阻塞等待结果
+    # ------------------------------------------------------------------
+
+    def submit(self, kind: str, item: Any) -> Future:
+        if self.batching:
+            return self._batchers[kind].submit(item)
+        future: Future = Future()
+        try:
+            with self._inline_lock:
+                future.set_result(self._handlers[kind]([item])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit_image(self, image: Image.Image) -> Future:
+        return self.submit(self.KIND_IMAGE, image)
+
+    def submit_text(self, text: str) -> Future:
+        return self.submit(self.KIND_TEXT, text)
+
+    def encode_images(self, images: Sequence[Image.Image]) -> torch.Tensor:
+        """编码多张图片，返回 (N, D) 特征（未归一化）"""
+        futures = [self.submit(self.KIND_IMAGE, img) for img in images]
+        return torch.stack([f.result() for f in futures])
+
+    def encode_texts(self, texts: Sequence[str]) -> torch.Tensor:
+        """编码多条文本，返回 (N, D) 特征（未归一化）"""
+        futures = [self.submit(self.KIND_TEXT, t) for t in texts]
+        return torch.stack([f.result() for f in futures])
+
+    def encode_vision_mean(self, images: Sequence[Image.Image]) -> torch.Tensor:
+        """视觉编码器 last_hidden_state 在 token 维的均值，返回 (N, H)"""
+        futures = [self.submit(self.KIND_VISION_MEAN, img) for img in images]
+        return torch.stack([f.result() for f in futures])
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各队列的批次数与平均批大小"""
+        return {
+            kind: {"batches": b.batches, "items": b.items, "avg_batch_size": round(b.avg_batch_size, 2)}
+            for kind, b in self._batchers.items()
+        }
+
+    # ------------------------------------------------------------------
+    # 批量前向（仅在 worker 线程或直连锁内执行）
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ensure_feature_tensor(output: Any) -> torch.Tensor:
+        """兼容不同 transformers 版本的输出结构，确保返回张量特征。"""
+        if isinstance(output, torch.Tensor):
+            return output
+        if hasattr(output, "pooler_output") and output.pooler_output is not None:
+            return output.pooler_output
+        if hasattr(output, "last_hidden_state") and output.last_hidden_state is not None:
+            return output.last_hidden_state.mean(dim=1)
+        raise TypeError(f"Unexpected CLIP output type: {type(output)}")
+
+    def _forward_images(self, images: List[Image.Image]) -> List[torch.Tensor]:
+        with torch.no_grad():
+            inputs = self.processor(images=images, return_tensors="pt").to(self.device)
+            features = self._ensure_feature_tensor(self.model.get_image_features(**inputs))
+        return list(features)
+
+    def _forward_texts(self, texts: List[str]) -> List[torch.Tensor]:
+        with torch.no_grad():
+            inputs = self.processor(text=texts, return_tensors="pt", padding=True, truncation=True)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            features = self._ensure_feature_tensor(self.model.get_text_features(**inputs))
+        return list(features)
+
+    def _forward_vision_mean(self, images: List[Image.Image]) -> List[torch.Tensor]:
+        with torch.no_grad():
+            inputs = self.processor(images=images, return_tensors="pt").to(self.device)
+            hidden = self.model.vision_model(**inputs).last_hidden_state
+        return list(hidden.mean(dim=1))
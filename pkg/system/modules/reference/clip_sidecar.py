@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CLIP 嵌入边车进程 - 多 worker 部署时共享一份常驻模型
+
+服务端进程持有 CLIP 模型（经 CLIPInferenceService 微批处理），通过 Unix
+socket 提供 embed/match/encode 请求；图片字节经共享内存传递，socket 上只
+传输小体积 JSON。客户端仅依赖标准库，worker 进程无需导入 torch/transformers。
+
+启动:
+    python -m pkg.system.modules.reference.clip_sidecar --socket /tmp/pygmalion_clip.sock
+
+worker 侧设置环境变量 CLIP_SIDECAR_SOCKET 即自动进入客户端模式。
+
+协议: 4 字节大端长度 + UTF-8 JSON（请求与响应相同）
+    请求: {"op": "...", "shm": "<共享内存名>", "sizes": [n1, n2, ...], ...}
+    响应: {"ok": true, "result": ...} 或 {"ok": false, "error": "..."}
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence
+
+from pkg.infrastructure.config import CLIP_SIDECAR_SOCKET, CLIP_SIDECAR_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+
+
+def _send_message(sock: socket.socket, payload: Dict[str, Any]) -> None:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 1 << 16))
+        if not chunk:
+            raise ConnectionError("边车连接意外关闭")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_message(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+def _read_shared_buffers(name: str, sizes: Sequence[int]) -> List[bytes]:
+    """从客户端创建的共享内存中按顺序切出各图片字节"""
+    # 仅附加不拥有：避免服务端 resource_tracker 在退出时误删客户端的块
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    try:
+        buffers = []
+        offset = 0
+        for size in sizes:
+            buffers.append(bytes(shm.buf[offset:offset + size]))
+            offset += size
+        return buffers
+    finally:
+        shm.close()
+
+
+class CLIPSidecarClient:
+    """边车客户端（仅依赖标准库）"""
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: float = CLIP_SIDECAR_TIMEOUT):
+        self.socket_path = socket_path or CLIP_SIDECAR_SOCKET
+        self.timeout = timeout
+
+    def _call(self, op: str, buffers: Sequence[bytes] = (), **fields) -> Any:
+        shm = None
+        request: Dict[str, Any] = {"op": op, **fields}
+        try:
+            if buffers:
+                total = sum(len(b) for b in buffers)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+                offset = 0
+                for b in buffers:
+                    shm.buf[offset:offset + len(b)] = b
+                    offset += len(b)
+                request["shm"] = shm.name
+                request["sizes"] = [len(b) for b in buffers]
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                _send_message(sock, request)
+                response = _recv_message(sock)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        if not response.get("ok"):
+            raise RuntimeError(f"CLIP 边车错误: {response.get('error')}")
+        return response.get("result")
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def ping(self) -> bool:
+        try:
+            return self._call("ping") == "pong"
+        except Exception:
+            return False
+
+    def embed_images(self, image_paths: Sequence[str]) -> List[List[float]]:
+        """图片特征（未归一化）"""
+        return self._call("embed_image", [self._read_file(p) for p in image_paths])
+
+    def embed_texts(self, texts: Sequence[str]) -> List[List[float]]:
+        """文本特征（未归一化）"""
+        return self._call("embed_text", texts=list(texts))
+
+    def match(self, reference_image_path: str, generated_image_path: str) -> Dict[str, float]:
+        """与 ReferenceImageMatcher.evaluate_match 返回结构一致"""
+        buffers = [self._read_file(reference_image_path), self._read_file(generated_image_path)]
+        return self._call("match", buffers)
+
+    def encode(self, image_path: str, candidate_tags: Sequence[str], top_k: int = 6) -> Dict[str, List]:
+        """与 ReferenceImageEncoder.encode 对应，返回 {"tags": [...], "scores": [...]}"""
+        return self._call("encode", [self._read_file(image_path)], tags=list(candidate_tags), top_k=top_k)
+
+
+class _SidecarRequestHandler(socketserver.BaseRequestHandler):
+    """每个连接处理一个请求；多个连接并发时由 CLIP 微批队列合批"""
+
+    def handle(self) -> None:
+        try:
+            request = _recv_message(self.request)
+            result = self.server.dispatch(request)
+            _send_message(self.request, {"ok": True, "result": result})
+        except Exception as e:
+            logger.warning(f"⚠️ 边车请求失败: {e}")
+            try:
+                _send_message(self.request, {"ok": False, "error": str(e)})
+            except Exception:
+                pass
+
+
+class CLIPSidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """持有 CLIP 模型的边车服务端"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, device: Optional[str] = None):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _SidecarRequestHandler)
+        self.socket_path = socket_path
+        self._load_models(device)
+
+    def _load_models(self, device: Optional[str]) -> None:
+        """加载 CLIP 服务与匹配器/编码器（服务端才需要重依赖）"""
+        from .clip_service import CLIPInferenceService
+        from .image_matcher import ReferenceImageMatcher
+        from .reference_encoder import ReferenceImageEncoder
+
+        self.service = CLIPInferenceService.get(device=device)
+        self.matcher = ReferenceImageMatcher(device=self.service.device, sidecar_socket="")
+        self.encoder = ReferenceImageEncoder(device=self.service.device, sidecar_socket="")
+
+    @staticmethod
+    def _decode_images(request: Dict[str, Any]):
+        import io
+        from PIL import Image
+
+        buffers = _read_shared_buffers(request["shm"], request["sizes"])
+        return [Image.open(io.BytesIO(b)).convert("RGB") for b in buffers]
+
+    def dispatch(self, request: Dict[str, Any]) -> Any:
+        op = request.get("op")
+        if op == "ping":
+            return "pong"
+        if op == "embed_image":
+            return self.service.encode_images(self._decode_images(request)).cpu().tolist()
+        if op == "embed_text":
+            return self.service.encode_texts(request.get("texts") or []).cpu().tolist()
+        if op == "match":
+            ref_image, gen_image = self._decode_images(request)
+            return self.matcher.evaluate_match_images(ref_image, gen_image)
+        if op == "encode":
+            (image,) = self._decode_images(request)
+            encoding = self.encoder.encode_image(image, request.get("tags") or [], int(request.get("top_k", 6)))
+            return {"tags": encoding.tags, "scores": encoding.scores}
+        raise ValueError(f"未知操作: {op}")
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pygmalion CLIP 嵌入边车")
+    parser.add_argument("--socket", default=CLIP_SIDECAR_SOCKET or "/tmp/pygmalion_clip.sock",
+                        help="Unix socket 路径")
+    parser.add_argument("--device", default=None, help="cuda / cpu（默认自动）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = CLIPSidecarServer(args.socket, device=args.device)
+    logger.info(f"🚀 CLIP 边车已启动: {args.socket} (device={server.service.device})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
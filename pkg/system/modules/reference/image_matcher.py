@@ -7,11 +7,14 @@ from __future__ import annotations
 
 import cv2
 import numpy as np
-import torch
 from PIL import Image
-from transformers import CLIPModel, CLIPProcessor
 import logging
-from typing import Union
+from typing import Optional, Union
+
+from pkg.infrastructure.config import CLIP_SIDECAR_SOCKET
+from .clip_sidecar import CLIPSidecarClient
+
+# torch/transformers 仅在本地推理模式下导入（边车客户端模式保持 worker 轻量）
 
 logger = logging.getLogger(__name__)
 
@@ -19,40 +22,47 @@ logger = logging.getLogger(__name__)
 class ReferenceImageMatcher:
     """评估生成图与参考图的匹配度"""
     
-    # 类级别共享模型缓存（所有实例共用）
+    # 类级别共享模型缓存（所有实例共用，实际由 CLIPInferenceService 持有）
     _shared_model = None
     _shared_processor = None
     _model_device = None
 
-    def __init__(self, device: str | None = None):
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    def __init__(self, device: str | None = None, sidecar_socket: Optional[str] = None):
+        """
+        Args:
+            device: 本地推理设备（默认自动选择）
+            sidecar_socket: CLIP 边车 socket 路径；None 读取配置，空字符串强制本地推理
+        """
+        socket_path = CLIP_SIDECAR_SOCKET if sidecar_socket is None else sidecar_socket
+        self._client = CLIPSidecarClient(socket_path) if socket_path else None
+        self._device = device
         self._model = None
         self._processor = None
+        self._service = None
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            import torch
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
 
     def _lazy_load(self) -> None:
-        """懒加载模型（使用类级别缓存）"""
-        # 检查是否已有缓存且设备匹配
-        if (ReferenceImageMatcher._shared_model is None or 
-            ReferenceImageMatcher._model_device != self.device):
-            logger.info(f"🔄 首次加载 CLIP 模型到 {self.device}...")
-            ReferenceImageMatcher._shared_model = CLIPModel.from_pretrained(
-                "openai/clip-vit-base-patch32"
-            ).to(self.device)
-            ReferenceImageMatcher._shared_model.eval()
-            ReferenceImageMatcher._shared_processor = CLIPProcessor.from_pretrained(
-                "openai/clip-vit-base-patch32"
-            )
+        """懒加载模型（经由共享推理服务，跨会话微批处理）"""
+        if self._service is None:
+            from .clip_service import DEFAULT_MODEL_NAME, CLIPInferenceService
+            self._service = CLIPInferenceService.get(DEFAULT_MODEL_NAME, self.device)
+            ReferenceImageMatcher._shared_model = self._service.model
+            ReferenceImageMatcher._shared_processor = self._service.processor
             ReferenceImageMatcher._model_device = self.device
-            logger.info("✅ CLIP 模型已加载并缓存")
-        else:
-            logger.info("♻️ 复用已缓存的 CLIP 模型")
         
-        self._model = ReferenceImageMatcher._shared_model
-        self._processor = ReferenceImageMatcher._shared_processor
+        self._model = self._service.model
+        self._processor = self._service.processor
 
     @staticmethod
     def _ensure_feature_tensor(output: Union[torch.Tensor, object]) -> torch.Tensor:
         """兼容不同 transformers 版本的输出结构，确保返回张量特征。"""
+        import torch
         if isinstance(output, torch.Tensor):
             return output
         if hasattr(output, "pooler_output") and output.pooler_output is not None:
@@ -78,6 +88,13 @@ class ReferenceImageMatcher:
                 'overall_reference_match': 0.75 # 总体匹配度
             }
         """
+        if self._client is not None:
+            try:
+                return self._client.match(reference_image_path, generated_image_path)
+            except Exception as e:
+                logger.warning(f"⚠️ CLIP 边车不可用，回退本地推理: {e}")
+                self._client = None
+
         try:
             ref_image = Image.open(reference_image_path).convert("RGB")
             gen_image = Image.open(generated_image_path).convert("RGB")
@@ -85,6 +102,10 @@ class ReferenceImageMatcher:
             logger.error(f"❌ 加载图片失败: {e}")
             return self._default_scores()
 
+        return self.evaluate_match_images(ref_image, gen_image)
+
+    def evaluate_match_images(self, ref_image: Image.Image, gen_image: Image.Image) -> dict:
+        """在已加载的 RGB 图像上计算多维度匹配度（边车服务端直接调用）"""
         self._lazy_load()
 
         scores = {}
@@ -129,12 +150,11 @@ class ReferenceImageMatcher:
 
     def _compute_style_similarity(self, ref_image: Image.Image, gen_image: Image.Image) -> float:
         """计算风格一致性（CLIP特征向量相似度）"""
+        import torch
         with torch.no_grad():
-            ref_inputs = self._processor(images=ref_image, return_tensors="pt").to(self.device)
-            gen_inputs = self._processor(images=gen_image, return_tensors="pt").to(self.device)
-
-            ref_features = self._ensure_feature_tensor(self._model.get_image_features(**ref_inputs))
-            gen_features = self._ensure_feature_tensor(self._model.get_image_features(**gen_inputs))
+            # 两张图作为两个请求进入共享队列，与其他会话的请求合批前向
+            features = self._service.encode_images([ref_image, gen_image])
+            ref_features, gen_features = features[0:1], features[1:2]
 
             # L2 归一化 (使用 torch.nn.functional.normalize)
             ref_features = torch.nn.functional.normalize(ref_features, p=2, dim=-1)
@@ -151,18 +171,13 @@ class ReferenceImageMatcher:
         """
         # 当前简化方案：用 CNN 的卷积特征图对比
         # 后续可升级为 OpenPose/DWPose 精确提取骨骼关键点
+        import torch
 
         with torch.no_grad():
-            ref_inputs = self._processor(images=ref_image, return_tensors="pt").to(self.device)
-            gen_inputs = self._processor(images=gen_image, return_tensors="pt").to(self.device)
-
-            # 使用视觉编码器的中层特征（含空间信息）
-            ref_features = self._model.vision_model(**ref_inputs).last_hidden_state
-            gen_features = self._model.vision_model(**gen_inputs).last_hidden_state
-
-            # 计算特征图的空间相似性
-            ref_mean = ref_features.mean(dim=1)  # (1, 768)
-            gen_mean = gen_features.mean(dim=1)
+            # 使用视觉编码器的中层特征（含空间信息），按 token 维取均值
+            hidden_means = self._service.encode_vision_mean([ref_image, gen_image])
+            ref_mean = hidden_means[0:1]  # (1, 768)
+            gen_mean = hidden_means[1:2]
 
             # L2 归一化 (使用 torch.nn.functional.normalize)
             ref_mean = torch.nn.functional.normalize(ref_mean, p=2, dim=-1)
@@ -14,9 +14,13 @@ import json
 import logging
 import os
 import base64
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, Any, Optional
-from pkg.infrastructure.config import JUDGE_TIMEOUT
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from pkg.infrastructure.budget import Deadline
+from pkg.infrastructure.config import JUDGE_TIMEOUT, MULTIMODAL_RACE_WIDTH
 
 logger = logging.getLogger(__name__)
 
@@ -116,13 +120,24 @@ class MultimodalStyleAnalyzer:
         else:
             logger.info("⚠️ 使用 SiliconFlow 付费API (降级模式)")
     
-    def analyze_reference_image(self, image_path: str, model: Optional[str] = None) -> Dict[str, Any]:
+    # 📊 各模型历史表现（进程内共享，决定后续竞速顺序）
+    _model_stats: Dict[str, Dict[str, float]] = {}
+    _stats_lock = threading.Lock()
+    _LATENCY_EMA_ALPHA = 0.3
+
+    def analyze_reference_image(self, image_path: str, model: Optional[str] = None,
+                                deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         分析参考图像的艺术风格（优先使用魔搭免费API）
         
+        同时发起前 race_width 个候选模型，首个通过校验的结果胜出，其余断开连接；
+        某个候选失败时立即补上同一服务商的下一个。付费模型只在全部免费候选都结束
+        （失败）后才会发起。
+        
         Args:
             image_path: 本地图像文件路径
-            model: 使用的模型（如果为None，自动选择）
+            model: 优先尝试的模型（如果为None，按历史表现自动排序）
+            deadline: 可选的 Deadline 预算；到期后不再补位，返回默认分析
         
         Returns:
             包含分析结果的字典
@@ -140,37 +155,10 @@ class MultimodalStyleAnalyzer:
                 logger.error(f"❌ {e}")
                 return self._get_default_analysis()
             
-            # 优先尝试魔搭免费API
-            if self.modelscope_key:
-                for model in self.AVAILABLE_MODELS["modelscope"]:
-                    logger.info(f"🔄 尝试 ModelScope (免费): {model}")
-                    response = self._call_api(
-                        self.MODELSCOPE_API_ENDPOINT,
-                        self.modelscope_key,
-                        image_data,
-                        model
-                    )
-                    if response:
-                        analysis = self._parse_response(response)
-                        logger.info(f"✅ ModelScope 分析完成: {analysis.get('style_category', '未知风格')}")
-                        return analysis
-                
-                logger.warning("⚠️ ModelScope 所有模型失败，降级到 SiliconFlow")
-            
-            # 降级到硅基付费API
-            if self.siliconflow_key:
-                for model in self.AVAILABLE_MODELS["siliconflow"]:
-                    logger.info(f"🔄 尝试 SiliconFlow (付费): {model}")
-                    response = self._call_api(
-                        self.SILICONFLOW_API_ENDPOINT,
-                        self.siliconflow_key,
-                        image_data,
-                        model
-                    )
-                    if response:
-                        analysis = self._parse_response(response)
-                        logger.info(f"✅ SiliconFlow 分析完成: {analysis.get('style_category', '未知风格')}")
-                        return analysis
+            candidates = self._ordered_candidates(preferred_model=model)
+            analysis = self._race(candidates, image_data, deadline=deadline)
+            if analysis is not None:
+                return analysis
             
             # 所有API都失败
             logger.warning("⚠️ 所有API调用失败，使用默认分析")
@@ -180,18 +168,150 @@ class MultimodalStyleAnalyzer:
             logger.error(f"❌ 多模态分析异常: {e}")
             return self._get_default_analysis()
     
-    def _call_api(self, endpoint: str, api_key: str, image_data: str, model: str) -> Optional[str]:
+    @staticmethod
+    def _stats_key(provider: str, model: str) -> str:
+        return f"{provider}:{model}"
+    
+    @classmethod
+    def _candidate_rank(cls, provider: str, model: str) -> Tuple[float, float]:
+        """排序键：平滑成功率降序，平均延迟升序（无记录的模型视为中性）"""
+        with cls._stats_lock:
+            stats = cls._model_stats.get(cls._stats_key(provider, model))
+            if not stats:
+                return (-0.5, float(JUDGE_TIMEOUT))
+            success_rate = (stats["success"] + 1) / (stats["success"] + stats["failure"] + 2)
+            return (-success_rate, stats["latency"])
+    
+    @classmethod
+    def _record_result(cls, provider: str, model: str, ok: bool, latency: float) -> None:
+        with cls._stats_lock:
+            stats = cls._model_stats.setdefault(
+                cls._stats_key(provider, model),
+                {"success": 0, "failure": 0, "latency": latency},
+            )
+            stats["success" if ok else "failure"] += 1
+            alpha = cls._LATENCY_EMA_ALPHA
+            stats["latency"] = (1 - alpha) * stats["latency"] + alpha * latency
+    
+    @classmethod
+    def get_model_stats(cls) -> Dict[str, Dict[str, float]]:
+        """各模型的成功/失败次数与平均延迟（秒）"""
+        with cls._stats_lock:
+            return {k: dict(v) for k, v in cls._model_stats.items()}
+    
+    def _ordered_candidates(self, preferred_model: Optional[str] = None) -> List[Tuple[str, str, str, str]]:
+        """
+        生成候选列表 (provider, endpoint, key, model)
+        
+        免费的 ModelScope 始终排在付费 SiliconFlow 之前；同一服务商内按历史表现排序
+        """
+        tiers = []
+        if self.modelscope_key:
+            tiers.append(("modelscope", self.MODELSCOPE_API_ENDPOINT, self.modelscope_key))
+        if self.siliconflow_key:
+            tiers.append(("siliconflow", self.SILICONFLOW_API_ENDPOINT, self.siliconflow_key))
+        
+        candidates = []
+        for provider, endpoint, key in tiers:
+            models = sorted(
+                self.AVAILABLE_MODELS[provider],
+                key=lambda m, p=provider: (m != preferred_model, self._candidate_rank(p, m)),
+            )
+            candidates.extend((provider, endpoint, key, m) for m in models)
+        return candidates
+    
+    def _attempt(self, candidate: Tuple[str, str, str, str], image_data: str,
+                 cancelled: threading.Event, timeout: float = JUDGE_TIMEOUT) -> Optional[Dict[str, Any]]:
+        """单个候选：调用 + 校验，返回有效分析结果或 None"""
+        provider, endpoint, key, model = candidate
+        if cancelled.is_set():
+            return None
+        
+        start = time.time()
+        response = self._call_api(endpoint, key, image_data, model, timeout=timeout, cancelled=cancelled)
+        analysis = self._validate_response(response) if response else None
+        elapsed = time.time() - start
+        
+        # 已有胜者后才返回的结果不计入统计（可能只是被拖慢）
+        if not cancelled.is_set():
+            self._record_result(provider, model, analysis is not None, elapsed)
+        return analysis
+    
+    def _race(self, candidates: List[Tuple[str, str, str, str]], image_data: str,
+              width: Optional[int] = None, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        滑动窗口竞速：保持 width 个同一服务商的候选在途，首个有效结果胜出
+        
+        下一个候选属于另一服务商（免费 → 付费）时，等当前在途的候选全部结束后再发起。
+        胜出后置位 cancelled，其余候选在下一个流式分块处断开连接，不再消耗额度。
+        
+        Returns:
+            胜出的分析结果；全部失败或预算耗尽时返回 None
+        """
+        if not candidates:
+            return None
+        deadline = Deadline.ensure(deadline)
+        width = max(1, width or MULTIMODAL_RACE_WIDTH)
+        cancelled = threading.Event()
+        pending = list(candidates)
+        in_flight: Dict[Future, Tuple[str, str, str, str]] = {}
+        
+        executor = ThreadPoolExecutor(max_workers=min(width, len(candidates)), thread_name_prefix="mm-race")
+        try:
+            def launch():
+                while pending and len(in_flight) < width and deadline.allows():
+                    if any(c[0] != pending[0][0] for c in in_flight.values()):
+                        break
+                    candidate = pending.pop(0)
+                    provider_label = "ModelScope (免费)" if candidate[0] == "modelscope" else "SiliconFlow (付费)"
+                    logger.info(f"🔄 尝试 {provider_label}: {candidate[3]}")
+                    timeout = deadline.timeout(JUDGE_TIMEOUT)
+                    in_flight[executor.submit(self._attempt, candidate, image_data, cancelled, timeout)] = candidate
+            
+            launch()
+            while in_flight:
+                done, _ = wait(list(in_flight), timeout=deadline.timeout(JUDGE_TIMEOUT), return_when=FIRST_COMPLETED)
+                if not done and deadline.expired():
+                    logger.warning(f"⏱️ 迭代预算耗尽，放弃 {len(in_flight)} 个在途分析请求")
+                    return None
+                for future in done:
+                    provider, _, _, model = in_flight.pop(future)
+                    try:
+                        analysis = future.result()
+                    except Exception as e:
+                        logger.warning(f"⚠️ {model} 调用异常: {e}")
+                        analysis = None
+                    if analysis is not None:
+                        cancelled.set()
+                        provider_name = "ModelScope" if provider == "modelscope" else "SiliconFlow"
+                        logger.info(f"✅ {provider_name} 分析完成 ({model}): {analysis.get('style_category', '未知风格')}")
+                        return analysis
+                    logger.warning(f"⚠️ {model} 未返回有效分析")
+                launch()
+            return None
+        finally:
+            cancelled.set()
+            # 不等待在途请求：它们收到 cancelled 后断开连接，结果被丢弃
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _call_api(self, endpoint: str, api_key: str, image_data: str, model: str,
+                  timeout: float = JUDGE_TIMEOUT, cancelled: Optional[threading.Event] = None) -> Optional[str]:
         """
         调用多模态API（使用httpx保持项目一致性）
         
+        以流式（SSE）方式请求，逐块拼接内容；cancelled 置位后立即关闭连接，
+        服务端随之停止生成，不再消耗额度。
+        
         Args:
             endpoint: API端点URL
             api_key: API密钥
             image_data: Base64 编码的图像数据
             model: 使用的模型
+            timeout: 请求超时（秒，按迭代剩余预算收紧）
+            cancelled: 竞速已有胜者时置位的事件
         
         Returns:
-            API 响应的文本内容
+            API 响应的文本内容；失败或被取消时返回 None
         """
         try:
             headers = {
@@ -217,22 +337,19 @@ class MultimodalStyleAnalyzer:
                     }
                 ],
                 "max_tokens": 1000,
-                "temperature": 0.3
+                "temperature": 0.3,
+                "stream": True
             }
             
             # 【重用】使用httpx替代requests，与evaluator.core保持一致
-            with httpx.Client(timeout=JUDGE_TIMEOUT) as client:
-                response = client.post(
-                    endpoint,
-                    headers=headers,
-                    json=payload
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    return content
-                else:
+            with httpx.Client(timeout=timeout) as client:
+                with client.stream("POST", endpoint, headers=headers, json=payload) as response:
+                    if response.status_code == 200:
+                        content = self._read_stream(response.iter_lines(), cancelled)
+                        if content is None:
+                            logger.info(f"🛑 {model} 已有其他模型胜出，断开连接")
+                        return content
+                    response.read()
                     logger.warning(f"⚠️ API错误 {response.status_code}: {response.text[:100]}")
                     return None
         
@@ -246,6 +363,31 @@ class MultimodalStyleAnalyzer:
             logger.error(f"❌ 调用API异常: {e}")
             return None
     
+    @staticmethod
+    def _read_stream(lines: Iterable[str], cancelled: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        拼接 SSE 流式响应中各分块的 delta.content
+        
+        Returns:
+            完整文本；cancelled 置位时返回 None（调用方随即关闭连接）
+        """
+        parts = []
+        for line in lines:
+            if cancelled is not None and cancelled.is_set():
+                return None
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            choices = chunk.get("choices") or [{}]
+            parts.append((choices[0].get("delta") or {}).get("content") or "")
+        return "".join(parts)
+    
     def _parse_response(self, response_text: str) -> Dict[str, Any]:
         """
         解析 API 响应（重用evaluator.utils的extract_json）
@@ -256,25 +398,34 @@ class MultimodalStyleAnalyzer:
         Returns:
             解析后的分析结果
         """
+        return self._validate_response(response_text) or self._get_default_analysis()
+    
+    def _validate_response(self, response_text: str) -> Optional[Dict[str, Any]]:
+        """
+        提取并校验分析结果
+        
+        Returns:
+            包含全部必需字段的字典；无效响应返回 None
+        """
         try:
             # 【重用】使用evaluator.utils的extract_json替代本地实现
             data = extract_json(response_text)
             
             if data is None:
-                logger.warning("⚠️ 响应中未找到有效JSON，使用默认分析")
-                return self._get_default_analysis()
+                logger.warning("⚠️ 响应中未找到有效JSON")
+                return None
             
             # 验证必需字段
             required_fields = ["style_category", "recommended_model", "deepseek_hints"]
             if all(field in data for field in required_fields):
                 return data
             else:
-                logger.warning("⚠️ 响应缺少必需字段，使用默认分析")
-                return self._get_default_analysis()
+                logger.warning("⚠️ 响应缺少必需字段")
+                return None
         
         except Exception as e:
             logger.error(f"❌ 解析异常: {e}")
-            return self._get_default_analysis()
+            return None
     
     def _get_default_analysis(self) -> Dict[str, Any]:
         """
@@ -305,7 +456,8 @@ class MultimodalStyleAnalyzer:
 
 def analyze_reference_style_with_multimodal(
     image_path: str,
-    api_key: Optional[str] = None
+    api_key: Optional[str] = None,
+    deadline: Optional[Deadline] = None
 ) -> Dict[str, Any]:
     """
     便捷函数：使用多模态AI分析参考图像风格
@@ -313,9 +465,10 @@ def analyze_reference_style_with_multimodal(
     Args:
         image_path: 参考图像路径
         api_key: SiliconFlow API密钥
+        deadline: 可选的 Deadline 预算
     
     Returns:
         风格分析结果
     """
     analyzer = MultimodalStyleAnalyzer(api_key=api_key)
-    return analyzer.analyze_reference_image(image_path)
+    return analyzer.analyze_reference_image(image_path, deadline=deadline)
@@ -5,14 +5,21 @@
 """
 from __future__ import annotations
 
+import logging
 from dataclasses import dataclass
-from typing import Iterable, List, Tuple, Optional, Union
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple, Optional, Union
 
-import torch
 from PIL import Image
-from transformers import CLIPModel, CLIPProcessor
 
+from pkg.infrastructure.config import CLIP_SIDECAR_SOCKET
+from .clip_sidecar import CLIPSidecarClient
 
+if TYPE_CHECKING:
+    from .tag_vocabulary import TagVocabulary
+
+logger = logging.getLogger(__name__)
+
+# torch/transformers 仅在本地推理模式下导入（边车客户端模式保持 worker 轻量）
 DEFAULT_MODEL_NAME = "openai/clip-vit-base-patch32"
 
 
@@ -25,24 +32,38 @@ class ReferenceEncodingResult:
 class ReferenceImageEncoder:
     """参考图编码器 - 通过CLIP在候选标签中检索最相关的语义"""
 
-    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, device: Optional[str] = None):
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, device: Optional[str] = None,
+                 sidecar_socket: Optional[str] = None):
         self.model_name = model_name
-        if device:
-            self.device = device
-        else:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._device = device
+        # sidecar_socket: None 读取配置，空字符串强制本地推理
+        socket_path = CLIP_SIDECAR_SOCKET if sidecar_socket is None else sidecar_socket
+        self._client = CLIPSidecarClient(socket_path) if socket_path else None
         self._model = None
         self._processor = None
+        self._service = None
+        # 候选标签文本特征缓存（同一标签库无需每次重跑文本塔）
+        self._text_feature_cache: Dict[Tuple[str, ...], "torch.Tensor"] = {}
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            import torch
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
 
     def _lazy_load(self) -> None:
-        if self._model is None or self._processor is None:
-            self._model = CLIPModel.from_pretrained(self.model_name).to(self.device)
-            self._model.eval()
-            self._processor = CLIPProcessor.from_pretrained(self.model_name)
+        if self._service is None:
+            from .clip_service import CLIPInferenceService
+            # 与 ReferenceImageMatcher 共享同一份模型与微批队列
+            self._service = CLIPInferenceService.get(self.model_name, self.device)
+            self._model = self._service.model
+            self._processor = self._service.processor
 
     @staticmethod
     def _ensure_feature_tensor(output: Union[torch.Tensor, object]) -> torch.Tensor:
         """兼容不同 transformers 版本的输出结构，确保返回张量特征。"""
+        import torch
         if isinstance(output, torch.Tensor):
             return output
         if hasattr(output, "pooler_output") and output.pooler_output is not None:
@@ -62,25 +83,43 @@ class ReferenceImageEncoder:
         Returns:
             ReferenceEncodingResult
         """
-        self._lazy_load()
+        texts = list(candidate_tags)
+        if not texts:
+            return ReferenceEncodingResult(tags=[], scores=[])
+
+        if self._client is not None and self.model_name == DEFAULT_MODEL_NAME:
+            try:
+                remote = self._client.encode(image_path, texts, top_k)
+                return ReferenceEncodingResult(tags=remote["tags"], scores=remote["scores"])
+            except Exception as e:
+                logger.warning(f"⚠️ CLIP 边车不可用，回退本地推理: {e}")
+                self._client = None
 
         image = Image.open(image_path).convert("RGB")
+        return self.encode_image(image, texts, top_k)
+
+    def encode_image(self, image: Image.Image, candidate_tags: Iterable[str], top_k: int = 6) -> ReferenceEncodingResult:
+        """在已加载的 RGB 图像上检索标签（边车服务端直接调用）"""
+        import torch
+
+        self._lazy_load()
+
         texts = list(candidate_tags)
         if not texts:
             return ReferenceEncodingResult(tags=[], scores=[])
 
         with torch.no_grad():
-            image_inputs = self._processor(images=image, return_tensors="pt")
-            text_inputs = self._processor(text=texts, return_tensors="pt", padding=True)
-
-            image_inputs = {k: v.to(self.device) for k, v in image_inputs.items()}
-            text_inputs = {k: v.to(self.device) for k, v in text_inputs.items()}
-
-            image_features = self._ensure_feature_tensor(self._model.get_image_features(**image_inputs))
-            text_features = self._ensure_feature_tensor(self._model.get_text_features(**text_inputs))
+            image_future = self._service.submit_image(image)
+            key = tuple(texts)
+            text_features = self._text_feature_cache.get(key)
+            if text_features is None:
+                text_features = torch.nn.functional.normalize(self._service.encode_texts(texts), p=2, dim=-1)
+                if len(self._text_feature_cache) >= 8:
+                    self._text_feature_cache.clear()
+                self._text_feature_cache[key] = text_features
+            image_features = image_future.result().unsqueeze(0)
 
             image_features = torch.nn.functional.normalize(image_features, p=2, dim=-1)
-            text_features = torch.nn.functional.normalize(text_features, p=2, dim=-1)
 
             similarity = (image_features @ text_features.T).squeeze(0)
             scores = similarity.detach().cpu().tolist()
@@ -93,6 +132,37 @@ class ReferenceImageEncoder:
             scores=[float(score) for _, score in top_ranked],
         )
 
+    def embed_image(self, image_path: str) -> List[float]:
+        """参考图的 CLIP 图像特征（优先走边车，失败回退本地）"""
+        if self._client is not None and self.model_name == DEFAULT_MODEL_NAME:
+            try:
+                return self._client.embed_images([image_path])[0]
+            except Exception as e:
+                logger.warning(f"⚠️ CLIP 边车不可用，回退本地推理: {e}")
+                self._client = None
+
+        self._lazy_load()
+        image = Image.open(image_path).convert("RGB")
+        return self._service.submit_image(image).result().detach().cpu().tolist()
+
+    def encode_with_vocabulary(self, image_path: str, vocabulary: "TagVocabulary", top_k: int = 6,
+                               exclude: Iterable[str] = ()) -> ReferenceEncodingResult:
+        """在预计算标签词表中检索：一次图像前向 + 一次矩阵乘法
+
+        Args:
+            image_path: 参考图片路径
+            vocabulary: 已加载的 TagVocabulary（需与本编码器使用同一 CLIP 模型构建）
+            top_k: 返回最相关标签数量
+            exclude: 需排除的标签（如核心 Prompt 中已有的）
+
+        Returns:
+            ReferenceEncodingResult
+        """
+        if vocabulary.model_name and vocabulary.model_name != self.model_name:
+            logger.warning(f"⚠️ 标签词表由 {vocabulary.model_name} 构建，与当前模型 {self.model_name} 不一致")
+        match = vocabulary.top_k(self.embed_image(image_path), top_k, exclude=exclude)
+        return ReferenceEncodingResult(tags=match.tags, scores=match.scores)
+
 
 DEFAULT_TAG_BANK = [
     # 视觉风格
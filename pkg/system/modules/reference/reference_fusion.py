@@ -5,9 +5,11 @@
 """
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from typing import List, Optional
 
+from pkg.infrastructure.config import TAG_VOCAB_PATH
 from .prompt_merger import PromptMerger, PromptMergeResult
 from .reference_encoder import DEFAULT_TAG_BANK, ReferenceEncodingResult, ReferenceImageEncoder
 
@@ -22,17 +24,41 @@ class ReferenceFusionResult:
 class ReferencePromptFusion:
     """参考图与Prompt融合"""
 
-    def __init__(self, tag_bank: Optional[List[str]] = None):
+    def __init__(self, tag_bank: Optional[List[str]] = None, vocab_path: Optional[str] = None):
+        """
+        Args:
+            tag_bank: 自定义候选标签（指定时不使用词表）
+            vocab_path: 预计算标签词表目录（None 读取 TAG_VOCAB_PATH 配置）
+        """
         self.encoder = ReferenceImageEncoder()
         self.merger = PromptMerger()
         self.tag_bank = tag_bank or list(DEFAULT_TAG_BANK)
+        self.vocabulary = None
+
+        vocab_path = TAG_VOCAB_PATH if vocab_path is None else vocab_path
+        if tag_bank is None and vocab_path:
+            if os.path.isdir(vocab_path):
+                from .tag_vocabulary import get_vocabulary
+                try:
+                    self.vocabulary = get_vocabulary(vocab_path)
+                except Exception as e:
+                    print(f"⚠️ 标签词表加载失败，使用内置标签库: {e}")
+            else:
+                print(f"⚠️ 标签词表目录不存在: {vocab_path}，使用内置标签库")
 
     def fuse(self, core_prompt: str, reference_image_path: str) -> ReferenceFusionResult:
-        encoding: ReferenceEncodingResult = self.encoder.encode(
-            image_path=reference_image_path,
-            candidate_tags=self.tag_bank,
-            top_k=self.merger.max_tags,
-        )
+        if self.vocabulary is not None:
+            encoding: ReferenceEncodingResult = self.encoder.encode_with_vocabulary(
+                image_path=reference_image_path,
+                vocabulary=self.vocabulary,
+                top_k=self.merger.max_tags,
+            )
+        else:
+            encoding = self.encoder.encode(
+                image_path=reference_image_path,
+                candidate_tags=self.tag_bank,
+                top_k=self.merger.max_tags,
+            )
         merge_result: PromptMergeResult = self.merger.merge(core_prompt, encoding.tags)
         return ReferenceFusionResult(
             prompt=merge_result.prompt,
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大规模标签词表 - 离线预计算 CLIP 文本嵌入 + 内存映射检索
+
+离线构建（一次性）:
+    python -m pkg.system.modules.reference.tag_vocabulary build \\
+        --tags-file danbooru_tags.txt --output data/tag_vocab --include-default
+
+目录结构:
+    embeddings.npy  # (N, D) float16，已 L2 归一化
+    tags.txt        # 每行一个标签，与 embeddings 行对应
+    meta.json       # 模型名、维度、数量
+
+运行时只做一次图像前向，标签检索为一次矩阵乘法 + argpartition，
+与词表规模基本无关。词表以 mmap 方式按需分页读入，多个 worker 进程共享同一份页缓存；
+打分时按块直接从 mmap 读 float16 行，每块转换后立即释放，进程内不保留整表副本。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+TAGS_FILE = "tags.txt"
+META_FILE = "meta.json"
+
+# 打分时每块的行数：float16 块转为 float32 再做乘法，临时内存约 行数 × 维度 × 4 字节（512 维约 8MB）
+SCORE_CHUNK_ROWS = 4096
+
+
+@dataclass
+class VocabularyMatch:
+    tags: List[str]
+    scores: List[float]
+
+
+class TagVocabulary:
+    """内存映射的归一化标签嵌入矩阵"""
+
+    def __init__(self, embeddings: np.ndarray, tags: List[str], model_name: str = "",
+                 chunk_rows: int = SCORE_CHUNK_ROWS):
+        if embeddings.shape[0] != len(tags):
+            raise ValueError(f"嵌入行数 {embeddings.shape[0]} 与标签数 {len(tags)} 不一致")
+        self.embeddings = embeddings
+        self.tags = tags
+        self.model_name = model_name
+        self.chunk_rows = max(1, int(chunk_rows))
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    @classmethod
+    def load(cls, directory: str, chunk_rows: int = SCORE_CHUNK_ROWS) -> "TagVocabulary":
+        """以 mmap 方式加载（不把整表读入内存）"""
+        embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, TAGS_FILE), "r", encoding="utf-8") as f:
+            tags = [line.rstrip("\n") for line in f]
+        model_name = ""
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                model_name = json.load(f).get("model_name", "")
+        logger.info(f"📚 已映射标签词表: {len(tags)} 个标签 ({directory})")
+        return cls(embeddings, tags, model_name=model_name, chunk_rows=chunk_rows)
+
+    def scores(self, query: Sequence[float]) -> np.ndarray:
+        """query 与所有标签的余弦相似度（query 会被归一化）"""
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        if norm > 0:
+            q = q / norm
+        out = np.empty(len(self.tags), dtype=np.float32)
+        # 每次调用独立的块缓冲，多会话并发查询时无共享可变状态
+        buffer = np.empty((min(self.chunk_rows, len(self.tags)), self.dim), dtype=np.float32)
+        for start in range(0, len(self.tags), self.chunk_rows):
+            chunk = self.embeddings[start:start + self.chunk_rows]
+            block = buffer[:len(chunk)]
+            block[...] = chunk
+            np.matmul(block, q, out=out[start:start + len(chunk)])
+        return out
+
+    def top_k(self, query: Sequence[float], k: int = 6, exclude: Iterable[str] = ()) -> VocabularyMatch:
+        """返回与 query 最相关的 k 个标签（argpartition 取前 k，再对 k 个排序）"""
+        if not self.tags:
+            return VocabularyMatch(tags=[], scores=[])
+        sims = self.scores(query)
+
+        excluded = {t.lower() for t in exclude}
+        k = max(1, min(int(k), len(self.tags)))
+        # 多取一些候选，为排除项留余量
+        fetch = min(len(self.tags), k + len(excluded))
+        idx = np.argpartition(-sims, fetch - 1)[:fetch]
+        idx = idx[np.argsort(-sims[idx])]
+
+        tags, scores = [], []
+        for i in idx:
+            tag = self.tags[int(i)]
+            if tag.lower() in excluded:
+                continue
+            tags.append(tag)
+            scores.append(float(sims[int(i)]))
+            if len(tags) >= k:
+                break
+        return VocabularyMatch(tags=tags, scores=scores)
+
+
+_loaded: Dict[str, TagVocabulary] = {}
+_loaded_lock = threading.Lock()
+
+
+def get_vocabulary(directory: str) -> TagVocabulary:
+    """进程内共享的词表实例（各会话复用同一 mmap）"""
+    key = os.path.abspath(directory)
+    with _loaded_lock:
+        vocabulary = _loaded.get(key)
+        if vocabulary is None:
+            vocabulary = TagVocabulary.load(directory)
+            _loaded[key] = vocabulary
+        return vocabulary
+
+
+def build_tag_vocabulary(
+    tags: Iterable[str],
+    output_dir: str,
+    model_name: Optional[str] = None,
+    device: Optional[str] = None,
+    batch_size: int = 256,
+) -> TagVocabulary:
+    """
+    离线构建标签词表（需要 torch/transformers）
+
+    Args:
+        tags: 标签序列（自动去重、去空白）
+        output_dir: 输出目录
+        model_name: CLIP 模型名（需与运行时编码图片的模型一致）
+        device: 推理设备
+        batch_size: 文本前向批大小
+
+    Returns:
+        TagVocabulary: 新构建的词表（mmap 加载）
+    """
+    import torch
+    from .clip_service import CLIPInferenceService
+    from .reference_encoder import DEFAULT_MODEL_NAME
+
+    model_name = model_name or DEFAULT_MODEL_NAME
+
+    seen = set()
+    unique: List[str] = []
+    for tag in tags:
+        tag = (tag or "").strip()
+        if tag and tag.lower() not in seen:
+            seen.add(tag.lower())
+            unique.append(tag)
+    if not unique:
+        raise ValueError("标签列表为空")
+
+    # 离线构建不需要微批队列，直接按大批次前向
+    service = CLIPInferenceService(model_name=model_name, device=device, batching=False)
+    os.makedirs(output_dir, exist_ok=True)
+
+    embeddings_path = os.path.join(output_dir, EMBEDDINGS_FILE)
+    matrix = None
+    for start in range(0, len(unique), batch_size):
+        batch = unique[start:start + batch_size]
+        features = torch.stack(service._forward_texts(batch))
+        features = torch.nn.functional.normalize(features, p=2, dim=-1).cpu().numpy().astype(np.float16)
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(
+                embeddings_path, mode="w+", dtype=np.float16, shape=(len(unique), features.shape[1])
+            )
+        matrix[start:start + len(batch)] = features
+        logger.info(f"🔄 已嵌入 {min(start + batch_size, len(unique))}/{len(unique)} 个标签")
+    matrix.flush()
+    del matrix
+
+    with open(os.path.join(output_dir, TAGS_FILE), "w", encoding="utf-8") as f:
+        f.write("\n".join(t.replace("\n", " ") for t in unique) + "\n")
+    with open(os.path.join(output_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "count": len(unique)}, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"✅ 标签词表已写入 {output_dir} ({len(unique)} 个标签)")
+    return TagVocabulary.load(output_dir)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pygmalion 标签词表工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="离线嵌入标签词表")
+    build.add_argument("--tags-file", action="append", default=[], help="标签文件（每行一个，可重复指定）")
+    build.add_argument("--output", required=True, help="输出目录")
+    build.add_argument("--include-default", action="store_true", help="同时包含内置 DEFAULT_TAG_BANK")
+    build.add_argument("--model", default=None, help="CLIP 模型名")
+    build.add_argument("--device", default=None, help="cuda / cpu（默认自动）")
+    build.add_argument("--batch-size", type=int, default=256)
+
+    query = sub.add_parser("query", help="用文本检索词表（调试用）")
+    query.add_argument("--vocab", required=True, help="词表目录")
+    query.add_argument("--text", required=True)
+    query.add_argument("--top-k", type=int, default=10)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "build":
+        tags: List[str] = []
+        if args.include_default:
+            from .reference_encoder import DEFAULT_TAG_BANK
+            tags.extend(DEFAULT_TAG_BANK)
+        for path in args.tags_file:
+            with open(path, "r", encoding="utf-8") as f:
+                # 兼容 Danbooru 风格下划线标签
+                tags.extend(line.strip().replace("_", " ") for line in f)
+        build_tag_vocabulary(tags, args.output, model_name=args.model, device=args.device,
+                             batch_size=args.batch_size)
+    else:
+        import torch
+        from .clip_service import CLIPInferenceService
+
+        vocab = TagVocabulary.load(args.vocab)
+        service = CLIPInferenceService(model_name=vocab.model_name or None, batching=False) \
+            if vocab.model_name else CLIPInferenceService(batching=False)
+        feature = torch.stack(service._forward_texts([args.text]))[0].cpu().numpy()
+        match = vocab.top_k(feature, args.top_k)
+        for tag, score in zip(match.tags, match.scores):
+            print(f"{score:.4f}  {tag}")
+
+
+if __name__ == "__main__":
+    main()
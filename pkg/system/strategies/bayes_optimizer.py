@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+贝叶斯参数优化 - 高斯过程代理模型 + 期望改进（EI）
+
+按模型模式（PREVIEW / RENDER / ANIME）分别维护 (参数, 评分) 观测，在归一化的参数
+空间上拟合 RBF 核高斯过程；每轮从随机候选与当前最佳附近的扰动中选 EI 最大者作为
+下一组 steps / cfg_scale / HR 参数。评分中的 seed 随机性由观测噪声项吸收。
+相比固定增益的 P-Control，能利用全部历史观测，以更少的渲染与评分次数接近最优参数。
+"""
+from __future__ import annotations
+
+import math
+import random
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 各模式的搜索空间：(参数名, 下界, 上界, 是否取整)，以 MODEL_CONFIGS 默认值为中心
+PARAM_SPACES: Dict[str, List[Tuple[str, float, float, bool]]] = {
+    "PREVIEW": [
+        ("steps", 1, 4, True),
+        ("cfg_scale", 1.0, 2.0, False),
+    ],
+    "RENDER": [
+        ("steps", 14, 32, True),
+        ("cfg_scale", 4.0, 9.0, False),
+        ("hr_scale", 1.2, 1.8, False),
+        ("hr_second_pass_steps", 6, 16, True),
+        ("denoising_strength", 0.3, 0.55, False),
+    ],
+    "ANIME": [
+        ("steps", 20, 34, True),
+        ("cfg_scale", 5.0, 9.0, False),
+        ("hr_scale", 1.2, 1.8, False),
+        ("hr_second_pass_steps", 8, 20, True),
+        ("denoising_strength", 0.35, 0.6, False),
+    ],
+}
+
+_erf = np.vectorize(math.erf)
+
+
+def _norm_cdf(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + _erf(z / math.sqrt(2)))
+
+
+def _norm_pdf(z: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * z * z) / math.sqrt(2 * math.pi)
+
+
+class BayesianParameterOptimizer:
+    """按模型模式分组的 GP-EI 参数优化器"""
+
+    def __init__(
+        self,
+        min_observations: int = 3,
+        candidates: int = 256,
+        length_scale: float = 0.3,
+        noise: float = 0.05,
+        xi: float = 0.01,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            min_observations: 观测少于该数时在最佳点附近扰动探索，不拟合 GP
+            candidates: 每轮评估 EI 的候选数
+            length_scale: RBF 核长度尺度（归一化空间）
+            noise: 评分观测噪声标准差（seed 随机性 + 评审抖动）
+            xi: EI 的探索裕量
+            rng: 随机数生成器（测试时可固定）
+        """
+        self.min_observations = max(1, min_observations)
+        self.candidates = candidates
+        self.length_scale = length_scale
+        self.noise = noise
+        self.xi = xi
+        self.rng = rng or random.Random()
+        self._observations: Dict[str, List[Tuple[np.ndarray, float]]] = {}
+
+    # ------------------------------------------------------------------
+    # 参数 <-> 归一化向量
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _encode(mode: str, params: Dict) -> np.ndarray:
+        space = PARAM_SPACES[mode]
+        return np.array([
+            min(1.0, max(0.0, (float(params.get(name, low)) - low) / (high - low)))
+            for name, low, high, _ in space
+        ])
+
+    @staticmethod
+    def _decode(mode: str, x: np.ndarray) -> Dict:
+        decoded = {}
+        for (name, low, high, integer), v in zip(PARAM_SPACES[mode], x):
+            value = low + float(np.clip(v, 0.0, 1.0)) * (high - low)
+            decoded[name] = int(round(value)) if integer else round(value, 2)
+        return decoded
+
+    # ------------------------------------------------------------------
+    # 观测与建议
+    # ------------------------------------------------------------------
+
+    def observe(self, mode: str, params: Dict, score: float) -> None:
+        """记录一次 (参数, 评分) 观测；不在搜索空间内的模式忽略"""
+        if mode not in PARAM_SPACES:
+            return
+        self._observations.setdefault(mode, []).append((self._encode(mode, params), float(score)))
+
+    def best_params(self, mode: str) -> Optional[Dict]:
+        """该模式下评分最高的一组参数（无观测时返回 None）"""
+        observations = self._observations.get(mode)
+        if not observations:
+            return None
+        x, _ = max(observations, key=lambda o: o[1])
+        return self._decode(mode, x)
+
+    def propose(self, mode: str, current: Dict) -> Optional[Dict]:
+        """
+        下一组待评估参数
+
+        Args:
+            mode: 模型模式
+            current: 当前参数（无观测时作为探索中心）
+
+        Returns:
+            dict | None: 参数名 → 取值；模式不在搜索空间内时返回 None
+        """
+        if mode not in PARAM_SPACES:
+            return None
+        observations = self._observations.get(mode, [])
+        if observations:
+            center = max(observations, key=lambda o: o[1])[0]
+        else:
+            center = self._encode(mode, current)
+
+        if len(observations) < self.min_observations:
+            return self._decode(mode, self._perturb(center, 0.15))
+
+        candidates = np.array(
+            [self._perturb(center, 0.1) for _ in range(self.candidates // 2)]
+            + [[self.rng.random() for _ in center] for _ in range(self.candidates - self.candidates // 2)]
+        )
+        ei = self.expected_improvement(mode, candidates)
+        return self._decode(mode, candidates[int(np.argmax(ei))])
+
+    def expected_improvement(self, mode: str, candidates: np.ndarray) -> np.ndarray:
+        """候选点（归一化）相对当前最佳观测的期望改进"""
+        X = np.array([x for x, _ in self._observations[mode]])
+        y = np.array([s for _, s in self._observations[mode]])
+        y_mean = y.mean()
+        amplitude = max(float(y.var()), self.noise ** 2)  # 信号方差按观测离散度估计
+
+        K = amplitude * self._kernel(X, X) + (self.noise ** 2 + 1e-9) * np.eye(len(X))
+        L = np.linalg.cholesky(K)
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y - y_mean))
+        K_s = amplitude * self._kernel(candidates, X)
+        mu = y_mean + K_s @ alpha
+        v = np.linalg.solve(L, K_s.T)
+        sigma = np.sqrt(np.maximum(1e-12, amplitude - np.sum(v * v, axis=0)))
+
+        improvement = mu - y.max() - self.xi
+        z = improvement / sigma
+        return improvement * _norm_cdf(z) + sigma * _norm_pdf(z)
+
+    def _kernel(self, A: np.ndarray, B: np.ndarray) -> np.ndarray:
+        """RBF 核（单位方差）"""
+        sq = np.sum(A ** 2, axis=1)[:, None] + np.sum(B ** 2, axis=1)[None, :] - 2 * A @ B.T
+        return np.exp(-0.5 * np.maximum(sq, 0.0) / self.length_scale ** 2)
+
+    def _perturb(self, center: np.ndarray, scale: float) -> np.ndarray:
+        return np.clip([c + self.rng.gauss(0.0, scale) for c in center], 0.0, 1.0)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+收敛预测器 - 估计会话在剩余预算内达到目标分数的概率
+
+对最近若干次评分做线性趋势拟合：趋势按几何衰减外推（收益递减），残差给出
+单次评分的波动；第 t 步达标概率为 P(N(μ_t, σ) >= target)，剩余 n 步内至少
+一次达标的概率为 1 - Π(1 - p_t)。样本少时趋势与波动向历次运行学到的先验收缩。
+概率过低的会话提前停止，把 GPU 时间让给更可能收敛的会话。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+from typing import Dict, Optional, Sequence
+
+from pkg.infrastructure.config import (
+    CONVERGENCE_MIN_OBSERVATIONS,
+    CONVERGENCE_MIN_PROBABILITY,
+    CONVERGENCE_PREDICTOR_ENABLED,
+    CONVERGENCE_PRIOR_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# 趋势外推的逐步衰减系数（越小越保守）
+TREND_DECAY = 0.8
+# 拟合所用的最近评分数
+WINDOW = 8
+# 单次评分波动的下限（评审模型本身的抖动）
+MIN_SIGMA = 0.02
+# 先验相当于多少个观测
+PRIOR_WEIGHT = 4.0
+# 无历史运行时的默认先验
+DEFAULT_PRIOR = {"slope": 0.01, "sigma": 0.05, "runs": 0}
+
+
+def _normal_sf(z: float) -> float:
+    """标准正态分布的生存函数 P(Z >= z)"""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+class ConvergencePredictor:
+    """基于评分轨迹的达标概率预测"""
+
+    def __init__(
+        self,
+        min_probability: float = CONVERGENCE_MIN_PROBABILITY,
+        min_observations: int = CONVERGENCE_MIN_OBSERVATIONS,
+        prior_path: str = CONVERGENCE_PRIOR_PATH,
+    ):
+        """
+        Args:
+            min_probability: 达标概率低于该值时建议停止
+            min_observations: 至少观测到这么多次评分才做判断
+            prior_path: 历次运行先验的持久化文件（JSON，空字符串表示不持久化）
+        """
+        self.min_probability = min_probability
+        self.min_observations = max(2, int(min_observations))
+        self.prior_path = prior_path
+        self._lock = threading.Lock()
+        self.prior: Dict[str, float] = self._load_prior()
+
+    # ------------------------------------------------------------------
+    # 轨迹拟合
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fit(scores: Sequence[float]):
+        """最小二乘拟合 (末点拟合值, 斜率, 残差方差, 样本数)"""
+        recent = list(scores[-WINDOW:])
+        n = len(recent)
+        mean_x = (n - 1) / 2
+        mean_y = sum(recent) / n
+        sxx = sum((x - mean_x) ** 2 for x in range(n))
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(recent)) / sxx if sxx else 0.0
+        intercept = mean_y - slope * mean_x
+        residuals = [y - (intercept + slope * x) for x, y in enumerate(recent)]
+        variance = sum(r * r for r in residuals) / max(1, n - 2)
+        return intercept + slope * (n - 1), slope, variance, n
+
+    def trajectory(self, scores: Sequence[float]) -> Dict[str, float]:
+        """当前水平、趋势与波动（已向先验收缩）"""
+        level, slope, variance, n = self._fit(scores)
+        weight = PRIOR_WEIGHT
+        slope = (n * slope + weight * self.prior["slope"]) / (n + weight)
+        variance = (n * variance + weight * self.prior["sigma"] ** 2) / (n + weight)
+        return {"level": level, "slope": slope, "sigma": max(MIN_SIGMA, math.sqrt(variance))}
+
+    def probability(self, scores: Sequence[float], target: float, remaining: int) -> float:
+        """
+        剩余 remaining 次迭代内至少一次达到 target 的概率
+
+        Args:
+            scores: 本会话按时间顺序的有效评分
+            target: 目标分数
+            remaining: 剩余可用迭代次数
+        """
+        if scores and max(scores) >= target:
+            return 1.0
+        if remaining <= 0:
+            return 0.0
+        if len(scores) < 2:
+            return 1.0  # 样本不足无法判断，不建议停止
+
+        fit = self.trajectory(scores)
+        miss = 1.0
+        drift = 0.0
+        for t in range(remaining):
+            drift += fit["slope"] * TREND_DECAY ** t
+            mean = fit["level"] + max(drift, -0.2)  # 下降趋势只外推有限幅度
+            miss *= 1.0 - _normal_sf((target - mean) / fit["sigma"])
+        return 1.0 - miss
+
+    def should_stop(self, scores: Sequence[float], target: float, remaining: int):
+        """
+        Returns:
+            (bool, float): (是否建议停止, 达标概率)
+        """
+        if len(scores) < self.min_observations:
+            return False, 1.0
+        p = self.probability(scores, target, remaining)
+        return p < self.min_probability, p
+
+    # ------------------------------------------------------------------
+    # 先验
+    # ------------------------------------------------------------------
+
+    def record_run(self, scores: Sequence[float]) -> None:
+        """把一次完整运行的趋势/波动并入先验（滑动平均）并持久化"""
+        if len(scores) < 3:
+            return
+        _, slope, variance, _ = self._fit(scores)
+        with self._lock:
+            runs = self.prior.get("runs", 0)
+            alpha = 1.0 / (runs + 1) if runs < 20 else 0.05  # 前 20 次为算术平均，之后为 EMA
+            self.prior = {
+                "slope": (1 - alpha) * self.prior["slope"] + alpha * slope,
+                "sigma": (1 - alpha) * self.prior["sigma"] + alpha * max(MIN_SIGMA, math.sqrt(variance)),
+                "runs": runs + 1,
+            }
+            self._save_locked()
+
+    def _load_prior(self) -> Dict[str, float]:
+        if not self.prior_path or not os.path.exists(self.prior_path):
+            return dict(DEFAULT_PRIOR)
+        try:
+            with open(self.prior_path, "r", encoding="utf-8") as f:
+                prior = json.load(f)
+            return {**DEFAULT_PRIOR, **{k: prior[k] for k in DEFAULT_PRIOR if k in prior}}
+        except Exception as e:
+            logger.warning(f"⚠️ 收敛先验读取失败，使用默认值: {e}")
+            return dict(DEFAULT_PRIOR)
+
+    def _save_locked(self) -> None:
+        if not self.prior_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.prior_path)), exist_ok=True)
+            tmp_path = f"{self.prior_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.prior, f)
+            os.replace(tmp_path, self.prior_path)
+        except Exception as e:
+            logger.warning(f"⚠️ 收敛先验写入失败: {e}")
+
+
+_shared_predictor: Optional[ConvergencePredictor] = None
+_shared_lock = threading.Lock()
+
+
+def get_convergence_predictor() -> Optional[ConvergencePredictor]:
+    """进程内共享的预测器（共享先验；CONVERGENCE_PREDICTOR_ENABLED=false 时返回 None）"""
+    global _shared_predictor
+    if not CONVERGENCE_PREDICTOR_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_predictor is None:
+            _shared_predictor = ConvergencePredictor()
+        return _shared_predictor
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+局部缺陷修复 - 按评审理由定位缺陷区域，只对该区域做蒙版重绘
+
+评审理由（reason）指出手部、面部或局部伪影等问题时，整图重新生成既贵又可能丢掉
+已经正确的部分。这里先从理由中识别缺陷类别，再定位区域：人物相关缺陷用
+manga_analyzer 的 YOLOv8 人物检测框（面部取框的上部），检测器不可用或伪影类缺陷
+用梯度显著性（局部高频能量异常的图块）；最后生成蒙版，交给 Forge img2img 以
+"仅重绘蒙版区域"方式按裁剪区域的分辨率重绘，代价只是整图渲染的一小部分。
+"""
+from __future__ import annotations
+
+import base64
+import io
+import logging
+import re
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 缺陷类别 → 部位关键词（需与缺陷描述词同句出现才算缺陷；artifact 本身即缺陷）
+PART_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "hands": ("hand", "hands", "finger", "fingers", "palm", "wrist"),
+    "face": ("face", "faces", "facial", "eye", "eyes", "mouth", "teeth", "nose"),
+    "anatomy": ("limb", "limbs", "arm", "arms", "leg", "legs", "anatomy", "body"),
+}
+# 伪影与缺陷描述词（整词匹配；以 "-" 结尾的为词干，匹配以其开头的词，如 deform- → deformed / deformity）
+ARTIFACT_KEYWORDS = ("artifact-", "artefact-", "glitch-", "smudg-", "blotch-", "stray", "noise patch-", "seam", "seams")
+DEFECT_CUES = (
+    "deform-", "distort-", "malform-", "mutat-", "extra", "missing", "fused", "broken", "wrong", "bad",
+    "weird", "odd", "awkward", "unnatural-", "asymmetr-", "messy", "blurry", "poor-", "flaw", "flaws", "flawed",
+    "incorrect-",
+)
+# 否定词出现在描述词之前 NEGATION_WINDOW 个词以内时不算缺陷（"no visible artifacts"、"without any distortion"）
+NEGATION = re.compile(r"\b(?:no|not|never|nor|without|free of)\b|n['’]t\b")
+NEGATION_WINDOW = 4
+# 各类别追加到 prompt / negative prompt 的修复提示
+FIX_HINTS: Dict[str, Tuple[str, str]] = {
+    "hands": ("detailed hands, five fingers, natural hand pose", "deformed hands, extra fingers, fused fingers"),
+    "face": ("detailed face, symmetrical eyes, natural expression", "deformed face, asymmetrical eyes"),
+    "anatomy": ("correct anatomy, natural proportions", "extra limbs, malformed limbs"),
+    "artifact": ("clean details, coherent textures", "artifacts, glitch, smudge"),
+}
+
+Box = Tuple[int, int, int, int]  # (x, y, w, h)
+
+
+def _word_pattern(terms: Sequence[str]) -> "re.Pattern[str]":
+    alternatives = [re.escape(t[:-1]) + r"\w*" if t.endswith("-") else re.escape(t) for t in terms]
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+
+_ARTIFACT_PATTERN = _word_pattern(ARTIFACT_KEYWORDS)
+_CUE_PATTERN = _word_pattern(DEFECT_CUES)
+
+
+def _mentions(clause: str, pattern: "re.Pattern[str]") -> bool:
+    """clause 中是否有未被否定的 pattern 匹配"""
+    for match in pattern.finditer(clause):
+        window = " ".join(clause[:match.start()].split()[-NEGATION_WINDOW:])
+        if not NEGATION.search(window):
+            return True
+    return False
+
+
+def detect_local_defects(reason: str) -> List[str]:
+    """
+    从评审理由中识别可局部修复的缺陷类别
+
+    Returns:
+        list[str]: 缺陷类别（hands / face / anatomy / artifact），无局部缺陷时为空
+    """
+    found: List[str] = []
+    for clause in re.split(r"[.;,!?]|\bbut\b|\bhowever\b", (reason or "").lower()):
+        words = set(re.findall(r"[a-z]+", clause))
+        has_cue = _mentions(clause, _CUE_PATTERN)
+        for category, parts in PART_KEYWORDS.items():
+            if has_cue and words & set(parts) and category not in found:
+                found.append(category)
+        if _mentions(clause, _ARTIFACT_PATTERN) and "artifact" not in found:
+            found.append("artifact")
+    return found
+
+
+def saliency_box(gray: np.ndarray, grid: int = 8) -> Box:
+    """梯度显著性：局部高频能量相对全图最异常的图块（向四周扩展一格）"""
+    lap = np.abs(4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1] - gray[1:-1, :-2] - gray[1:-1, 2:])
+    h, w = lap.shape
+    ch, cw = max(1, h // grid), max(1, w // grid)
+    energy = np.array([[lap[r * ch:(r + 1) * ch, c * cw:(c + 1) * cw].mean() for c in range(grid)]
+                       for r in range(grid)])
+    z = np.abs(energy - energy.mean()) / (energy.std() + 1e-6)
+    r, c = np.unravel_index(int(np.argmax(z)), z.shape)
+    r0, c0 = max(0, r - 1), max(0, c - 1)
+    r1, c1 = min(grid, r + 2), min(grid, c + 2)
+    return (c0 * cw + 1, r0 * ch + 1, (c1 - c0) * cw, (r1 - r0) * ch)
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def _person_boxes(image_path: str) -> List[Box]:
+    """YOLOv8 人物检测框（检测器不可用时为空）"""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            try:
+                from pkg.system.modules.manga_analyzer.character_detector import CharacterDetector
+                _detector = CharacterDetector()
+            except Exception as e:
+                logger.warning(f"⚠️ 人物检测器不可用，使用梯度显著性定位: {e}")
+                _detector = False
+    if not _detector or _detector.model is None:
+        return []
+    return [c.bbox for c in sorted(_detector.detect(image_path), key=lambda c: -c.confidence)]
+
+
+def locate_regions(image_path: str, categories: Sequence[str]) -> List[Box]:
+    """按缺陷类别定位重绘区域"""
+    from PIL import Image
+
+    boxes: List[Box] = []
+    persons = _person_boxes(image_path) if set(categories) & set(PART_KEYWORDS) else []
+    for category in categories:
+        if category in PART_KEYWORDS and persons:
+            x, y, w, h = persons[0]
+            # 面部取人物框上部；手部/肢体覆盖整个人物框
+            boxes.append((x, y, w, max(1, h // 4)) if category == "face" else (x, y, w, h))
+    if not boxes:
+        with Image.open(image_path) as img:
+            gray = np.asarray(img.convert("L"), dtype=np.float32)
+        boxes.append(saliency_box(gray))
+    return boxes
+
+
+def build_mask(size: Tuple[int, int], boxes: Sequence[Box], padding: int = 16) -> str:
+    """白色为重绘区域的蒙版 PNG（API 所需的 base64 字符串）"""
+    from PIL import Image, ImageDraw
+
+    mask = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(mask)
+    for x, y, w, h in boxes:
+        draw.rectangle([max(0, x - padding), max(0, y - padding),
+                        min(size[0], x + w + padding), min(size[1], y + h + padding)], fill=255)
+    buffer = io.BytesIO()
+    mask.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def crop_resolution(boxes: Sequence[Box], size: Tuple[int, int], padding: int = 32, minimum: int = 512) -> Tuple[int, int]:
+    """仅重绘蒙版区域时的工作分辨率：蒙版外接框加边距，取 64 的倍数，不超过原图"""
+    x0 = min(b[0] for b in boxes) - padding
+    y0 = min(b[1] for b in boxes) - padding
+    x1 = max(b[0] + b[2] for b in boxes) + padding
+    y1 = max(b[1] + b[3] for b in boxes) + padding
+
+    def fit(length: int, limit: int) -> int:
+        return min(limit, max(minimum, -(-length // 64) * 64))
+
+    return fit(x1 - x0, size[0]), fit(y1 - y0, size[1])
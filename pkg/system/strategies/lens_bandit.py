@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+艺术透镜多臂老虎机 - 按本会话实际评分选择 DeepSeek 构思透镜
+
+每个透镜的奖励（评分 0~1）用 Beta 后验建模，Thompson 采样决定下一轮透镜：
+高分透镜被更多使用，未充分尝试的透镜仍有机会。先验均值由 UNIVERSAL_LENSES 的
+设计权重给出，并可用同一主题簇（推荐底模）的历史统计热启动；会话结束后本会话
+的统计并入全局统计，供后续同类主题使用。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pkg.infrastructure.config import LENS_BANDIT_ENABLED, LENS_STATS_PATH
+
+logger = logging.getLogger(__name__)
+
+# 先验伪观测数（越大越相信设计权重）
+PRIOR_STRENGTH = 2.0
+# 设计权重映射到的先验均值区间
+PRIOR_MEAN_RANGE = (0.4, 0.6)
+# 热启动时每个透镜最多折算的历史观测数（避免历史淹没本会话信号）
+WARM_START_CAP = 5.0
+
+
+def lens_key(lens: str) -> str:
+    """透镜标识（冒号前的名称，描述文字调整后统计仍可沿用）"""
+    return lens.split(":")[0].strip()
+
+
+class LensBandit:
+    """单个会话的透镜 Thompson 采样"""
+
+    def __init__(
+        self,
+        lenses: Sequence[Tuple[str, float]],
+        warm_start: Optional[Dict[str, Sequence[float]]] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            lenses: (透镜文本, 设计权重) 列表
+            warm_start: 全局统计 {透镜名: [奖励和, 次数]}（同一主题簇）
+            rng: 随机数生成器（测试时可固定）
+        """
+        self.lenses = [lens for lens, _ in lenses]
+        self.rng = rng or random.Random()
+        max_weight = max(w for _, w in lenses)
+        low, high = PRIOR_MEAN_RANGE
+
+        self._alpha: Dict[str, float] = {}
+        self._beta: Dict[str, float] = {}
+        for lens, weight in lenses:
+            mean = low + (high - low) * weight / max_weight
+            self._alpha[lens_key(lens)] = PRIOR_STRENGTH * mean
+            self._beta[lens_key(lens)] = PRIOR_STRENGTH * (1 - mean)
+
+        for key, (total, count) in (warm_start or {}).items():
+            if key not in self._alpha or count <= 0:
+                continue
+            scale = min(1.0, WARM_START_CAP / count)
+            self._alpha[key] += total * scale
+            self._beta[key] += (count - total) * scale
+
+        # 📊 本会话观测（会话结束后并入全局统计）
+        self.session_stats: Dict[str, List[float]] = {}
+
+    def choose(self, count: int) -> List[str]:
+        """Thompson 采样 count 个透镜（同一批内不重复，超过透镜总数后循环）"""
+        chosen: List[str] = []
+        while len(chosen) < count:
+            draws = sorted(
+                self.lenses,
+                key=lambda lens: self.rng.betavariate(self._alpha[lens_key(lens)], self._beta[lens_key(lens)]),
+                reverse=True,
+            )
+            chosen.extend(draws[:count - len(chosen)])
+        return chosen
+
+    def update(self, lens: Optional[str], score: float) -> None:
+        """用一次评分更新透镜后验（未知透镜，如 OPTIMIZE_LENS，忽略）"""
+        if not lens:
+            return
+        key = lens_key(lens)
+        if key not in self._alpha:
+            return
+        reward = min(1.0, max(0.0, float(score)))
+        self._alpha[key] += reward
+        self._beta[key] += 1.0 - reward
+        stats = self.session_stats.setdefault(key, [0.0, 0])
+        stats[0] += reward
+        stats[1] += 1
+
+    def posterior_means(self) -> Dict[str, float]:
+        return {k: self._alpha[k] / (self._alpha[k] + self._beta[k]) for k in self._alpha}
+
+
+class LensStatsStore:
+    """按主题簇（推荐底模）累计的透镜奖励统计（JSON 持久化）"""
+
+    def __init__(self, path: str = LENS_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, List[float]]] = self._load()
+
+    def get(self, cluster: str) -> Dict[str, List[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._stats.get(cluster, {}).items()}
+
+    def merge(self, cluster: str, session_stats: Dict[str, List[float]]) -> None:
+        """并入一个会话的观测并持久化"""
+        if not session_stats:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(cluster, {})
+            for key, (total, count) in session_stats.items():
+                entry = stats.setdefault(key, [0.0, 0])
+                entry[0] += total
+                entry[1] += count
+            self._save_locked()
+
+    def _load(self) -> Dict[str, Dict[str, List[float]]]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("clusters", {})
+        except Exception as e:
+            logger.warning(f"⚠️ 透镜统计读取失败，重新开始统计: {e}")
+            return {}
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "clusters": self._stats}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ 透镜统计写入失败: {e}")
+
+
+_shared_store: Optional[LensStatsStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_lens_stats_store() -> Optional[LensStatsStore]:
+    """进程内共享的透镜统计（LENS_BANDIT_ENABLED=false 时返回 None）"""
+    global _shared_store
+    if not LENS_BANDIT_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = LensStatsStore()
+        return _shared_store
@@ -66,15 +66,28 @@ class ModelSelector:
 
         return "PREVIEW"  # 默认
 
-    def _is_anime_theme(self, theme):
-        """判断主题是否为动漫风格"""
+    def _is_anime_theme(self, theme, use_classifier=True):
+        """
+        判断主题是否为动漫风格（关键词命中直接判定，否则参考本地 CLIP 原型分类器）
+
+        Args:
+            use_classifier: False 时只做关键词判断（不加载 CLIP，用于初始化超时兜底）
+        """
         anime_keywords = [
             "anime", "manga", "cartoon", "illustration", 
             "cute", "chibi", "fantasy art", "game character",
             "动漫", "漫画", "卡通", "插画", "可爱", "萌"
         ]
         theme_lower = theme.lower()
-        return any(k in theme_lower for k in anime_keywords)
+        if any(k in theme_lower for k in anime_keywords):
+            return True
+        if not use_classifier:
+            return False
+
+        from .theme_classifier import get_theme_classifier
+        classifier = get_theme_classifier()
+        local = classifier.classify(theme) if classifier is not None else None
+        return bool(local and local["model"] == "ANIME")
 
     def get_model_config(self, model_mode):
         """
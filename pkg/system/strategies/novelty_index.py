@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt 新颖度索引 - 会话内已尝试 Prompt 的 CLIP 文本嵌入 + 对应评分
+
+停滞回退到 best_prompt、OPTIMIZE 固定镜头、重复的用户反馈都会让引擎反复渲染
+几乎相同的 Prompt。生成前按 (底模, 关键参数) 签名查找近重复项：命中时由引擎
+有意扰动 Prompt 与 Seed，或直接复用已知结果，不再为已评分过的内容花 GPU 时间。
+CLIP 不可用时退化为内容词 Jaccard 相似度。
+"""
+from __future__ import annotations
+
+import logging
+import random
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pkg.infrastructure.config import CLIP_SIDECAR_SOCKET, PROMPT_NOVELTY_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+_LORA_TAG = re.compile(r"<(?:lora|lyco|hypernet):[^>]+>", re.IGNORECASE)
+# 词集合相似度（回退模式）的近重复阈值
+LEXICAL_THRESHOLD = 0.9
+# 参与签名的参数（seed 不参与：Seed 每轮随机，Prompt+参数相同才是"重复渲染"）
+SIGNATURE_KEYS = (
+    "steps", "cfg_scale", "sampler_name", "scheduler", "width", "height",
+    "enable_hr", "hr_scale", "hr_second_pass_steps", "denoising_strength",
+)
+
+
+@dataclass
+class NoveltyEntry:
+    prompt: str
+    signature: Tuple
+    image_path: str
+    result: Dict[str, Any]
+    embedding: Optional[np.ndarray] = None
+    words: frozenset = frozenset()
+
+    @property
+    def score(self) -> float:
+        return float(self.result.get("final_score", 0.0))
+
+
+def params_signature(params: Dict[str, Any]) -> Tuple:
+    """(底模, 关键参数, 是否启用 ControlNet) 组成的签名"""
+    checkpoint = (params.get("override_settings") or {}).get("sd_model_checkpoint")
+    values = []
+    for key in SIGNATURE_KEYS:
+        value = params.get(key)
+        values.append(round(value, 2) if isinstance(value, float) else value)
+    has_controlnet = "controlnet" in (params.get("alwayson_scripts") or {})
+    return (checkpoint, *values, has_controlnet)
+
+
+def _content_words(prompt: str) -> frozenset:
+    return frozenset(re.findall(r"[a-z0-9]+", _LORA_TAG.sub("", prompt).lower()))
+
+
+def perturb_prompt(prompt: str, rng: random.Random = random) -> str:
+    """有意扰动：保留主体短语，随机去掉一个描述短语并打乱其余描述的顺序"""
+    lora_tags = _LORA_TAG.findall(prompt)
+    phrases = [p.strip() for p in _LORA_TAG.sub("", prompt).split(",") if p.strip()]
+    if len(phrases) < 3:
+        return prompt
+    head, rest = phrases[0], phrases[1:]
+    rest.pop(rng.randrange(len(rest)))
+    rng.shuffle(rest)
+    text = ", ".join([head] + rest)
+    return f"{text}, {' '.join(lora_tags)}" if lora_tags else text
+
+
+def _clip_text_embedder() -> Callable[[Sequence[str]], List[List[float]]]:
+    """CLIP 文本编码：优先边车，否则使用进程内共享推理服务"""
+    if CLIP_SIDECAR_SOCKET:
+        from pkg.system.modules.reference.clip_sidecar import CLIPSidecarClient
+        client = CLIPSidecarClient(CLIP_SIDECAR_SOCKET)
+        return client.embed_texts
+
+    from pkg.system.modules.reference.clip_service import CLIPInferenceService
+    service = CLIPInferenceService.get()
+    return lambda texts: service.encode_texts(list(texts)).cpu().tolist()
+
+
+class PromptNoveltyIndex:
+    """单个会话的 Prompt 近重复索引"""
+
+    def __init__(self, threshold: float = PROMPT_NOVELTY_THRESHOLD,
+                 embedder: Optional[Callable[[Sequence[str]], List[List[float]]]] = None):
+        """
+        Args:
+            threshold: CLIP 文本嵌入余弦相似度阈值（>= 视为近重复）
+            embedder: 自定义文本编码函数（默认 CLIP；失败后回退词集合相似度）
+        """
+        self.threshold = threshold
+        self._embedder = embedder
+        self._embedder_failed = False
+        self._entries: List[NoveltyEntry] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        if self._embedder_failed:
+            return None
+        try:
+            if self._embedder is None:
+                self._embedder = _clip_text_embedder()
+            vector = np.asarray(self._embedder([_LORA_TAG.sub("", prompt)])[0], dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"⚠️ CLIP 文本编码不可用，新颖度检查回退词集合相似度: {e}")
+            self._embedder_failed = True
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def find_duplicate(self, prompt: str, signature: Tuple) -> Optional[Tuple[NoveltyEntry, float]]:
+        """
+        查找同签名下最相似的已尝试 Prompt
+
+        Returns:
+            (条目, 相似度) | None：相似度未达阈值时返回 None
+        """
+        with self._lock:
+            candidates = [e for e in self._entries if e.signature == signature]
+        if not candidates:
+            return None
+
+        embedding = self._embed(prompt)
+        words = _content_words(prompt)
+        best: Optional[Tuple[NoveltyEntry, float]] = None
+        for entry in candidates:
+            if embedding is not None and entry.embedding is not None:
+                similarity = float(np.dot(embedding, entry.embedding))
+                threshold = self.threshold
+            else:
+                union = words | entry.words
+                similarity = len(words & entry.words) / len(union) if union else 1.0
+                threshold = LEXICAL_THRESHOLD
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (entry, similarity)
+        return best
+
+    def add(self, prompt: str, signature: Tuple, image_path: str, result: Dict[str, Any]) -> None:
+        """记录一次已渲染并评分的 Prompt"""
+        entry = NoveltyEntry(
+            prompt=prompt,
+            signature=signature,
+            image_path=image_path,
+            result=dict(result),
+            embedding=self._embed(prompt),
+            words=_content_words(prompt),
+        )
+        with self._lock:
+            self._entries.append(entry)
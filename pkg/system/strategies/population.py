@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+种群探索 - EXPLORE 阶段的并行进化
+
+单轨迹探索每轮只试一个 (prompt, 参数, seed)，一次坏的抽样就浪费一整轮。种群模式
+每轮并发渲染/评分 K 个个体：保留上一代精英（不重复渲染），其余由锦标赛选出的父代
+做 Prompt 短语交叉与参数交叉、再变异得到，另补入本轮新构思的个体保持多样性。
+最优个体作为本轮结果交给状态机，进入 OPTIMIZE/FINETUNE 后沿用其 Prompt 与参数。
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from pkg.system.strategies.bayes_optimizer import PARAM_SPACES
+from pkg.system.strategies.novelty_index import _LORA_TAG
+
+# 锦标赛规模
+TOURNAMENT_SIZE = 2
+# 变异时每个参数被扰动的概率与幅度（占取值范围的比例）
+MUTATION_RATE = 0.3
+MUTATION_SCALE = 0.15
+
+
+@dataclass
+class Individual:
+    """种群中的一个个体"""
+    core_prompt: str                   # 质量后缀之前的 prompt（交叉在此层面进行）
+    params: Dict[str, Any]             # 该个体的数值参数（PARAM_SPACES 中的键）
+    seed: int
+    lens: Optional[str] = None
+    score: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    image_path: Optional[str] = None
+    payload: Dict[str, Any] = field(default_factory=dict)  # 实际提交给 Forge 的完整参数
+
+
+def _phrases(prompt: str) -> List[str]:
+    return [p.strip() for p in _LORA_TAG.sub("", prompt).split(",") if p.strip()]
+
+
+def crossover_prompts(a: str, b: str, rng: random.Random = random) -> str:
+    """短语级均匀交叉：保留 a 的主体短语与 LoRA 标签，描述短语各以 1/2 概率取自两个父代"""
+    phrases_a, phrases_b = _phrases(a), _phrases(b)
+    if not phrases_a:
+        return b
+    head = phrases_a[0]
+    pool = [p for p in phrases_a[1:] if rng.random() < 0.5] + [p for p in phrases_b[1:] if rng.random() < 0.5]
+    seen, descriptors = {head.lower()}, []
+    for phrase in pool:
+        if phrase.lower() not in seen:
+            seen.add(phrase.lower())
+            descriptors.append(phrase)
+    limit = max(len(phrases_a), len(phrases_b)) - 1
+    text = ", ".join([head] + descriptors[:limit])
+    lora_tags = _LORA_TAG.findall(a)
+    return f"{text}, {' '.join(lora_tags)}" if lora_tags else text
+
+
+def crossover_params(a: Dict[str, Any], b: Dict[str, Any], rng: random.Random = random) -> Dict[str, Any]:
+    """参数逐项均匀交叉"""
+    return {k: (a[k] if k not in b or rng.random() < 0.5 else b[k]) for k in a}
+
+
+def mutate_params(params: Dict[str, Any], mode: str, rng: random.Random = random,
+                  rate: float = MUTATION_RATE, scale: float = MUTATION_SCALE) -> Dict[str, Any]:
+    """在该模式的搜索空间内高斯扰动部分参数"""
+    mutated = dict(params)
+    for name, low, high, integer in PARAM_SPACES.get(mode, []):
+        if name not in mutated or rng.random() >= rate:
+            continue
+        value = min(high, max(low, float(mutated[name]) + rng.gauss(0.0, scale * (high - low))))
+        mutated[name] = int(round(value)) if integer else round(value, 2)
+    return mutated
+
+
+def tournament(population: Sequence[Individual], rng: random.Random = random) -> Individual:
+    """锦标赛选择（只在已评分个体中选）"""
+    scored = [ind for ind in population if ind.score is not None]
+    contestants = rng.sample(scored, min(TOURNAMENT_SIZE, len(scored)))
+    return max(contestants, key=lambda ind: ind.score)
+
+
+def next_generation(population: Sequence[Individual], size: int, elite: int, mode: str,
+                    immigrants: Sequence[Individual] = (), rng: random.Random = random) -> List[Individual]:
+    """
+    由上一代产生下一代
+
+    Args:
+        population: 上一代（已评分）
+        size: 种群规模
+        elite: 直接保留的精英数（沿用已有评分，不再渲染）
+        mode: 模型模式（参数变异的搜索空间）
+        immigrants: 本轮新构思的个体（优先于子代加入）
+        rng: 随机数生成器
+
+    Returns:
+        list[Individual]: 新一代（精英在前，score 非 None；其余待渲染）
+    """
+    scored = sorted((ind for ind in population if ind.score is not None), key=lambda ind: ind.score, reverse=True)
+    generation = list(scored[:elite])
+    generation.extend(list(immigrants)[:max(0, size - len(generation))])
+    while len(generation) < size and scored:
+        mother, father = tournament(scored, rng), tournament(scored, rng)
+        generation.append(Individual(
+            core_prompt=crossover_prompts(mother.core_prompt, father.core_prompt, rng),
+            params=mutate_params(crossover_params(mother.params, father.params, rng), mode, rng),
+            seed=rng.randint(1, 9999999999),
+            lens=mother.lens,
+        ))
+    return generation
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt 压缩器 - 按 CLIP token 预算裁剪最终 Prompt
+
+Forge 以 75 token 为一个 chunk 编码 Prompt，超出即多编码一个 chunk（每个采样
+步都要付出这份代价）。这里按逗号切分短语，去掉重复/被包含的冗余短语，
+按优先级（主体 > 质量后缀 > 其余描述）在 chunk 预算内保留短语，再按原顺序拼回。
+`<lora:...>` 标签不参与 CLIP 编码，始终保留。
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from pkg.infrastructure.config import PROMPT_TOKEN_CHUNKS
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = 75
+
+_LORA_TAG = re.compile(r"<(?:lora|lyco|hypernet):[^>]+>", re.IGNORECASE)
+# 去掉权重语法 (word:1.2) / [word] / {word} 以便比较
+_WEIGHT_SYNTAX = re.compile(r"[()\[\]{}]|:\s*\d+(?:\.\d+)?")
+_STOPWORDS = {"a", "an", "the", "of", "in", "on", "with", "and", "at", "by", "to", "for"}
+# 语义等价短语 → 规范形式（仅收录本项目 Prompt 中常见的几组）
+_CANONICAL = {
+    "8k": "8k resolution",
+    "8k uhd": "8k resolution",
+    "ultra detailed": "highly detailed",
+    "extremely detailed": "highly detailed",
+    "intricate details": "highly detailed",
+    "high quality": "best quality",
+    "sharp": "sharp focus",
+    "razor sharp detail": "sharp focus",
+    "photo realistic": "photorealistic",
+    "hyperrealistic": "photorealistic",
+}
+
+
+@dataclass
+class CompactionResult:
+    prompt: str
+    tokens_before: int
+    tokens_after: int
+    chunks_before: int
+    chunks_after: int
+    dropped: List[str] = field(default_factory=list)
+    exact: bool = True  # False 表示 token 数为估算（未能加载 CLIP tokenizer）
+
+
+def _estimate_tokens(text: str) -> int:
+    """无 tokenizer 时的近似：单词/数字/标点各计 1，长单词按 BPE 经验多计"""
+    count = 0
+    for piece in re.findall(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]", text):
+        count += 1 + (len(piece) - 1) // 7 if piece.isalpha() else 1
+    return count
+
+
+def _loaded_service_tokenizer():
+    """进程内已加载 CLIP 推理服务时直接复用其 tokenizer"""
+    import sys
+    module = sys.modules.get("pkg.system.modules.reference.clip_service")
+    if module is None:
+        return None
+    for service in list(module.CLIPInferenceService._instances.values()):
+        tokenizer = getattr(service.processor, "tokenizer", None)
+        if tokenizer is not None:
+            return tokenizer
+    return None
+
+
+_tokenizer_lock = threading.Lock()
+_shared_counter: Optional[Tuple[Callable[[str], int], bool]] = None
+
+
+def get_token_counter() -> Tuple[Callable[[str], int], bool]:
+    """返回 (计数函数, 是否精确)；优先使用 CLIP tokenizer，不可用时回退估算"""
+    global _shared_counter
+    with _tokenizer_lock:
+        if _shared_counter is None:
+            try:
+                tokenizer = _loaded_service_tokenizer()
+                if tokenizer is None:
+                    from transformers import CLIPTokenizer
+                    from pkg.system.modules.reference.reference_encoder import DEFAULT_MODEL_NAME
+
+                    tokenizer = CLIPTokenizer.from_pretrained(DEFAULT_MODEL_NAME)
+                _shared_counter = (
+                    lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"]),
+                    True,
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ CLIP tokenizer 不可用，使用估算计数: {e}")
+                _shared_counter = (_estimate_tokens, False)
+        return _shared_counter
+
+
+def _normalize_phrase(phrase: str) -> str:
+    text = _WEIGHT_SYNTAX.sub(" ", phrase.lower())
+    text = " ".join(text.split())
+    return _CANONICAL.get(text, text)
+
+
+def _content_words(text: str) -> set:
+    return {w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in _STOPWORDS}
+
+
+class PromptCompactor:
+    """CLIP token 预算感知的 Prompt 压缩器"""
+
+    def __init__(self, max_chunks: int = PROMPT_TOKEN_CHUNKS, token_counter: Optional[Callable[[str], int]] = None):
+        """
+        Args:
+            max_chunks: 允许的 75-token chunk 数
+            token_counter: 自定义计数函数（默认使用共享 CLIP tokenizer）
+        """
+        self.max_chunks = max(1, int(max_chunks))
+        self._counter = token_counter
+        self._exact = token_counter is not None
+
+    @property
+    def budget(self) -> int:
+        return self.max_chunks * CHUNK_TOKENS
+
+    def count(self, text: str) -> int:
+        if self._counter is None:
+            self._counter, self._exact = get_token_counter()
+        return self._counter(text)
+
+    @staticmethod
+    def _chunks(tokens: int) -> int:
+        return max(1, -(-tokens // CHUNK_TOKENS))
+
+    @staticmethod
+    def _split(text: str) -> List[str]:
+        return [p.strip() for p in (text or "").split(",") if p.strip()]
+
+    def compact(self, prompt: str, suffix: str = "", subject: str = "",
+                protected: Iterable[str] = ()) -> CompactionResult:
+        """
+        压缩 Prompt
+
+        Args:
+            prompt: 主体 Prompt（DeepSeek 生成 + 参考图标签），首个短语视为主体
+            suffix: 质量后缀（优先级仅次于主体）
+            subject: 用户主题；包含主题词的短语同样视为主体
+            protected: 必须保留的短语（如 LoRA 触发词）
+
+        Returns:
+            CompactionResult
+        """
+        raw = ", ".join(p.strip(", ") for p in (prompt, suffix) if p and p.strip(", "))
+        lora_tags = _LORA_TAG.findall(raw)
+        prompt = _LORA_TAG.sub("", prompt or "")
+        suffix = _LORA_TAG.sub("", suffix or "")
+
+        protected_norm = {_normalize_phrase(p) for p in protected}
+        subject_words = _content_words(subject)
+
+        # (短语, 优先级, 原顺序)；优先级越小越先保留
+        candidates: List[Tuple[str, int, int]] = []
+        for i, phrase in enumerate(self._split(prompt)):
+            norm = _normalize_phrase(phrase)
+            is_subject = i == 0 or norm in protected_norm or (subject_words & _content_words(norm))
+            candidates.append((phrase, 0 if is_subject else 2, len(candidates)))
+        for phrase in self._split(suffix):
+            norm = _normalize_phrase(phrase)
+            candidates.append((phrase, 0 if norm in protected_norm else 1, len(candidates)))
+
+        # 1️⃣ 去冗余：规范形式重复，或词集合被已保留短语完全包含
+        kept: List[Tuple[str, int, int]] = []
+        dropped: List[str] = []
+        seen_words: List[set] = []
+        for phrase, priority, order in sorted(candidates, key=lambda c: (c[1], c[2])):
+            norm = _normalize_phrase(phrase)
+            words = _content_words(norm)
+            redundant = any(words and words <= other for other in seen_words) and norm not in protected_norm
+            if redundant:
+                dropped.append(phrase)
+                continue
+            kept.append((phrase, priority, order))
+            seen_words.append(words)
+
+        tokens_before = self.count(_LORA_TAG.sub("", raw)) if raw else 0
+
+        # 2️⃣ 按优先级装箱（", " 分隔符计 1 token）
+        budget = self.budget
+        used = 0
+        fitted: List[Tuple[str, int, int]] = []
+        for phrase, priority, order in kept:
+            cost = self.count(phrase) + (1 if fitted else 0)
+            if used + cost <= budget or priority == 0 and not fitted:
+                fitted.append((phrase, priority, order))
+                used += cost
+            elif _normalize_phrase(phrase) in protected_norm:
+                fitted.append((phrase, priority, order))
+                used += cost
+            else:
+                dropped.append(phrase)
+
+        # 3️⃣ 分段计数与整体计数可能略有出入：按整体计数再从低优先级末尾修剪
+        def join(items):
+            return ", ".join(p for p, _, _ in sorted(items, key=lambda c: c[2]))
+
+        tokens_after = self.count(join(fitted)) if fitted else 0
+        while tokens_after > budget and len(fitted) > 1:
+            removable = [c for c in fitted[1:] if _normalize_phrase(c[0]) not in protected_norm]
+            if not removable:
+                break
+            victim = max(removable, key=lambda c: (c[1], c[2]))
+            fitted.remove(victim)
+            dropped.append(victim[0])
+            tokens_after = self.count(join(fitted))
+
+        text = join(fitted)
+        if lora_tags:
+            text = f"{text}, {' '.join(lora_tags)}" if text else " ".join(lora_tags)
+        return CompactionResult(
+            prompt=text,
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+            chunks_before=self._chunks(tokens_before),
+            chunks_after=self._chunks(tokens_after),
+            dropped=dropped,
+            exact=self._exact,
+        )
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行历史库 - 跨会话的热启动
+
+每次运行结束后记录主题的 CLIP 文本嵌入、所用底模、最佳 Prompt、最佳参数、
+前 k 张图的 seed 与迭代次数。新会话按主题嵌入查找最相似的高分历史运行，
+用其底模、Prompt 骨架与参数初始化，从已知的好区域开始迭代而不是从默认值重新摸索。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pkg.infrastructure.config import (
+    RUN_HISTORY_ENABLED,
+    RUN_HISTORY_MIN_SCORE,
+    RUN_HISTORY_MIN_SIMILARITY,
+    RUN_HISTORY_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# 最多保留的运行记录数（超出时丢弃最旧的）
+MAX_RECORDS = 500
+# 每次运行保留的最佳 seed 数
+TOP_K_SEEDS = 3
+# 热启动时采纳的参数（其余如尺寸、采样器沿用默认）
+WARM_PARAM_KEYS = ("steps", "cfg_scale", "hr_scale", "hr_second_pass_steps", "denoising_strength")
+
+
+@dataclass
+class RunRecord:
+    """一次完成的运行"""
+    theme: str
+    model: str
+    best_score: float
+    best_prompt: str
+    best_params: Dict[str, Any]
+    top_seeds: List[int]
+    iterations: int
+    embedding: Optional[List[float]] = None
+    created_at: float = field(default_factory=time.time)
+
+
+def summarize_run(theme: str, renders: Sequence[Dict[str, Any]], iterations: int) -> Optional[RunRecord]:
+    """
+    由本次运行的评分记录构建 RunRecord（底模取最佳一张所用的模式）
+
+    Args:
+        theme: 会话主题
+        renders: 每次评分的 {'score', 'mode', 'seed', 'prompt', 'params'} 列表
+        iterations: 实际迭代次数
+
+    Returns:
+        RunRecord | None: 无有效评分时返回 None
+    """
+    if not renders:
+        return None
+    ranked = sorted(renders, key=lambda r: r["score"], reverse=True)
+    best = ranked[0]
+    return RunRecord(
+        theme=theme,
+        model=best["mode"],
+        best_score=float(best["score"]),
+        best_prompt=best["prompt"],
+        best_params={k: best["params"][k] for k in WARM_PARAM_KEYS if k in best["params"]},
+        top_seeds=[int(r["seed"]) for r in ranked[:TOP_K_SEEDS] if r["mode"] == best["mode"]
+                   and r.get("seed") not in (None, -1)],
+        iterations=iterations,
+    )
+
+
+class RunHistoryStore:
+    """运行历史库（JSON 持久化，按主题嵌入做最近邻查找）"""
+
+    def __init__(self, path: str = RUN_HISTORY_PATH,
+                 embedder: Optional[Callable[[Sequence[str]], List[List[float]]]] = None):
+        """
+        Args:
+            path: 持久化文件（空字符串表示不持久化）
+            embedder: 自定义文本编码函数（默认 CLIP；不可用时回退词集合相似度）
+        """
+        self.path = path
+        self._embedder = embedder
+        self._embedder_failed = False
+        self._lock = threading.Lock()
+        self._records: List[RunRecord] = self._load()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        if self._embedder_failed:
+            return None
+        try:
+            if self._embedder is None:
+                from pkg.system.strategies.novelty_index import _clip_text_embedder
+                self._embedder = _clip_text_embedder()
+            vector = np.asarray(self._embedder([text])[0], dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"⚠️ CLIP 文本编码不可用，运行历史回退词集合相似度: {e}")
+            self._embedder_failed = True
+            return None
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    @staticmethod
+    def _lexical_similarity(a: str, b: str) -> float:
+        words_a, words_b = set(a.lower().split()), set(b.lower().split())
+        if not words_a or not words_b:
+            return 0.0
+        return len(words_a & words_b) / len(words_a | words_b)
+
+    def add(self, record: RunRecord) -> None:
+        """写入一次运行并持久化"""
+        if record.embedding is None:
+            record.embedding = self._embed(record.theme)
+        with self._lock:
+            self._records.append(record)
+            del self._records[:-MAX_RECORDS]
+            self._save_locked()
+
+    def nearest(self, theme: str, min_similarity: float = RUN_HISTORY_MIN_SIMILARITY,
+                min_score: float = RUN_HISTORY_MIN_SCORE) -> Optional[Tuple[RunRecord, float]]:
+        """
+        与主题最相似的高分历史运行
+
+        Returns:
+            (RunRecord, float) | None: (记录, 相似度)；无满足阈值的记录时返回 None
+        """
+        with self._lock:
+            candidates = [r for r in self._records if r.best_score >= min_score]
+        if not candidates:
+            return None
+
+        query = self._embed(theme)
+        best, best_sim = None, -1.0
+        for record in candidates:
+            if query is not None and record.embedding is not None and len(record.embedding) == len(query):
+                sim = float(np.dot(query, record.embedding))
+            else:
+                sim = self._lexical_similarity(theme, record.theme)
+            # 相似度相同取分数更高者
+            if sim > best_sim or (sim == best_sim and best is not None and record.best_score > best.best_score):
+                best, best_sim = record, sim
+        if best is None or best_sim < min_similarity:
+            return None
+        return best, best_sim
+
+    def _load(self) -> List[RunRecord]:
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return [RunRecord(**item) for item in json.load(f).get("runs", [])]
+        except Exception as e:
+            logger.warning(f"⚠️ 运行历史读取失败，重新开始记录: {e}")
+            return []
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "runs": [asdict(r) for r in self._records]}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ 运行历史写入失败: {e}")
+
+
+_shared_store: Optional[RunHistoryStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_run_history() -> Optional[RunHistoryStore]:
+    """进程内共享的运行历史库（RUN_HISTORY_ENABLED=false 时返回 None）"""
+    global _shared_store
+    if not RUN_HISTORY_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = RunHistoryStore()
+        return _shared_store
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+主题→底模本地分类器 - CLIP 文本嵌入 + 各模型原型质心
+
+每个底模（RENDER/ANIME，以及有历史样本后的 PREVIEW）维护一个质心：
+种子描述文本的嵌入作为先验，叠加历史运行中被采纳的主题嵌入。
+分类时对主题嵌入与各质心的余弦相似度做 softmax，置信度与最近/次近质心的余弦
+差距都足够时直接给出结果，否则返回 None 交由 DeepSeek 判断（DeepSeek 的结论在
+后台线程回灌为样本）。
+
+分类不在初始化关键路径上加载模型：本地 CLIP 尚未加载时先在后台预热并返回 None。
+CLIP 文本塔只懂英文，以中日韩文字为主的主题不参与分类与学习；带 "(Feedback: ...)"
+后缀的主题记录样本时去掉反馈部分。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from pkg.infrastructure.config import (
+    CLIP_SIDECAR_SOCKET,
+    THEME_CLASSIFIER_ENABLED,
+    THEME_CLASSIFIER_MIN_CONFIDENCE,
+    THEME_CLASSIFIER_MIN_MARGIN,
+    THEME_CLASSIFIER_MIN_SAMPLES,
+    THEME_CLASSIFIER_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# 种子描述：无历史样本时的原型先验
+SEED_TEXTS = {
+    "RENDER": [
+        "a realistic photograph",
+        "professional product photography",
+        "cinematic film still, photorealistic",
+        "nature photography, national geographic",
+        "architectural visualization render",
+        "lifelike portrait photo, dslr",
+    ],
+    "ANIME": [
+        "anime illustration",
+        "manga style artwork",
+        "cute chibi cartoon character",
+        "fantasy game character art",
+        "cel-shaded 2d illustration",
+        "kawaii anime girl, official art",
+    ],
+}
+
+# 种子先验相当于多少个历史样本
+SEED_WEIGHT = 3.0
+# CLIP 的 logit scale（余弦相似度 → softmax 的温度）
+LOGIT_SCALE = 100.0
+
+
+# 引擎在收到用户反馈时重新推荐底模所附加的后缀
+_FEEDBACK_SUFFIX = re.compile(r"\s*\(Feedback:.*\)\s*$", re.DOTALL)
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_LATIN = re.compile(r"[A-Za-z]")
+
+
+def strip_feedback(theme: str) -> str:
+    """去掉 "主题 (Feedback: ...)" 中的反馈部分"""
+    return _FEEDBACK_SUFFIX.sub("", theme or "").strip()
+
+
+def has_feedback(theme: str) -> bool:
+    return bool(_FEEDBACK_SUFFIX.search(theme or ""))
+
+
+def is_english_text(theme: str) -> bool:
+    """CLIP 文本塔只在英文上训练：中日韩文字多于拉丁字母的主题视为不可用"""
+    return len(_LATIN.findall(theme or "")) > len(_CJK.findall(theme or ""))
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm > 0 else list(vector)
+
+
+class ThemeModelClassifier:
+    """基于 CLIP 文本嵌入原型的主题底模分类器"""
+
+    def __init__(
+        self,
+        path: str = THEME_CLASSIFIER_PATH,
+        min_confidence: float = THEME_CLASSIFIER_MIN_CONFIDENCE,
+        min_samples: int = THEME_CLASSIFIER_MIN_SAMPLES,
+        sidecar_socket: Optional[str] = None,
+        min_margin: float = THEME_CLASSIFIER_MIN_MARGIN,
+    ):
+        """
+        Args:
+            path: 历史样本质心的持久化文件（JSON）
+            min_confidence: 直接采纳本地结果所需的最低概率
+            min_samples: 累计历史样本数达到该值前只学习、不做本地决策
+            sidecar_socket: CLIP 边车 socket（None 读取配置，空字符串强制本地推理）
+            min_margin: 最近与次近质心的余弦相似度之差下限（softmax 概率在 logit scale 100 下过于自信）
+        """
+        self.path = path
+        self.min_confidence = min_confidence
+        self.min_samples = min_samples
+        self.min_margin = min_margin
+        socket_path = CLIP_SIDECAR_SOCKET if sidecar_socket is None else sidecar_socket
+        self._client = None
+        if socket_path:
+            from pkg.system.modules.reference.clip_sidecar import CLIPSidecarClient
+            self._client = CLIPSidecarClient(socket_path)
+        self._service = None
+        self._disabled = False  # 本地模型加载失败后不再重试（避免每次分类都卡在加载上）
+        self._lock = threading.Lock()
+        # 样本记录与模型预热在单个后台线程中串行执行，不占用调用方时间
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="theme-classifier")
+        self._warming = False
+
+        self._seeds: Optional[Dict[str, List[float]]] = None
+        # 历史样本：{model: {"sum": [...], "count": n}}
+        self._learned: Dict[str, Dict] = self._load()
+
+    # ------------------------------------------------------------------
+    # 嵌入
+    # ------------------------------------------------------------------
+
+    def _embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """文本 → 归一化 CLIP 嵌入（优先边车，失败回退本地）"""
+        if self._client is not None:
+            try:
+                return [_normalize(v) for v in self._client.embed_texts(texts)]
+            except Exception as e:
+                logger.warning(f"⚠️ CLIP 边车不可用，回退本地推理: {e}")
+                self._client = None
+        if self._disabled:
+            raise RuntimeError("本地 CLIP 不可用")
+        if self._service is None:
+            try:
+                from pkg.system.modules.reference.clip_service import CLIPInferenceService
+                self._service = CLIPInferenceService.get()
+            except Exception:
+                self._disabled = True
+                raise
+        return [_normalize(v) for v in self._service.encode_texts(list(texts)).cpu().tolist()]
+
+    def _ready(self) -> bool:
+        """嵌入是否可立即计算（边车模式，或本地模型已加载）"""
+        return self._client is not None or (self._service is not None and self._seeds is not None)
+
+    def _warm_up(self) -> None:
+        """在后台加载本地模型并计算种子质心（只触发一次）"""
+        with self._lock:
+            if self._warming or self._disabled:
+                return
+            self._warming = True
+
+        def warm():
+            try:
+                self._seed_centroids()
+            except Exception as e:
+                logger.warning(f"⚠️ 主题分类器预热失败: {e}")
+
+        self._background.submit(warm)
+
+    def _seed_centroids(self) -> Dict[str, List[float]]:
+        if self._seeds is None:
+            seeds = {}
+            for model, texts in SEED_TEXTS.items():
+                embeddings = self._embed(texts)
+                seeds[model] = _normalize([sum(col) / len(embeddings) for col in zip(*embeddings)])
+            self._seeds = seeds
+        return self._seeds
+
+    def _centroids(self) -> Dict[str, List[float]]:
+        """种子先验 + 历史样本合成的各模型质心"""
+        seeds = self._seed_centroids()
+        centroids = {}
+        with self._lock:
+            models = set(seeds) | set(self._learned)
+            for model in models:
+                learned = self._learned.get(model)
+                seed = seeds.get(model)
+                if seed is None:
+                    centroids[model] = _normalize(learned["sum"])
+                elif learned is None:
+                    centroids[model] = seed
+                else:
+                    centroids[model] = _normalize(
+                        [SEED_WEIGHT * s + l for s, l in zip(seed, learned["sum"])]
+                    )
+        return centroids
+
+    # ------------------------------------------------------------------
+    # 分类与学习
+    # ------------------------------------------------------------------
+
+    def similarities(self, theme: str) -> Dict[str, float]:
+        """主题与各底模质心的余弦相似度"""
+        (embedding,) = self._embed([theme])
+        return {m: sum(a * b for a, b in zip(embedding, c)) for m, c in self._centroids().items()}
+
+    @staticmethod
+    def softmax(similarities: Dict[str, float]) -> Dict[str, float]:
+        logits = {m: LOGIT_SCALE * v for m, v in similarities.items()}
+        peak = max(logits.values())
+        exp = {m: math.exp(v - peak) for m, v in logits.items()}
+        total = sum(exp.values())
+        return {m: v / total for m, v in exp.items()}
+
+    def probabilities(self, theme: str) -> Dict[str, float]:
+        """主题属于各底模的概率"""
+        return self.softmax(self.similarities(theme))
+
+    def decide(self, similarities: Dict[str, float]) -> Optional[Dict[str, object]]:
+        """按概率与余弦差距两道门槛决定是否采纳本地结果"""
+        ranked = sorted(similarities.items(), key=lambda kv: kv[1], reverse=True)
+        margin = ranked[0][1] - ranked[1][1] if len(ranked) > 1 else 1.0
+        model = ranked[0][0]
+        confidence = self.softmax(similarities)[model]
+        if confidence < self.min_confidence or margin < self.min_margin:
+            return None
+        intent = {"ANIME": "anime", "RENDER": "realistic"}.get(model, "stylized")
+        return {
+            "intent": intent,
+            "model": model,
+            "reason": f"Local CLIP prototype match (p={confidence:.2f}, margin={margin:.3f})",
+            "confidence": confidence,
+        }
+
+    def classify(self, theme: str) -> Optional[Dict[str, object]]:
+        """
+        置信时返回推荐结果，否则返回 None（调用方回退到 DeepSeek）
+
+        Returns:
+            dict | None: {"intent", "model", "reason", "confidence"}，结构与
+            CreativeDirector.analyze_theme_and_recommend_model 一致
+        """
+        if sum(self.sample_counts().values()) < self.min_samples or not is_english_text(theme):
+            return None
+        if not self._ready():
+            # 不在调用方（初始化关键路径）上冷加载模型
+            self._warm_up()
+            return None
+        try:
+            return self.decide(self.similarities(theme))
+        except Exception as e:
+            logger.warning(f"⚠️ 本地主题分类失败: {e}")
+            return None
+
+    def record_async(self, theme: str, model: str, weight: float = 1.0) -> None:
+        """在后台线程中记录样本（计算嵌入可能需要加载模型）"""
+        self._background.submit(self.record, theme, model, weight)
+
+    def record(self, theme: str, model: str, weight: float = 1.0) -> None:
+        """把一次被采纳的 (主题, 底模) 作为样本并入质心并持久化（去掉反馈后缀；非英文主题不记录）"""
+        theme = strip_feedback(theme)
+        if not theme or not is_english_text(theme):
+            return
+        try:
+            (embedding,) = self._embed([theme])
+        except Exception as e:
+            logger.warning(f"⚠️ 记录主题样本失败: {e}")
+            return
+        with self._lock:
+            entry = self._learned.setdefault(model, {"sum": [0.0] * len(embedding), "count": 0})
+            if len(entry["sum"]) != len(embedding):
+                # 嵌入维度变化（更换了 CLIP 模型）：丢弃旧样本
+                entry.update(sum=[0.0] * len(embedding), count=0)
+            entry["sum"] = [s + weight * v for s, v in zip(entry["sum"], embedding)]
+            entry["count"] += weight
+            self._save_locked()
+
+    def sample_counts(self) -> Dict[str, float]:
+        with self._lock:
+            return {m: e["count"] for m, e in self._learned.items()}
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def _load(self) -> Dict[str, Dict]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("classes", {})
+        except Exception as e:
+            logger.warning(f"⚠️ 主题原型文件读取失败，重新开始学习: {e}")
+            return {}
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "classes": self._learned}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ 主题原型文件写入失败: {e}")
+
+
+_shared_classifier: Optional[ThemeModelClassifier] = None
+_shared_lock = threading.Lock()
+
+
+def get_theme_classifier() -> Optional[ThemeModelClassifier]:
+    """进程内共享的分类器（THEME_CLASSIFIER_ENABLED=false 时返回 None）"""
+    global _shared_classifier
+    if not THEME_CLASSIFIER_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_classifier is None:
+            _shared_classifier = ThemeModelClassifier()
+        return _shared_classifier
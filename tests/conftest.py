@@ -0,0 +1,140 @@
+"""
+测试公共夹具：替换 Forge HTTP 请求的假响应、隔离磁盘缓存
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure import forge_client
+from pkg.system.modules.creator import llm_cache
+
+
+class FakeForgeResponse:
+    """requests.post 的假响应（支持上下文管理与 iter_content 流式读取）"""
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def iter_content(self, chunk_size=1):
+        data = json.dumps(self._body).encode()
+        return (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def fake_forge_post(monkeypatch):
+    """
+    把 forge_client 发出的 POST 替换为 handler(url, payload) 返回的 JSON 响应
+
+    Returns:
+        Callable: install(handler) → 请求记录列表 [(url, payload)]
+    """
+    def install(handler):
+        calls = []
+
+        def fake_post(url, json=None, timeout=None, **kwargs):
+            calls.append((url, json))
+            return FakeForgeResponse(handler(url, json))
+
+        monkeypatch.setattr(forge_client.requests, "post", fake_post)
+        return calls
+
+    return install
+
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    """共享 LLM 缓存指向临时目录，测试不写入仓库的 cache/"""
+    cache = llm_cache.LLMResponseCache(str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_shared_cache", cache)
+    return cache
+
+
+class StubDirector:
+    """不调用 DeepSeek 的创意大脑（prompt 固定为主题本身）"""
+
+    UNIVERSAL_LENSES = []
+
+    def __init__(self):
+        self.last_lens = None
+        self.lens_bandit = None
+        self.theme_classifier = None
+
+    def brainstorm_prompt(self, theme, feedback_context="", use_random=True, deadline=None):
+        return theme
+
+    def brainstorm_batch(self, theme, feedback_context="", count=1, deadline=None):
+        return [(None, f"{theme}, variant {k + 1}") for k in range(count)]
+
+
+class StubForge:
+    """记录每次生成请求 (接口, payload)，按 batch_size 返回占位图片"""
+
+    def __init__(self):
+        self.calls = []
+
+    def eta(self, payload):
+        return None
+
+    def _render(self, kind, payload):
+        self.calls.append((kind, dict(payload)))
+        return type("Result", (), {"images": [b"png"] * payload.get("batch_size", 1)})()
+
+    def txt2img(self, payload, timeout=None, timeout_cap=None):
+        return self._render("txt2img", payload)
+
+    def img2img(self, payload, timeout=None, timeout_cap=None):
+        return self._render("img2img", payload)
+
+    def map_txt2img(self, payloads, timeout=None, timeout_cap=None):
+        for index, payload in enumerate(payloads):
+            yield index, self._render("txt2img", payload), 0.0
+
+    def __len__(self):
+        return 1
+
+
+@pytest.fixture
+def stub_engine(tmp_path, monkeypatch):
+    """
+    不访问 DeepSeek / Forge / 磁盘历史的 DiffuServoV4
+
+    Returns:
+        Callable: build(rate, theme=..., model=...) → 引擎；rate(image_path) 返回评分结果，
+        引擎的 forge 为 StubForge
+    """
+    from pkg.system import engine as engine_module
+
+    def build(rate, theme="red fox in snow", model="RENDER"):
+        init = {"forge_ok": True, "project_id": "stub_test", "timed_out": [], "reference": {
+            "initial_model_choice": model, "model_locked": False, "locked_model": None,
+            "reference_style_analysis": None}}
+        monkeypatch.setattr(engine_module, "OUTPUT_DIR", str(tmp_path))
+        monkeypatch.setattr(engine_module, "CreativeDirector", StubDirector)
+        monkeypatch.setattr(engine_module.EngineInitializer, "initialize_concurrently",
+                            staticmethod(lambda *args, **kwargs: init))
+        monkeypatch.setattr(engine_module, "check_forge_health", lambda: True)
+        monkeypatch.setattr(engine_module, "get_run_history", lambda: None)
+        monkeypatch.setattr(engine_module, "get_forge_client", StubForge)
+        monkeypatch.setattr(engine_module, "get_checkpoint_manager", lambda: None)
+        monkeypatch.setattr(engine_module, "rate_image", lambda image_path, *args, **kwargs: rate(image_path))
+        monkeypatch.setattr(engine_module.time, "sleep", lambda seconds: None)
+        return engine_module.DiffuServoV4(theme)
+
+    return build
@@ -0,0 +1,88 @@
+"""
+CLIP 微批处理队列测试
+任务6: 验证 MicroBatcher 的攒批、结果分发与异常传播（不加载真实模型）
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.modules.reference.clip_service import MicroBatcher
+
+
+def test_batcher_merges_concurrent_requests():
+    """并发提交的请求应被合并为少量批次，且结果按请求对应"""
+    batch_sizes = []
+
+    def batch_fn(items):
+        batch_sizes.append(len(items))
+        return [x * 2 for x in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher.submit(i).result(timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    print(f"📦 批次大小: {batch_sizes}")
+    assert results == {i: i * 2 for i in range(8)}
+    assert len(batch_sizes) < 8
+    assert batcher.items == 8
+
+
+def test_batcher_respects_max_batch_size():
+    """单批数量不超过 max_batch_size"""
+    batch_sizes = []
+
+    def batch_fn(items):
+        batch_sizes.append(len(items))
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=3, max_wait_ms=20)
+    futures = [batcher.submit(i) for i in range(10)]
+    assert [f.result(timeout=5) for f in futures] == list(range(10))
+    batcher.close()
+
+    assert max(batch_sizes) <= 3
+
+
+def test_batcher_propagates_errors():
+    """batch_fn 抛出的异常应传递给该批次所有调用方，且 worker 继续工作"""
+    calls = {"n": 0}
+
+    def batch_fn(items):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise ValueError("boom")
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=0)
+    failed = batcher.submit("a")
+    try:
+        failed.result(timeout=5)
+        assert False, "应抛出异常"
+    except ValueError:
+        pass
+
+    assert batcher.submit("b").result(timeout=5) == "b"
+    batcher.close()
+
+
+if __name__ == "__main__":
+    test_batcher_merges_concurrent_requests()
+    test_batcher_respects_max_batch_size()
+    test_batcher_propagates_errors()
+    print("✅ 微批处理测试通过")
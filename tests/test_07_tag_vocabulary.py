@@ -0,0 +1,57 @@
+"""
+标签词表检索测试
+任务7: 验证 TagVocabulary 的 mmap 加载、top-k 排序与排除逻辑（不加载真实模型）
+"""
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.modules.reference.tag_vocabulary import (
+    EMBEDDINGS_FILE,
+    META_FILE,
+    TAGS_FILE,
+    TagVocabulary,
+)
+
+
+def _write_vocab(directory: Path):
+    embeddings = np.eye(4, dtype=np.float16)
+    np.save(directory / EMBEDDINGS_FILE, embeddings)
+    (directory / TAGS_FILE).write_text("red\ngreen\nblue\nneon glow\n", encoding="utf-8")
+    (directory / META_FILE).write_text(json.dumps({"model_name": "dummy"}), encoding="utf-8")
+
+
+def test_top_k_ranks_by_cosine():
+    """查询向量最接近的标签应排在最前，分数降序"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_vocab(Path(tmp))
+        for chunk_rows in (4096, 3, 1):  # 单块 / 跨块边界
+            vocab = TagVocabulary.load(tmp, chunk_rows=chunk_rows)
+            match = vocab.top_k([0.1, 0.2, 3.0, 0.5], k=2)
+            print(f"🏷️ {match.tags} {match.scores}")
+            assert match.tags == ["blue", "neon glow"]
+            assert match.scores[0] > match.scores[1]
+            assert vocab.model_name == "dummy"
+
+
+def test_top_k_excludes_tags():
+    """排除项不应出现在结果中，且仍返回 k 个标签"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_vocab(Path(tmp))
+        vocab = TagVocabulary.load(tmp)
+        match = vocab.top_k([0.1, 0.2, 3.0, 0.5], k=2, exclude=["Blue"])
+        assert match.tags == ["neon glow", "green"]
+
+
+if __name__ == "__main__":
+    test_top_k_ranks_by_cosine()
+    test_top_k_excludes_tags()
+    print("✅ 标签词表测试通过")
@@ -0,0 +1,90 @@
+"""
+LLM 响应缓存测试
+任务8: 验证 LLMResponseCache 的键规范化、TTL 过期、容量淘汰与命中率统计
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.modules.creator import director as director_module
+from pkg.system.modules.creator.director import CreativeDirector
+from pkg.system.modules.creator.llm_cache import LLMResponseCache
+
+
+def test_cache_hit_with_normalized_theme():
+    """主题大小写/空白不同应命中同一条目；模板版本不同则不命中"""
+    cache = LLMResponseCache(":memory:", ttl_seconds=60, max_entries=10)
+    cache.set("recommend_model", "Magic  Forest ", "deepseek", 1, {"model": "ANIME"})
+
+    assert cache.get("recommend_model", "magic forest", "deepseek", 1) == {"model": "ANIME"}
+    assert cache.get("recommend_model", "magic forest", "deepseek", 2) is None
+    print(f"📊 {cache.stats()}")
+    assert cache.hits == 1 and cache.misses == 1
+    assert cache.hit_rate == 0.5
+
+
+def test_cache_ttl_expiry():
+    """超过 TTL 的条目视为未命中"""
+    cache = LLMResponseCache(":memory:", ttl_seconds=0.05, max_entries=10)
+    cache.set("project_name", "cat", "deepseek", 1, "Cat Portrait")
+    time.sleep(0.1)
+    assert cache.get("project_name", "cat", "deepseek", 1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    """超出容量时淘汰最久未访问的条目"""
+    cache = LLMResponseCache(":memory:", ttl_seconds=0, max_entries=2)
+    cache.set("project_name", "a", "m", 1, "A")
+    time.sleep(0.01)
+    cache.set("project_name", "b", "m", 1, "B")
+    time.sleep(0.01)
+    assert cache.get("project_name", "a", "m", 1) == "A"  # 刷新 a 的访问时间
+    time.sleep(0.01)
+    cache.set("project_name", "c", "m", 1, "C")
+
+    assert cache.get("project_name", "b", "m", 1) is None
+    assert cache.get("project_name", "a", "m", 1) == "A"
+    assert cache.get("project_name", "c", "m", 1) == "C"
+
+
+def test_lora_cache_keyed_on_full_library(tmp_path, monkeypatch):
+    """LoRA 库的键相同但描述不同时不应命中旧推荐"""
+    calls = []
+
+    class StubClient:
+        def __init__(self, timeout=None):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def post(self, url, headers=None, json=None):
+            calls.append(json)
+            body = {"choices": [{"message": {"content": '{"lora_key": "INK", "weight": 0.7}'}}]}
+            return type("Resp", (), {"raise_for_status": lambda self: None, "json": lambda self: body})()
+
+    monkeypatch.setattr(director_module.httpx, "Client", StubClient)
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite3"), ttl_seconds=0, max_entries=10)
+    director = CreativeDirector(cache=cache)
+
+    director.recommend_lora("ink forest", {"INK": {"weight": 0.6, "desc": "ink wash"}})
+    director.recommend_lora("ink forest", {"INK": {"weight": 0.6, "desc": "ink wash"}})
+    assert len(calls) == 1
+    director.recommend_lora("ink forest", {"INK": {"weight": 0.8, "desc": "bold ink outlines"}})
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    test_cache_hit_with_normalized_theme()
+    test_cache_ttl_expiry()
+    test_cache_evicts_least_recently_used()
+    print("✅ LLM 缓存测试通过")
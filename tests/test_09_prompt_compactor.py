@@ -0,0 +1,63 @@
+"""
+Prompt 压缩器测试
+任务9: 验证 PromptCompactor 的 chunk 预算、冗余短语去除、主体/LoRA 标签保留
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.prompt_compactor import PromptCompactor, _estimate_tokens
+
+QUALITY_SUFFIX = ", 8k resolution, masterpiece, photorealistic, sharp focus, highly detailed, cinematic lighting"
+LONG_PROMPT = (
+    "tequila sunrise cocktail in tall glass, layered orange and red gradient, condensation droplets on glass surface, "
+    "crushed ice, citrus slice garnish, warm golden hour backlight, volumetric light rays, glossy reflections, "
+    "shallow depth of field, bokeh bar background, bokeh background, intricate details, moody atmosphere, "
+    "rich saturated colors, macro photography, 8k, cinematic lighting, <lora:foo:0.7>"
+)
+
+
+def test_compacts_into_single_chunk():
+    """超出预算的 Prompt 被裁剪到 1 个 chunk，主体与质量后缀保留"""
+    compactor = PromptCompactor(max_chunks=1, token_counter=_estimate_tokens)
+    result = compactor.compact(LONG_PROMPT, suffix=QUALITY_SUFFIX, subject="tequila sunrise")
+    print(f"✂️ {result.tokens_before}→{result.tokens_after}: {result.prompt}")
+
+    assert result.chunks_before > 1
+    assert result.chunks_after == 1
+    assert result.tokens_after <= compactor.budget
+    assert result.prompt.startswith("tequila sunrise cocktail in tall glass")
+    assert "sharp focus" in result.prompt
+    assert result.prompt.endswith("<lora:foo:0.7>")
+
+
+def test_removes_redundant_phrases():
+    """同义/被包含的短语只保留一份"""
+    compactor = PromptCompactor(max_chunks=1, token_counter=_estimate_tokens)
+    result = compactor.compact(LONG_PROMPT, suffix=QUALITY_SUFFIX, subject="tequila sunrise")
+
+    phrases = [p.strip() for p in result.prompt.split(",")]
+    assert phrases.count("cinematic lighting") == 1
+    assert "8k" not in phrases           # 与 "8k resolution" 等价
+    assert "intricate details" not in phrases  # 与 "highly detailed" 等价
+    assert "bokeh background" in result.dropped
+
+
+def test_short_prompt_unchanged():
+    """预算内的 Prompt 只做拼接，不丢弃短语"""
+    compactor = PromptCompactor(max_chunks=1, token_counter=_estimate_tokens)
+    result = compactor.compact("a red fox in snow", suffix=", masterpiece, best quality")
+
+    assert result.prompt == "a red fox in snow, masterpiece, best quality"
+    assert result.dropped == []
+
+
+if __name__ == "__main__":
+    test_compacts_into_single_chunk()
+    test_removes_redundant_phrases()
+    test_short_prompt_unchanged()
+    print("✅ Prompt 压缩测试通过")
@@ -0,0 +1,104 @@
+"""
+Prompt 新颖度索引测试
+任务10: 验证 PromptNoveltyIndex 的近重复判定、参数签名隔离、Prompt 扰动，以及仍被复用的图片不被清理
+"""
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.novelty_index import PromptNoveltyIndex, params_signature, perturb_prompt
+
+
+def _unavailable_embedder(texts):
+    raise RuntimeError("CLIP 不可用")
+
+
+def _bag_of_words_embedder(texts):
+    """确定性的词袋嵌入，模拟 CLIP 文本编码"""
+    vocab = ["fox", "snow", "forest", "red", "night", "city", "neon", "rain"]
+    return [[float(t.lower().count(w)) for w in vocab] for t in texts]
+
+
+PARAMS = {
+    "steps": 20, "cfg_scale": 7.0, "sampler_name": "Euler a", "width": 832, "height": 1216,
+    "enable_hr": False, "override_settings": {"sd_model_checkpoint": "render.safetensors"},
+}
+
+
+def test_detects_near_duplicate_with_embeddings():
+    """同签名下嵌入相似度达到阈值视为近重复"""
+    index = PromptNoveltyIndex(threshold=0.97, embedder=_bag_of_words_embedder)
+    signature = params_signature(PARAMS)
+    index.add("red fox in snow forest", signature, "iter1.png", {"final_score": 0.72})
+
+    duplicate = index.find_duplicate("a red fox, snow, forest", signature)
+    assert duplicate is not None
+    entry, similarity = duplicate
+    print(f"🔁 相似度 {similarity:.3f}")
+    assert entry.score == 0.72
+    assert index.find_duplicate("neon city at night in rain", signature) is None
+
+
+def test_signature_isolates_models_and_params():
+    """底模或关键参数不同的 Prompt 不算重复；seed 不参与签名"""
+    index = PromptNoveltyIndex(embedder=_unavailable_embedder)
+    signature = params_signature(PARAMS)
+    index.add("red fox in snow forest", signature, "iter1.png", {"final_score": 0.72})
+
+    other_model = dict(PARAMS, override_settings={"sd_model_checkpoint": "anime.safetensors"})
+    other_cfg = dict(PARAMS, cfg_scale=8.5)
+    new_seed = dict(PARAMS, seed=12345)
+    assert index.find_duplicate("red fox in snow forest", params_signature(other_model)) is None
+    assert index.find_duplicate("red fox in snow forest", params_signature(other_cfg)) is None
+    assert index.find_duplicate("red fox in snow forest", params_signature(new_seed)) is not None
+
+
+def test_perturb_keeps_subject_and_lora():
+    """扰动保留主体短语与 LoRA 标签，并去掉一个描述短语"""
+    prompt = "red fox in snow, soft light, pine trees, bokeh, film grain, <lora:detail:0.6>"
+    perturbed = perturb_prompt(prompt, rng=random.Random(3))
+    print(f"🎲 {perturbed}")
+
+    assert perturbed.startswith("red fox in snow, ")
+    assert perturbed.endswith("<lora:detail:0.6>")
+    assert len(perturbed.split(",")) == len(prompt.split(",")) - 1
+
+
+def test_pruning_keeps_reusable_images(tmp_path, monkeypatch):
+    """超过 20 张时删除最旧的图片，但种群个体与历史最佳的图片保留"""
+    from pkg.system import engine as engine_module
+    from pkg.system.engine import DiffuServoV4
+    from pkg.system.strategies.population import Individual
+
+    monkeypatch.setattr(engine_module, "OUTPUT_DIR", str(tmp_path))
+    engine = DiffuServoV4.__new__(DiffuServoV4)
+    engine.project_id, engine.render_payloads = "proj", {}
+    engine.population, engine.history = [], []
+
+    paths = []
+    for i in range(25):
+        paths.append(engine._save_image(b"png", f"proj_iter{i}.png"))
+        os.utime(paths[-1], (time.time() - 100 + i, time.time() - 100 + i))
+        if i == 0:
+            engine.population = [Individual(core_prompt="fox", params={}, seed=1, image_path=paths[0])]
+        if i == 2:
+            engine.history = [{'score': 0.9, 'image_path': paths[1]}, {'score': 0.4, 'image_path': paths[2]}]
+
+    remaining = set(os.listdir(tmp_path / "proj"))
+    assert len(remaining) == 20
+    assert {"proj_iter0.png", "proj_iter1.png", "proj_iter24.png"} <= remaining
+    assert "proj_iter2.png" not in remaining
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
+    print("✅ Prompt 新颖度测试通过")
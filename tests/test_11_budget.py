@@ -0,0 +1,140 @@
+"""
+迭代预算测试
+任务11: 验证 Deadline 的剩余时间、超时收紧、重试判断与子预算划分，
+以及 SessionBudget 的档位、用量计费与耗尽判定；本地估算分不进入引擎的历史与收敛判断
+"""
+
+import math
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import pytest
+
+from pkg.infrastructure.budget import Deadline, MIN_ATTEMPT_SECONDS, SessionBudget
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_unlimited_deadline_keeps_original_behaviour():
+    """不限时的预算不改变原有超时与重试"""
+    deadline = Deadline.ensure(None)
+    assert deadline.unlimited
+    assert math.isinf(deadline.remaining())
+    assert deadline.timeout(30) == 30
+    assert deadline.can_retry_after(10)
+    assert deadline.sub(fraction=0.25).unlimited
+
+
+def test_timeouts_shrink_with_remaining_budget():
+    """超时不超过剩余时间；剩余不足一次请求时停止重试"""
+    clock = FakeClock()
+    deadline = Deadline(40, clock=clock)
+    assert deadline.timeout(90) == 40
+
+    clock.now += 30
+    assert deadline.timeout(90) == 10
+    assert deadline.can_retry_after(5)
+    assert not deadline.can_retry_after(8)
+
+    clock.now += 10 - MIN_ATTEMPT_SECONDS / 2
+    assert not deadline.allows()
+    clock.now += 10
+    assert deadline.expired() and deadline.remaining() == 0
+
+
+def test_sub_budget_never_outlives_parent():
+    """子预算取比例/秒数与父预算剩余时间中的较小者"""
+    clock = FakeClock()
+    deadline = Deadline(100, clock=clock)
+    assert deadline.sub(fraction=0.25).remaining() == 25
+    assert deadline.sub(seconds=10, fraction=0.5).remaining() == 10
+
+    clock.now += 95
+    assert deadline.sub(seconds=30).remaining() == 5
+
+
+def test_session_budget_exhaustion():
+    """GPU 秒与评分次数任一耗尽即停止；迭代预算不超过剩余墙钟时间"""
+    clock = FakeClock()
+    budget = SessionBudget(wall_seconds=60, gpu_seconds=20, judge_calls=3, clock=clock)
+    assert budget.exhausted_reason() is None
+    assert budget.iteration_deadline(180).remaining() == 60
+
+    budget.charge_gpu(12.5)
+    budget.charge_judge()
+    clock.now += 50
+    assert budget.iteration_deadline(180).remaining() == 10
+    assert budget.exhausted_reason() is None
+
+    budget.charge_gpu(8)
+    assert budget.exhausted_reason() == "gpu"
+    snapshot = budget.snapshot()
+    assert snapshot["gpu_seconds"] == {"used": 20.5, "limit": 20}
+    assert snapshot["judge_calls"] == {"used": 1, "limit": 3}
+
+
+def test_session_budget_tiers():
+    """档位默认值可被单项覆盖；未知档位报错"""
+    budget = SessionBudget.from_tier("standard", judge_calls=10, gpu_seconds=None)
+    assert budget.judge_calls == 10
+    assert budget.gpu_seconds == 300
+    assert SessionBudget.from_tier("unlimited").iteration_deadline().unlimited
+    with pytest.raises(ValueError):
+        SessionBudget.from_tier("platinum")
+
+
+@pytest.mark.parametrize("overrides", [
+    {"wall_seconds": -5}, {"gpu_seconds": 0}, {"judge_calls": "10"},
+    {"judge_calls": True}, {"wall_seconds": float("nan")}, {"gpu_seconds": float("inf")},
+])
+def test_session_budget_rejects_invalid_overrides(overrides):
+    """客户端传入的预算项必须为正的有限数"""
+    with pytest.raises(ValueError):
+        SessionBudget.from_tier("standard", **overrides)
+
+
+def test_deadline_remembers_initial_seconds():
+    """seconds 为创建时的总预算（子预算按划出的秒数计），不随时间减少"""
+    clock = FakeClock()
+    deadline = Deadline(40, clock=clock)
+    clock.now += 25
+    assert deadline.seconds == 40
+    assert not deadline.allows(deadline.seconds * 0.5)
+    assert deadline.sub(fraction=0.5).seconds == pytest.approx(7.5)
+    assert Deadline().seconds is None
+
+
+def test_estimated_scores_stay_out_of_history(stub_engine):
+    """评审不可用时的本地估算分不进入历史、最佳记录与达标判断"""
+    engine = stub_engine(lambda path: {
+        "final_score": 0.99, "concept_score": 0.99, "quality_score": 0.0, "aesthetics_score": 0.0,
+        "reasonableness_score": 0.0, "api_used": "local", "estimated": True})
+    engine.max_iterations = 3
+    engine.run()
+
+    assert len(engine.forge.calls) == 3
+    assert engine.history == [] and engine.score_buffer == []
+    assert engine.best_score < 0.99 and engine.best_result() is None
+    assert engine.state == engine.STATE_INIT
+
+
+if __name__ == "__main__":
+    test_unlimited_deadline_keeps_original_behaviour()
+    test_timeouts_shrink_with_remaining_budget()
+    test_sub_budget_never_outlives_parent()
+    test_session_budget_exhaustion()
+    test_session_budget_tiers()
+    test_deadline_remembers_initial_seconds()
+    print("✅ 迭代预算测试通过")
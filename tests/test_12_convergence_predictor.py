@@ -0,0 +1,84 @@
+"""
+收敛预测测试
+任务12: 验证 ConvergencePredictor 的达标概率估计、提前停止判定与先验持久化，
+以及 SessionBudget 对剩余可用迭代次数的估算
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.budget import SessionBudget
+from pkg.system.strategies.convergence_predictor import ConvergencePredictor
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_plateau_far_below_target_stops():
+    """评分长期停滞且远低于目标时建议停止"""
+    predictor = ConvergencePredictor(min_probability=0.05, min_observations=5, prior_path="")
+    scores = [0.52, 0.55, 0.53, 0.54, 0.55, 0.53, 0.54]
+    stop, p = predictor.should_stop(scores, target=0.85, remaining=10)
+    print(f"🔮 停滞轨迹达标概率 {p:.2%}")
+    assert stop and p < 0.05
+
+
+def test_rising_trajectory_keeps_going():
+    """稳步上升、接近目标的轨迹不停止；样本不足时不做判断"""
+    predictor = ConvergencePredictor(min_probability=0.05, min_observations=5, prior_path="")
+    scores = [0.60, 0.64, 0.69, 0.72, 0.76, 0.79]
+    stop, p = predictor.should_stop(scores, target=0.85, remaining=10)
+    print(f"🔮 上升轨迹达标概率 {p:.2%}")
+    assert not stop and p > 0.5
+
+    assert predictor.should_stop([0.3, 0.3], target=0.85, remaining=10) == (False, 1.0)
+    assert predictor.probability(scores + [0.86], target=0.85, remaining=0) == 1.0
+    assert predictor.probability(scores, target=0.85, remaining=0) == 0.0
+
+
+def test_prior_is_learned_and_persisted(tmp_path):
+    """完成的运行并入先验并持久化，新实例可读回"""
+    prior_path = str(tmp_path / "prior.json")
+    predictor = ConvergencePredictor(prior_path=prior_path)
+    predictor.record_run([0.5, 0.6, 0.7, 0.8])
+    assert predictor.prior["runs"] == 1
+    assert abs(predictor.prior["slope"] - 0.1) < 1e-9
+
+    reloaded = ConvergencePredictor(prior_path=prior_path)
+    assert reloaded.prior == predictor.prior
+
+
+def test_affordable_iterations_from_budget():
+    """按已用量的平均速率估算剩余迭代次数；不限预算返回 None"""
+    clock = FakeClock()
+    budget = SessionBudget(wall_seconds=100, gpu_seconds=60, judge_calls=10, clock=clock)
+    assert budget.affordable_iterations(0) == 10
+
+    clock.now += 20
+    budget.charge_gpu(15)
+    budget.charge_judge(2)
+    # 墙钟: 80/10 = 8，GPU: 45/7.5 = 6，评分: 8
+    assert budget.affordable_iterations(2) == 6
+    assert SessionBudget().affordable_iterations(5) is None
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    test_plateau_far_below_target_stops()
+    test_rising_trajectory_keeps_going()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_prior_is_learned_and_persisted(Path(tmp))
+    test_affordable_iterations_from_budget()
+    print("✅ 收敛预测测试通过")
@@ -0,0 +1,56 @@
+"""
+贝叶斯参数优化测试
+任务13: 验证 BayesianParameterOptimizer 的参数编码、按模式隔离的观测，
+以及期望改进在合成评分曲面上逼近最优参数
+"""
+
+import random
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.bayes_optimizer import PARAM_SPACES, BayesianParameterOptimizer
+
+
+def _synthetic_score(params):
+    """RENDER 模式的合成评分：steps≈26、cfg≈5.5 最优"""
+    return 0.9 - ((params["steps"] - 26) / 18) ** 2 - ((params["cfg_scale"] - 5.5) / 5) ** 2
+
+
+def test_proposals_stay_in_space_and_modes_are_isolated():
+    """建议值落在搜索空间内（整数参数取整）；不同模式的观测互不影响"""
+    optimizer = BayesianParameterOptimizer(rng=random.Random(0))
+    defaults = {"steps": 20, "cfg_scale": 7.0, "hr_scale": 1.5, "hr_second_pass_steps": 10, "denoising_strength": 0.4}
+    for _ in range(5):
+        proposal = optimizer.propose("RENDER", defaults)
+        for name, low, high, integer in PARAM_SPACES["RENDER"]:
+            assert low <= proposal[name] <= high
+            assert isinstance(proposal[name], int) == integer
+        optimizer.observe("RENDER", proposal, _synthetic_score(proposal))
+
+    assert optimizer.best_params("ANIME") is None
+    assert optimizer.propose("UNKNOWN", defaults) is None
+
+
+def test_expected_improvement_finds_better_parameters():
+    """迭代若干轮后最佳参数明显优于默认参数"""
+    optimizer = BayesianParameterOptimizer(rng=random.Random(7))
+    params = {"steps": 20, "cfg_scale": 7.0, "hr_scale": 1.5, "hr_second_pass_steps": 10, "denoising_strength": 0.4}
+    baseline = _synthetic_score(params)
+    optimizer.observe("RENDER", params, baseline)
+    for _ in range(12):
+        params = dict(params, **optimizer.propose("RENDER", params))
+        optimizer.observe("RENDER", params, _synthetic_score(params))
+
+    best = optimizer.best_params("RENDER")
+    print(f"🧪 最佳参数: {best}")
+    assert _synthetic_score(best) > baseline + 0.03
+
+
+if __name__ == "__main__":
+    test_proposals_stay_in_space_and_modes_are_isolated()
+    test_expected_improvement_finds_better_parameters()
+    print("✅ 贝叶斯参数优化测试通过")
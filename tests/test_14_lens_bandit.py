@@ -0,0 +1,74 @@
+"""
+透镜老虎机测试
+任务14: 验证 LensBandit 的 Thompson 采样向高分透镜集中、历史统计热启动，
+以及 LensStatsStore 的按主题簇累计与持久化
+"""
+
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.lens_bandit import LensBandit, LensStatsStore, lens_key
+
+LENSES = [
+    ("Emphasis on Lighting: (e.g., cinematic)", 25),
+    ("Emphasis on Material: (e.g., metallic)", 25),
+    ("Emphasis on Color Palette: (e.g., pastel)", 20),
+    ("Emphasis on Composition: (e.g., macro)", 5),
+]
+
+
+def test_sampling_concentrates_on_productive_lens():
+    """持续高分的透镜被更频繁选中；同一批内透镜不重复"""
+    bandit = LensBandit(LENSES, rng=random.Random(1))
+    payoff = {"Emphasis on Lighting": 0.55, "Emphasis on Material": 0.55,
+              "Emphasis on Color Palette": 0.55, "Emphasis on Composition": 0.85}
+    for _ in range(40):
+        lens = bandit.choose(1)[0]
+        bandit.update(lens, payoff[lens_key(lens)])
+
+    picks = Counter(lens_key(bandit.choose(1)[0]) for _ in range(200))
+    print(f"🎰 选择分布: {dict(picks)}")
+    assert picks.most_common(1)[0][0] == "Emphasis on Composition"
+
+    batch = bandit.choose(6)
+    assert len(batch) == 6 and len(set(batch[:4])) == 4
+
+
+def test_warm_start_and_unknown_lens():
+    """历史统计抬高先验（折算观测数有上限）；未知透镜的评分被忽略"""
+    cold = LensBandit(LENSES)
+    warm = LensBandit(LENSES, warm_start={"Emphasis on Composition": [90.0, 100]})
+    assert warm.posterior_means()["Emphasis on Composition"] > cold.posterior_means()["Emphasis on Composition"] + 0.2
+
+    warm.update("Emphasis on Lighting & Atmosphere & Technical Excellence: fixed", 0.9)
+    warm.update(None, 0.9)
+    assert warm.session_stats == {}
+
+
+def test_stats_store_merges_per_cluster(tmp_path):
+    """会话统计按主题簇累加并持久化"""
+    path = str(tmp_path / "lens_stats.json")
+    store = LensStatsStore(path)
+    store.merge("ANIME", {"Emphasis on Lighting": [1.5, 2]})
+    store.merge("ANIME", {"Emphasis on Lighting": [0.7, 1]})
+
+    reloaded = LensStatsStore(path)
+    total, count = reloaded.get("ANIME")["Emphasis on Lighting"]
+    assert abs(total - 2.2) < 1e-9 and count == 3
+    assert reloaded.get("RENDER") == {}
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    test_sampling_concentrates_on_productive_lens()
+    test_warm_start_and_unknown_lens()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_stats_store_merges_per_cluster(Path(tmp))
+    print("✅ 透镜老虎机测试通过")
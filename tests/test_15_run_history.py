@@ -0,0 +1,134 @@
+"""
+运行历史热启动测试
+任务15: 验证 summarize_run 的最佳结果提取，RunHistoryStore 的
+最近邻查找（相似度/分数阈值）与持久化，以及 run() 按顺序尝试历史 seed
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.run_history import RunHistoryStore, RunRecord, summarize_run
+
+
+def _bag_of_words_embedder(texts):
+    """确定性的词袋嵌入，模拟 CLIP 文本编码"""
+    vocab = ["fox", "snow", "forest", "red", "cyberpunk", "city", "neon", "girl"]
+    return [[float(t.lower().count(w)) for w in vocab] for t in texts]
+
+
+def _render(score, seed, mode="RENDER", steps=20):
+    return {"score": score, "mode": mode, "seed": seed, "prompt": f"prompt {seed}",
+            "params": {"steps": steps, "cfg_scale": 7.0, "seed": seed, "width": 832}}
+
+
+def test_summarize_run_keeps_best_prompt_params_and_seeds():
+    """最佳 Prompt/参数取最高分一张，seed 只保留同一底模的前 k 个"""
+    renders = [_render(0.62, 11), _render(0.81, 22, steps=26), _render(0.77, 33, mode="PREVIEW"),
+               _render(0.74, 44), _render(0.70, 55)]
+    record = summarize_run("red fox in snow", renders, iterations=5)
+
+    assert record.model == "RENDER" and record.best_score == 0.81
+    assert record.best_prompt == "prompt 22"
+    assert record.best_params == {"steps": 26, "cfg_scale": 7.0}
+    assert record.top_seeds == [22, 44]
+    assert summarize_run("empty", [], iterations=0) is None
+
+
+def test_nearest_respects_similarity_and_score(tmp_path):
+    """只返回足够相似且分数达标的运行；记录可持久化读回"""
+    path = str(tmp_path / "run_history.json")
+    store = RunHistoryStore(path, embedder=_bag_of_words_embedder)
+    store.add(summarize_run("red fox in snow forest", [_render(0.86, 1)], iterations=4))
+    store.add(summarize_run("neon cyberpunk city", [_render(0.55, 2)], iterations=20))
+
+    match = store.nearest("a red fox, snow forest", min_similarity=0.9, min_score=0.78)
+    assert match is not None
+    record, similarity = match
+    print(f"📚 最近邻: {record.theme} ({similarity:.2f})")
+    assert record.top_seeds == [1]
+
+    assert store.nearest("neon cyberpunk city", min_similarity=0.9, min_score=0.78) is None
+    assert store.nearest("girl", min_similarity=0.9, min_score=0.0) is None
+
+    reloaded = RunHistoryStore(path, embedder=_bag_of_words_embedder)
+    assert len(reloaded) == 2
+
+
+class StubDirector:
+    """不调用 DeepSeek 的创意大脑"""
+
+    UNIVERSAL_LENSES = []
+
+    def __init__(self):
+        self.last_lens = None
+        self.lens_bandit = None
+        self.theme_classifier = None
+
+    def brainstorm_prompt(self, theme, feedback_context="", use_random=True, deadline=None):
+        return "red fox in snow"
+
+
+class StubHistory:
+    def __init__(self, record):
+        self.record = record
+
+    def nearest(self, theme):
+        return self.record, 0.95
+
+    def add(self, record):
+        pass
+
+
+class StubForge:
+    """记录每次 txt2img 请求的 seed"""
+
+    def __init__(self):
+        self.seeds = []
+
+    def eta(self, payload):
+        return None
+
+    def txt2img(self, payload, timeout=None, timeout_cap=None):
+        self.seeds.append(payload["seed"])
+        return type("Result", (), {"images": [b"png"]})()
+
+
+def test_run_tries_warm_start_seeds_in_order(tmp_path, monkeypatch):
+    """run() 与 generate() 都会推进 iteration，历史 seed 仍从第一个开始依次尝试"""
+    from pkg.system import engine as engine_module
+
+    record = RunRecord(theme="red fox in snow", model="RENDER", best_score=0.86, best_prompt="red fox",
+                       best_params={}, top_seeds=[111, 222, 333], iterations=4)
+    forge = StubForge()
+    init = {"forge_ok": True, "project_id": "fox_test", "timed_out": [], "reference": {
+        "initial_model_choice": "RENDER", "model_locked": False, "locked_model": None,
+        "reference_style_analysis": None}}
+    monkeypatch.setattr(engine_module, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(engine_module, "CreativeDirector", StubDirector)
+    monkeypatch.setattr(engine_module.EngineInitializer, "initialize_concurrently",
+                        staticmethod(lambda *args, **kwargs: init))
+    monkeypatch.setattr(engine_module, "check_forge_health", lambda: True)
+    monkeypatch.setattr(engine_module, "get_run_history", lambda: StubHistory(record))
+    monkeypatch.setattr(engine_module, "get_forge_client", lambda: forge)
+    monkeypatch.setattr(engine_module, "get_checkpoint_manager", lambda: None)
+    # 低于 0.5 的分数让会话停留在 INIT 阶段
+    monkeypatch.setattr(engine_module, "rate_image", lambda *args, **kwargs: {
+        "final_score": 0.4, "concept_score": 0.4, "quality_score": 0.4, "aesthetics_score": 0.4,
+        "reasonableness_score": 0.4, "api_used": "local"})
+    monkeypatch.setattr(engine_module.time, "sleep", lambda seconds: None)
+
+    engine = engine_module.DiffuServoV4("red fox in snow")
+    engine.max_iterations = 3
+    engine.run()
+
+    assert forge.seeds == [111, 222, 333]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,110 @@
+"""
+种群探索测试
+任务16: 验证 Prompt 短语交叉、参数变异边界、精英保留的换代逻辑，
+ForgeClient 在多后端间的并发分发，以及种群规模受剩余评审次数约束
+"""
+
+import base64
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.budget import Deadline, SessionBudget
+from pkg.infrastructure.forge_client import ForgeClient, ForgeError
+from pkg.system.strategies.bayes_optimizer import PARAM_SPACES
+from pkg.system.strategies.population import Individual, crossover_prompts, mutate_params, next_generation
+
+
+def test_crossover_keeps_subject_and_lora():
+    """子代保留母本主体短语与 LoRA 标签，描述短语来自两个父代且不重复"""
+    a = "red fox in snow, soft light, pine trees, bokeh, <lora:detail:0.6>"
+    b = "arctic fox portrait, neon rim light, city night, bokeh"
+    rng = random.Random(5)
+    for _ in range(20):
+        child = crossover_prompts(a, b, rng)
+        phrases = [p.strip() for p in child.replace("<lora:detail:0.6>", "").split(",") if p.strip()]
+        assert phrases[0] == "red fox in snow"
+        assert child.endswith("<lora:detail:0.6>")
+        assert len(phrases) == len(set(p.lower() for p in phrases))
+        assert set(phrases[1:]) <= {"soft light", "pine trees", "bokeh", "neon rim light", "city night"}
+
+
+def test_mutation_stays_in_space():
+    """变异后的参数仍在该模式的搜索空间内"""
+    rng = random.Random(2)
+    params = {"steps": 32, "cfg_scale": 4.0, "hr_scale": 1.5, "hr_second_pass_steps": 10, "denoising_strength": 0.4}
+    for _ in range(50):
+        params = mutate_params(params, "RENDER", rng, rate=1.0)
+        for name, low, high, _ in PARAM_SPACES["RENDER"]:
+            assert low <= params[name] <= high
+
+
+def test_next_generation_keeps_elite_and_fills_population():
+    """精英沿用已有评分；新移民优先加入；其余为待渲染的子代"""
+    rng = random.Random(9)
+    parents = [Individual(core_prompt=f"fox, style {i}, light {i}", params={"steps": 20 + i, "cfg_scale": 7.0},
+                          seed=i, score=0.5 + i / 10) for i in range(4)]
+    immigrant = Individual(core_prompt="fox, fresh idea", params={"steps": 22, "cfg_scale": 6.0}, seed=99)
+    generation = next_generation(parents, size=5, elite=2, mode="RENDER", immigrants=[immigrant], rng=rng)
+
+    assert len(generation) == 5
+    assert [ind.score for ind in generation[:2]] == [0.8, 0.7]
+    assert generation[2] is immigrant
+    assert all(ind.score is None and ind.core_prompt.startswith("fox") for ind in generation[2:])
+
+
+def test_forge_client_spreads_requests_across_backends(fake_forge_post):
+    """并发请求分摊到各后端；坏结果以异常形式返回而不中断其余请求"""
+    image = base64.b64encode(b"x" * 2000).decode()
+    hits = {}
+    lock = threading.Lock()
+
+    def handler(url, payload):
+        time.sleep(0.05)
+        with lock:
+            hits[url.split("/sdapi")[0]] = hits.get(url.split("/sdapi")[0], 0) + 1
+        return {"images": [] if payload.get("bad") else [image]}
+
+    fake_forge_post(handler)
+    client = ForgeClient(["http://gpu0:7860", "http://gpu1:7860"], timeout=5)
+    payloads = [{"prompt": str(i)} for i in range(5)] + [{"prompt": "bad", "bad": True}]
+    outcomes = {index: outcome for index, outcome, _ in client.map_txt2img(payloads)}
+
+    assert sorted(outcomes) == list(range(6))
+    assert isinstance(outcomes[5], ForgeError)
+    assert all(len(outcomes[i].images[0]) == 2000 for i in range(5))
+    assert set(hits) == {"http://gpu0:7860", "http://gpu1:7860"} and sum(hits.values()) == 6
+
+
+def test_population_renders_only_what_the_judge_budget_covers(stub_engine):
+    """剩余评审次数少于种群规模时，只渲染并评审评得完的个体"""
+    judged = []
+
+    def rate(path):
+        judged.append(path)
+        return {"final_score": 0.6 + 0.01 * len(judged), "concept_score": 0.6, "quality_score": 0.6,
+                "aesthetics_score": 0.6, "reasonableness_score": 0.6, "api_used": "judge"}
+
+    engine = stub_engine(rate)
+    engine.population_size = 4
+    engine.session_budget = SessionBudget(judge_calls=2)
+    engine.params.update(seed=7, override_settings={"sd_model_checkpoint": "render.safetensors"})
+
+    path = engine._explore_population("red fox in snow", ", 8k", "RENDER", "", "", Deadline())
+
+    assert len(engine.forge.calls) == 2 and len(judged) == 2
+    assert engine.session_budget.judge_used == 2 and engine.session_budget.judge_remaining() == 0
+    assert path in judged and len(engine.population) == 2
+
+
+if __name__ == "__main__":
+    test_crossover_keeps_subject_and_lora()
+    test_mutation_stays_in_space()
+    test_next_generation_keeps_elite_and_fills_population()
+    print("✅ 种群探索测试通过（ForgeClient 用例需通过 pytest 运行）")
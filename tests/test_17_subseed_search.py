@@ -0,0 +1,90 @@
+"""
+子种子邻域搜索测试
+任务17: 验证 rank_by_clip 的候选初筛排序与 CLIP 不可用时的降级，
+以及引擎的子种子搜索沿用最佳 seed、按批内下标记录 subseed、强度随有无改进自适应
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.budget import Deadline
+from pkg.system import engine as engine_module
+from pkg.system.modules.evaluator import local_scorer
+
+CHECKPOINT = {"sd_model_checkpoint": "render.safetensors"}
+
+
+def _scores(score):
+    return {"final_score": score, "concept_score": score, "quality_score": score, "aesthetics_score": score,
+            "reasonableness_score": score, "api_used": "judge"}
+
+
+def test_rank_by_clip_orders_candidates(monkeypatch):
+    """按 CLIP 相似度从高到低返回候选下标"""
+    monkeypatch.setattr(local_scorer, "_clip_similarities", lambda paths, text: [0.21, 0.29, 0.18, 0.25])
+    assert local_scorer.rank_by_clip(["a.png", "b.png", "c.png", "d.png"], "red fox") == [1, 3, 0, 2]
+
+
+def test_rank_by_clip_unavailable(monkeypatch):
+    """CLIP 不可用时返回 None，由调用方取第一张"""
+    def broken(paths, text):
+        raise RuntimeError("CLIP 不可用")
+
+    monkeypatch.setattr(local_scorer, "_clip_similarities", broken)
+    assert local_scorer.rank_by_clip(["a.png", "b.png"], "red fox") is None
+
+
+def test_subseed_search_reuses_best_seed(stub_engine, monkeypatch):
+    """变体沿用最佳图的 prompt/seed；选中变体的 subseed 按批内下标递增记录"""
+    monkeypatch.setattr(engine_module, "rank_by_clip", lambda paths, theme: [2, 0, 1])
+    engine = stub_engine(lambda path: _scores(0.8))
+    engine.subseed_batch, engine.subseed_strength = 3, 0.2
+    engine.best_params = dict(engine.params, prompt="best fox", seed=4242, override_settings=CHECKPOINT)
+    engine.params.update(prompt="new idea", seed=999, override_settings=CHECKPOINT)
+
+    path = engine._subseed_search(Deadline())
+
+    (kind, payload), = engine.forge.calls
+    assert kind == "txt2img" and payload["batch_size"] == 3
+    assert payload["seed"] == 4242 and payload["prompt"] == "best fox" and payload["subseed_strength"] == 0.2
+    assert path.endswith("_v3.png")
+    assert engine.params["seed"] == 4242 and engine.params["subseed"] == payload["subseed"] + 2
+    assert engine.render_payloads[path]["subseed"] == payload["subseed"] + 2
+    assert "batch_size" not in engine.render_payloads[path]
+
+
+def test_subseed_strength_adapts_to_improvement(stub_engine):
+    """有改进时缩小扰动、无改进时扩大（有上下限），seed 保持不变"""
+    engine = stub_engine(lambda path: _scores(0.8))
+    engine.state, engine.subseed_batch, engine.subseed_strength = engine.STATE_FINETUNE, 3, 0.2
+    engine.best_score, engine.params["seed"] = 0.8, 4242
+
+    engine.adaptive_control(_scores(0.85))
+    assert engine.subseed_strength == pytest.approx(0.14)
+    engine.adaptive_control(_scores(0.7))
+    assert engine.subseed_strength == pytest.approx(0.182)
+    for _ in range(10):
+        engine.adaptive_control(_scores(0.7))
+    assert engine.subseed_strength == 0.5
+    assert engine.params["seed"] == 4242
+
+
+def test_best_params_are_the_rendered_params(stub_engine):
+    """adaptive_control 为下一轮换 seed 后，best_params 仍是最佳图实际使用的参数"""
+    engine = stub_engine(lambda path: _scores(0.4))
+    engine.max_iterations = 1
+    engine.run()
+
+    (_, payload), = engine.forge.calls
+    assert engine.best_params["seed"] == payload["seed"]
+    assert engine.best_params["prompt"] == payload["prompt"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,103 @@
+"""
+img2img 精修测试
+任务18: 验证 ForgeClient.img2img 的请求端点与底图编码、txt2img → img2img 的切换策略，
+以及精修结果不计入参数观测与透镜奖励
+"""
+
+import base64
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import pytest
+from PIL import Image
+
+from pkg.infrastructure.budget import Deadline
+from pkg.infrastructure.forge_client import ForgeClient, encode_image
+from pkg.system import engine as engine_module
+
+CHECKPOINT = {"sd_model_checkpoint": "render.safetensors"}
+
+
+def _scores(score, concept=None):
+    return {"final_score": score, "concept_score": score if concept is None else concept, "quality_score": score,
+            "aesthetics_score": score, "reasonableness_score": score, "api_used": "judge"}
+
+
+def _refining_engine(stub_engine, tmp_path, monkeypatch, score=0.85, concept=0.85):
+    """OPTIMIZE 阶段、历史最佳图达到精修门槛的引擎"""
+    monkeypatch.setattr(engine_module, "IMG2IMG_REFINE_ENABLED", True)
+    best = tmp_path / "best.png"
+    Image.new("RGB", (64, 64)).save(best)
+    engine = stub_engine(lambda path: _scores(0.8))
+    engine.state = engine.STATE_OPTIMIZE
+    engine.history = [
+        {"iter": 1, "score": 0.6, "concept": 0.9, "image_path": str(tmp_path / "old.png")},
+        {"iter": 2, "score": score, "concept": concept, "image_path": str(best)},
+    ]
+    return engine
+
+
+def test_img2img_posts_init_image(fake_forge_post, tmp_path):
+    """底图以 base64 放入 init_images，请求发往 img2img 端点"""
+    source = tmp_path / "best.png"
+    source.write_bytes(b"\x89PNG" + b"0" * 1500)
+    calls = fake_forge_post(lambda url, payload: {"images": [base64.b64encode(b"r" * 1500).decode()]})
+    client = ForgeClient(["http://gpu0:7860"], timeout=5)
+    result = client.img2img({"prompt": "fox", "init_images": [encode_image(str(source))], "denoising_strength": 0.3})
+
+    url, payload = calls[0]
+    assert url == "http://gpu0:7860/sdapi/v1/img2img"
+    assert base64.b64decode(payload["init_images"][0]) == source.read_bytes()
+    assert result.images[0] == b"r" * 1500
+
+
+def test_refine_source_picks_best_when_close_to_target(stub_engine, tmp_path, monkeypatch):
+    engine = _refining_engine(stub_engine, tmp_path, monkeypatch)
+    assert engine._refine_source()["iter"] == 2
+
+
+@pytest.mark.parametrize("case", ["disabled", "init", "explore", "low_score", "low_concept", "patience", "missing"])
+def test_refine_source_stays_on_txt2img(stub_engine, tmp_path, monkeypatch, case):
+    """开关关闭、OPTIMIZE 之前、最佳图总分或内容分不足、连续精修无改进、底图已被清理时不精修"""
+    engine = _refining_engine(stub_engine, tmp_path, monkeypatch,
+                              score=0.7 if case == "low_score" else 0.85,
+                              concept=0.7 if case == "low_concept" else 0.85)
+    if case == "disabled":
+        monkeypatch.setattr(engine_module, "IMG2IMG_REFINE_ENABLED", False)
+    elif case == "init":
+        engine.state = engine.STATE_INIT
+    elif case == "explore":
+        engine.state = engine.STATE_EXPLORE
+    elif case == "patience":
+        engine.refine_failures = engine_module.IMG2IMG_PATIENCE
+    elif case == "missing":
+        (tmp_path / "best.png").unlink()
+    assert engine._refine_source() is None
+
+
+def test_refined_render_not_credited_to_params_or_lens(stub_engine, tmp_path, monkeypatch):
+    """精修沿用底模驻留设置；其评分不进入参数观测、scored_renders 与透镜奖励"""
+    engine = _refining_engine(stub_engine, tmp_path, monkeypatch)
+    engine.best_params = dict(engine.params, prompt="best fox", seed=4242, override_settings=CHECKPOINT,
+                              override_settings_restore_afterwards=False)
+    engine.params.update(override_settings=CHECKPOINT, override_settings_restore_afterwards=False)
+    observed, rewarded = [], []
+    engine.param_optimizer = type("Optimizer", (), {"observe": lambda self, *args: observed.append(args)})()
+    engine.lens_bandit = type("Bandit", (), {"update": lambda self, *args: rewarded.append(args)})()
+    engine.current_mode, engine.current_lens = "RENDER", "Emphasis on Mood: ..."
+
+    path = engine._refine_image(engine._refine_source(), Deadline())
+    engine.rate_generated(path)
+
+    (kind, payload), = engine.forge.calls
+    assert kind == "img2img" and payload["override_settings_restore_afterwards"] is False
+    assert engine.current_lens is None
+    assert observed == [] and rewarded == [] and engine.scored_renders == []
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,71 @@
+"""
+局部缺陷修复测试
+任务19: 验证评审理由的缺陷识别（整词匹配、否定）、梯度显著性定位与蒙版生成
+"""
+
+import base64
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.defect_repair import build_mask, crop_resolution, detect_local_defects, saliency_box
+
+
+def test_detects_defects_only_with_problem_cues():
+    """部位词需与缺陷描述同句出现；称赞部位不算缺陷"""
+    assert detect_local_defects("Beautiful face and lighting, but the hands have extra fingers.") == ["hands"]
+    assert detect_local_defects("Strong composition; eyes look asymmetrical, minor artifacts in the sky") == ["face", "artifact"]
+    assert detect_local_defects("Expressive face, graceful hands, rich colors") == []
+    assert detect_local_defects("") == []
+
+
+@pytest.mark.parametrize("reason", [
+    "Clean render with no visible artifacts",
+    "Seamless blending between foreground and sky",
+    "Hands are drawn without any distortion",
+    "Extraordinary detail in the hands and face",
+    "Flawless face, hands free of any deformities",
+    "The fingers aren't deformed and the eyes are not asymmetrical",
+])
+def test_positive_reasons_are_not_defects(reason):
+    """整词匹配（seamless / extraordinary / flawless 不算缺陷词），否定的缺陷描述不算缺陷"""
+    assert detect_local_defects(reason) == []
+
+
+def test_negation_only_covers_its_own_clause():
+    assert detect_local_defects("No artifacts, but the left hand is deformed") == ["hands"]
+    assert detect_local_defects("Face has no flaws; visible seams and glitches near the horizon") == ["artifact"]
+
+
+def test_saliency_box_finds_noisy_patch():
+    """平滑图中的高频噪声块被定位"""
+    rng = np.random.default_rng(0)
+    gray = np.full((256, 256), 128.0, dtype=np.float32)
+    gray[160:192, 32:64] += rng.normal(0, 60, (32, 32))
+    x, y, w, h = saliency_box(gray)
+    assert x <= 40 and x + w >= 56
+    assert y <= 168 and y + h >= 184
+
+
+def test_mask_and_crop_resolution():
+    """蒙版白色区域覆盖缺陷框（含边距），重绘分辨率取 64 的倍数且不超过原图"""
+    from PIL import Image
+
+    mask = Image.open(io.BytesIO(base64.b64decode(build_mask((512, 768), [(100, 200, 50, 60)], padding=10))))
+    pixels = np.asarray(mask)
+    assert pixels[230, 120] == 255 and pixels[195, 95] == 255
+    assert pixels[10, 10] == 0 and pixels[400, 400] == 0
+
+    assert crop_resolution([(100, 200, 50, 60)], (1024, 1536)) == (512, 512)
+    assert crop_resolution([(0, 0, 900, 700)], (1024, 1536)) == (1024, 768)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
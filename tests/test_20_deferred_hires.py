@@ -0,0 +1,85 @@
+"""
+延迟高清化测试
+任务20: 验证 ForgeClient.upscale 的请求端点、参数与返回图片解码，以及高清化受会话预算约束
+"""
+
+import base64
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.budget import SessionBudget
+from pkg.infrastructure.forge_client import ForgeClient, ForgeError
+
+
+def test_upscale_posts_to_extras(fake_forge_post):
+    """放大请求发往 extra-single-image，返回的单张 image 被解码"""
+    calls = fake_forge_post(lambda url, payload: {"image": base64.b64encode(b"u" * 4000).decode(), "html_info": ""})
+    client = ForgeClient(["http://gpu0:7860"], timeout=5)
+    result = client.upscale("aW1n", 1.5, "R-ESRGAN 4x+")
+
+    url, payload = calls[0]
+    assert url == "http://gpu0:7860/sdapi/v1/extra-single-image"
+    assert payload["image"] == "aW1n"
+    assert payload["upscaling_resize"] == 1.5 and payload["upscaler_1"] == "R-ESRGAN 4x+"
+    assert result.images == [b"u" * 4000]
+
+
+def test_upscale_empty_result_raises(fake_forge_post):
+    """Forge 未返回图片时视为故障"""
+    fake_forge_post(lambda url, payload: {"image": ""})
+    client = ForgeClient(["http://gpu0:7860"], timeout=5)
+    with pytest.raises(ForgeError):
+        client.upscale("aW1n", 1.5, "R-ESRGAN 4x+")
+
+
+class StubForge:
+    """记录高清化请求超时上限的假 Forge 客户端"""
+
+    def __init__(self):
+        self.timeouts = []
+
+    def txt2img(self, payload, timeout=None, timeout_cap=None):
+        self.timeouts.append(timeout_cap)
+        return type("Result", (), {"images": [b"hires"]})()
+
+
+def _finalizing_engine(tmp_path, monkeypatch, budget):
+    from pkg.system import engine as engine_module
+    from pkg.system.engine import DiffuServoV4
+
+    monkeypatch.setattr(engine_module, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(engine_module, "DEFERRED_HIRES_VALIDATE", False)
+    engine = DiffuServoV4.__new__(DiffuServoV4)
+    engine.project_id, engine.theme, engine.reference_image_path = "hires_test", "forest", None
+    engine.deferred_hires, engine.session_budget, engine.forge = "hires", budget, StubForge()
+    engine.population, engine.history, engine.final_images = [], [], []
+    source = str(tmp_path / "iter1.png")
+    engine.render_payloads = {source: {"prompt": "forest", "seed": 7, "hr_scale": 1.5}}
+    engine.scored_renders = [{"score": 0.8, "mode": "RENDER", "image_path": source}]
+    return engine
+
+
+def test_finalize_respects_session_budget(tmp_path, monkeypatch):
+    """预算耗尽时跳过高清化；否则请求超时以会话剩余墙钟时间封顶"""
+    now = [0.0]
+    budget = SessionBudget(wall_seconds=10, clock=lambda: now[0])
+
+    now[0] = 12.0
+    engine = _finalizing_engine(tmp_path, monkeypatch, budget)
+    assert engine.finalize_hires() == []
+    assert engine.forge.timeouts == []
+
+    now[0] = 5.0
+    final = engine.finalize_hires()
+    assert [entry["method"] for entry in final] == ["hires"]
+    assert engine.forge.timeouts == [5.0]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
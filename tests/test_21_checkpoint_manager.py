@@ -0,0 +1,126 @@
+"""
+底模生命周期管理测试
+任务21: 验证预加载 / 关键路径加载的记录、显存压力下先卸载、显存解析、
+同一后端预加载排队与未完成时不抢先切换，以及下一轮底模预测
+"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.checkpoint_manager import CheckpointManager, same_checkpoint, vram_free_ratio
+from pkg.infrastructure.forge_client import ForgeBackend
+
+
+class FakeForge:
+    """记录请求的假 Forge 客户端（单后端）"""
+
+    def __init__(self, checkpoint, free=8.0, total=24.0, gate=None):
+        self.backends = [ForgeBackend("http://gpu0:7860")]
+        self.checkpoint = checkpoint
+        self.free, self.total = free, total
+        self.gate = gate  # 设置后加载请求阻塞到 gate 放行（模拟加载耗时）
+        self.posts = []
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, backend, timeout=None):
+        if endpoint == "/sdapi/v1/options":
+            return {"sd_model_checkpoint": self.checkpoint}
+        return {"cuda": {"system": {"free": self.free, "used": self.total - self.free, "total": self.total}}}
+
+    def post(self, endpoint, payload, timeout=None, backend=None):
+        if self.gate is not None:
+            self.gate.wait(5)
+        with self.lock:
+            self.posts.append(endpoint)
+            if endpoint == "/sdapi/v1/options":
+                self.checkpoint = payload["sd_model_checkpoint"]
+                self.posts[-1] = payload["sd_model_checkpoint"]
+        return {}, backend.url, 0.0
+
+
+def test_vram_and_checkpoint_name_parsing():
+    assert vram_free_ratio({"cuda": {"system": {"free": 6, "total": 24}}}) == 0.25
+    assert vram_free_ratio({"cuda": {"error": "no cuda"}}) is None
+    assert same_checkpoint("SDXL\\sd_xl_turbo_1.0_fp16.safetensors [e869ac7d69]", "sd_xl_turbo_1.0_fp16.safetensors")
+    assert not same_checkpoint("sd_xl_turbo_1.0_fp16.safetensors [e869ac7d69]", "animagineXL.safetensors")
+
+
+def test_prefetch_then_ensure_is_not_on_critical_path(tmp_path):
+    """预加载完成后 ensure 不再切换；切换记录写入 JSONL"""
+    forge = FakeForge("turbo")
+    manager = CheckpointManager(forge, log_path=str(tmp_path / "switches.jsonl"), vram_min_free=0.15)
+    manager.prefetch("juggernaut")
+    manager.ensure("juggernaut")
+
+    assert forge.checkpoint == "juggernaut"
+    assert forge.posts == ["juggernaut"]
+    summary = manager.summary()
+    assert summary["prefetched"]["count"] == 1 and summary["critical_path"]["count"] == 0
+    logged = [json.loads(line) for line in (tmp_path / "switches.jsonl").read_text().splitlines()]
+    assert logged[0]["from_checkpoint"] == "turbo" and logged[0]["prefetched"] is True
+
+
+def test_unloads_under_vram_pressure():
+    """空闲显存低于阈值时先卸载再加载；已加载的底模不重复切换"""
+    forge = FakeForge("turbo", free=2.0, total=24.0)
+    manager = CheckpointManager(forge, log_path="", vram_min_free=0.15)
+    manager.ensure("animagine")
+    manager.ensure("animagine")
+
+    assert forge.posts == ["/sdapi/v1/unload-checkpoint", "animagine"]
+    assert manager.records[0].unloaded and not manager.records[0].prefetched
+
+
+def test_prefetches_of_different_checkpoints_run_in_order():
+    """同一后端加载其他底模时，新的预加载排在其后而不是被跳过；同一底模不重复提交"""
+    gate = threading.Event()
+    forge = FakeForge("turbo", gate=gate)
+    manager = CheckpointManager(forge, log_path="", vram_min_free=0.15)
+    manager.prefetch("juggernaut")
+    manager.prefetch("animagine")
+    manager.prefetch("animagine")
+    gate.set()
+    manager.ensure("animagine")
+
+    assert forge.posts == ["juggernaut", "animagine"]
+    assert [r.prefetched for r in manager.records] == [True, True]
+
+
+def test_ensure_does_not_switch_while_prefetch_is_loading():
+    """等待超时后预加载仍在进行时，ensure 不再发起并发的切换请求"""
+    gate = threading.Event()
+    forge = FakeForge("turbo", gate=gate)
+    manager = CheckpointManager(forge, log_path="", vram_min_free=0.15)
+    manager.prefetch("juggernaut")
+    manager.ensure("animagine", timeout=0.05)
+    gate.set()
+    manager.ensure("juggernaut")
+
+    assert forge.posts == ["juggernaut"]
+    assert manager.summary()["critical_path"]["count"] == 0
+
+
+def test_predicts_target_checkpoint_with_funnel():
+    """漏斗在目标底模上初筛，预测的下一轮底模即目标底模；PREVIEW 高分后升级到 RENDER"""
+    from pkg.infrastructure.config import BASE_MODELS, MODEL_SWITCH_MIN_ITERATIONS, MODEL_SWITCH_SCORE_THRESHOLD
+    from pkg.system.engine import DiffuServoV4
+
+    engine = DiffuServoV4.__new__(DiffuServoV4)
+    engine.initial_model_choice, engine.funnel_size, engine.state = "ANIME", 8, "EXPLORE"
+    engine.best_score, engine.iteration = 0.5, 2
+    assert engine.predict_next_checkpoint(0.6) == BASE_MODELS["ANIME"]
+
+    engine.initial_model_choice, engine.iteration = "PREVIEW", MODEL_SWITCH_MIN_ITERATIONS
+    assert engine.predict_next_checkpoint(MODEL_SWITCH_SCORE_THRESHOLD) == BASE_MODELS["RENDER"]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,125 @@
+"""
+Forge 延迟模型测试
+任务22: 验证渲染工作量、耗时预测与自适应超时（含所选后端的排队 ETA）、按排队 ETA 调度后端、
+可能加载底模的请求不参与观测与预测，以及观测批量写入
+"""
+
+import json as json_module
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import pytest
+
+from pkg.infrastructure import forge_client
+from pkg.infrastructure.forge_client import ForgeClient
+from pkg.infrastructure.latency_model import LatencyModel, render_cost
+from tests.conftest import FakeForgeResponse
+
+TURBO = {"override_settings": {"sd_model_checkpoint": "turbo"}, "width": 1024, "height": 1024}
+ANIME = {"override_settings": {"sd_model_checkpoint": "anime"}, "width": 832, "height": 1216}
+
+
+def test_render_cost_accounts_for_hr_and_img2img():
+    base = dict(ANIME, steps=28)
+    assert render_cost(dict(TURBO, steps=1)) == 1.0
+    assert render_cost(dict(base, enable_hr=True, hr_scale=1.5, hr_second_pass_steps=15,
+                            denoising_strength=0.5)) > render_cost(base)
+    assert render_cost(dict(base, init_images=["x"], denoising_strength=0.3)) < render_cost(base)
+
+
+def test_prediction_and_timeout_per_checkpoint():
+    """按工作量线性外推；未见过的底模沿用默认超时"""
+    model = LatencyModel(path="", min_samples=3)
+    for steps, seconds in ((10, 5.0), (20, 9.0), (30, 13.0), (20, 9.5)):
+        model.observe("http://gpu0", dict(ANIME, steps=steps), seconds)
+
+    estimate = model.predict(dict(ANIME, steps=40))
+    assert 15.0 < estimate.expected < 19.0 and estimate.p99 >= estimate.expected
+    assert 30.0 < model.timeout_for(dict(ANIME, steps=40), default=90) < 45.0
+    assert model.timeout_for(dict(TURBO, steps=1), default=90) == 90
+
+
+def test_dispatch_prefers_lowest_queue_eta():
+    """在途请求的预测耗时计入排队 ETA：慢后端有在途请求时新请求分给另一个后端"""
+    model = LatencyModel(path="", min_samples=2)
+    for _ in range(2):
+        model.observe("http://slow:7860", dict(TURBO, steps=1), 10.0)
+        model.observe("http://fast:7860", dict(TURBO, steps=1), 1.0)
+    client = ForgeClient(["http://slow:7860", "http://fast:7860"], timeout=90, latency=model)
+    for backend in client.backends:
+        backend.checkpoint = "turbo"
+
+    first, expected = client._acquire(dict(TURBO, steps=1))
+    assert first.url == "http://fast:7860" and abs(expected - 1.0) < 1e-6
+    client._release(first, expected)
+    assert client.eta(dict(TURBO, steps=1)) == expected
+
+
+def test_requests_that_may_load_a_checkpoint_are_not_modelled(fake_forge_post):
+    """后端未知或加载着其他底模时：超时沿用默认值、不给 ETA、耗时不计入观测；切换后恢复"""
+    fake_forge_post(lambda url, payload: {})
+    model = LatencyModel(path="", min_samples=2)
+    for _ in range(2):
+        model.observe("http://gpu0:7860", dict(ANIME, steps=1), 1.0)
+    client = ForgeClient(["http://gpu0:7860"], timeout=90, latency=model)
+    payload = dict(ANIME, steps=1, override_settings_restore_afterwards=False)
+
+    assert client.timeout_for(payload) == 90 and client.eta(payload) is None
+    client.post("/sdapi/v1/txt2img", payload, render=True)
+    assert len(model._samples["http://gpu0:7860|anime"]) == 2
+
+    # 底模驻留后同底模请求按延迟模型预测并记录观测
+    assert client.backends[0].checkpoint == "anime"
+    assert client.timeout_for(payload) < 90 and client.eta(payload) is not None
+    client.post("/sdapi/v1/txt2img", payload, render=True)
+    assert len(model._samples["http://gpu0:7860|anime"]) == 3
+    assert client.may_switch(dict(TURBO, steps=1))
+
+
+def test_observations_are_saved_in_batches(tmp_path):
+    path = tmp_path / "latency.json"
+    model = LatencyModel(path=str(path), save_every=3)
+    for _ in range(2):
+        model.observe("http://gpu0", dict(TURBO, steps=1), 1.0)
+    assert not path.exists()
+
+    model.observe("http://gpu0", dict(TURBO, steps=1), 1.0)
+    model.observe("http://gpu0", dict(TURBO, steps=1), 1.0)
+    assert len(json_module.loads(path.read_text())["samples"]["http://gpu0|turbo"]) == 3
+    model.flush()
+    assert len(LatencyModel(path=str(path))._samples["http://gpu0|turbo"]) == 4
+
+
+def test_timeout_includes_queue_eta_of_chosen_backend(monkeypatch):
+    """选定后端后，排在前面的在途请求的预测耗时计入超时；timeout_cap 封顶"""
+    model = LatencyModel(path="", min_samples=2)
+    payload = dict(TURBO, steps=1)
+    for _ in range(2):
+        model.observe("http://gpu0:7860", payload, 45.0)
+    client = ForgeClient(["http://gpu0:7860"], timeout=10, latency=model)
+    client.backends[0].checkpoint = "turbo"
+    timeouts = []
+
+    def fake_post(url, json=None, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        return FakeForgeResponse({})
+
+    monkeypatch.setattr(forge_client.requests, "post", fake_post)
+    base = client.timeout_for(payload)
+    busy, expected = client._acquire(payload)  # 一个约 45 秒的渲染在途
+    client.post("/sdapi/v1/txt2img", payload, render=True)
+    client.post("/sdapi/v1/txt2img", payload, render=True, timeout_cap=20)
+    client._release(busy, expected)
+    client.post("/sdapi/v1/txt2img", payload, render=True)
+
+    assert timeouts[0] == pytest.approx(base + 45.0)
+    assert timeouts[1] == 20
+    assert timeouts[2] == pytest.approx(base)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
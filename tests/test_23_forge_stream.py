@@ -0,0 +1,61 @@
+"""
+Forge 响应流式解析测试
+任务23: 验证图片跨块边界增量解码、大字段默认跳过与不完整响应的报错
+"""
+
+import base64
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.forge_stream import StreamError, decode_response
+
+
+def _chunks(body, size):
+    data = body.encode() if isinstance(body, str) else body
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_images_decoded_across_chunk_boundaries():
+    """任意块大小下多张图片与小字段都被正确还原；info / parameters 默认跳过"""
+    first, second = bytes(range(256)) * 7, b"\xff\xfe" * 501
+    body = json.dumps({
+        "images": [base64.b64encode(first).decode(), base64.b64encode(second).decode()],
+        "parameters": {"prompt": "狐狸 \"quoted\" {x}", "init_images": ["abc"]},
+        "info": json.dumps({"seed": 42}),
+        "extra": [1, 2.5, None, True],
+    }, ensure_ascii=False)
+
+    for size in (1, 3, 7, 1024):
+        images, fields = decode_response(_chunks(body, size))
+        assert images == [first, second]
+        assert fields == {"extra": [1, 2.5, None, True]}
+
+    _, fields = decode_response(_chunks(body, 5), include_info=True)
+    assert json.loads(fields["info"]) == {"seed": 42}
+    assert fields["parameters"]["prompt"] == "狐狸 \"quoted\" {x}"
+
+
+def test_single_image_key_and_escaped_slashes():
+    """extra-single-image 的单个 image 字段；base64 中的 "/" 可能被转义为 "\\/" """
+    raw = b"\xfb\xff" * 300
+    encoded = base64.b64encode(raw).decode().replace("/", "\\/")
+    images, fields = decode_response(_chunks('{"html_info": "", "image": "%s"}' % encoded, 4))
+    assert images == [raw] and fields == {"html_info": ""}
+
+
+def test_truncated_response_raises():
+    body = json.dumps({"images": [base64.b64encode(b"x" * 100).decode()], "info": "{}"})
+    with pytest.raises(StreamError):
+        decode_response(_chunks(body[:-10], 8))
+    assert decode_response([b' { } ']) == ([], {})
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
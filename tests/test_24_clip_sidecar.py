@@ -0,0 +1,121 @@
+"""
+CLIP 边车协议测试
+任务24: 用桩编码器验证 socket 往返、共享内存传图以及各种失败情况下共享内存都被释放
+"""
+
+import io
+import shutil
+import sys
+import tempfile
+import threading
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.modules.reference import clip_sidecar
+from pkg.system.modules.reference.clip_sidecar import CLIPSidecarClient, CLIPSidecarServer
+
+_SHARED_MEMORY = shared_memory.SharedMemory
+
+
+class StubFeatures(list):
+    """模拟 torch 张量的 .cpu().tolist()"""
+
+    def cpu(self):
+        return self
+
+    def tolist(self):
+        return list(self)
+
+
+class StubService:
+    """按图片尺寸 / 文本长度给出"特征"的桩编码器"""
+    device = "cpu"
+
+    def encode_images(self, images):
+        return StubFeatures([[float(img.width), float(img.height)] for img in images])
+
+    def encode_texts(self, texts):
+        return StubFeatures([[float(len(t))] for t in texts])
+
+
+class StubSidecarServer(CLIPSidecarServer):
+    def _load_models(self, device):
+        self.service = StubService()
+
+
+@pytest.fixture
+def sidecar(monkeypatch):
+    """在临时 socket 上启动桩边车，并记录客户端创建的共享内存块"""
+    created = []
+
+    def tracking(*args, **kwargs):
+        shm = _SHARED_MEMORY(*args, **kwargs)
+        if kwargs.get("create"):
+            created.append(shm.name)
+        return shm
+
+    monkeypatch.setattr(clip_sidecar.shared_memory, "SharedMemory", tracking)
+    # AF_UNIX 路径有长度限制，不用 pytest 的 tmp_path
+    workdir = tempfile.mkdtemp(prefix="pyg_sc_")
+    socket_path = f"{workdir}/clip.sock"
+    server = StubSidecarServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield CLIPSidecarClient(socket_path, timeout=5), created, workdir
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _assert_released(names):
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            _SHARED_MEMORY(name=name)
+
+
+def _png(path, size):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format="PNG")
+    Path(path).write_bytes(buffer.getvalue())
+    return str(path)
+
+
+def test_round_trip_through_shared_memory(sidecar):
+    """多张图片经同一共享内存块按 sizes 切分；调用结束后块被 unlink"""
+    client, created, workdir = sidecar
+    paths = [_png(f"{workdir}/a.png", (64, 32)), _png(f"{workdir}/b.png", (16, 48))]
+
+    assert client.ping()
+    assert client.embed_images(paths) == [[64.0, 32.0], [16.0, 48.0]]
+    assert client.embed_texts(["fox", "狐狸"]) == [[3.0], [2.0]]
+    assert len(created) == 1
+    _assert_released(created)
+
+
+def test_shared_memory_released_on_errors(sidecar):
+    """服务端报错（坏图片）与连接失败时，客户端都抛出异常且不泄漏共享内存"""
+    client, created, workdir = sidecar
+    bad = Path(workdir) / "bad.png"
+    bad.write_bytes(b"not an image")
+
+    with pytest.raises(RuntimeError, match="CLIP 边车错误"):
+        client.embed_images([str(bad)])
+
+    offline = CLIPSidecarClient(f"{workdir}/missing.sock", timeout=1)
+    with pytest.raises(OSError):
+        offline.embed_images([str(bad)])
+    assert not offline.ping()
+
+    assert len(created) == 2
+    _assert_released(created)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
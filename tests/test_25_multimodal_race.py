@@ -0,0 +1,103 @@
+"""
+多模态分析竞速测试
+任务25: 验证免费候选全部结束前不发起付费候选、胜出后在途候选收到取消，以及流式响应拼接
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.modules.reference.multimodal_analyzer import MultimodalStyleAnalyzer
+
+VALID = '{"style_category": "anime", "recommended_model": "ANIME", "deepseek_hints": {}}'
+
+
+class StubAnalyzer(MultimodalStyleAnalyzer):
+    """按模型名给出预设延迟与响应的分析器（不发网络请求）"""
+
+    def __init__(self, script):
+        super().__init__(api_key="sf-key", modelscope_key="ms-key")
+        # 历史表现影响候选顺序，各用例从空统计开始
+        MultimodalStyleAnalyzer._model_stats.clear()
+        self.script = script
+        self.events = []
+        self.cancelled_models = []
+        self.lock = threading.Lock()
+
+    def _call_api(self, endpoint, api_key, image_data, model, timeout=90, cancelled=None):
+        provider = "modelscope" if "modelscope" in endpoint else "siliconflow"
+        delay, response = self.script[(provider, model)]
+        with self.lock:
+            self.events.append(("start", provider, model, time.time()))
+        if cancelled is not None and cancelled.wait(delay):
+            with self.lock:
+                self.cancelled_models.append(model)
+            return None
+        with self.lock:
+            self.events.append(("end", provider, model, time.time()))
+        return response
+
+
+def _candidates(analyzer):
+    return analyzer._ordered_candidates()
+
+
+def test_paid_candidates_wait_for_all_free_candidates():
+    """免费模型依次失败（最后一个较慢）时，付费模型在其结束后才发起"""
+    free, paid = MultimodalStyleAnalyzer.AVAILABLE_MODELS["modelscope"], \
+        MultimodalStyleAnalyzer.AVAILABLE_MODELS["siliconflow"]
+    script = {("modelscope", m): (0.01, None) for m in free}
+    script[("modelscope", free[2])] = (0.2, None)
+    script.update({("siliconflow", m): (0.01, VALID) for m in paid})
+    analyzer = StubAnalyzer(script)
+
+    analysis = analyzer._race(_candidates(analyzer), "img", width=2)
+
+    assert analysis["style_category"] == "anime"
+    free_end = max(t for kind, provider, _, t in analyzer.events if kind == "end" and provider == "modelscope")
+    paid_start = min(t for kind, provider, _, t in analyzer.events if kind == "start" and provider == "siliconflow")
+    assert paid_start >= free_end
+
+
+def test_winner_cancels_in_flight_candidates():
+    """首个有效结果胜出后，仍在途的候选收到取消信号"""
+    free = MultimodalStyleAnalyzer.AVAILABLE_MODELS["modelscope"]
+    paid = MultimodalStyleAnalyzer.AVAILABLE_MODELS["siliconflow"]
+    script = {("modelscope", m): (5.0, None) for m in free}
+    script[("modelscope", free[0])] = (0.01, VALID)
+    script.update({("siliconflow", m): (0.01, VALID) for m in paid})
+    analyzer = StubAnalyzer(script)
+
+    assert analyzer._race(_candidates(analyzer), "img", width=2) is not None
+    for _ in range(100):
+        if analyzer.cancelled_models:
+            break
+        time.sleep(0.01)
+    assert analyzer.cancelled_models == [free[1]]
+    assert not any(provider == "siliconflow" for _, provider, _, _ in analyzer.events)
+
+
+def test_read_stream_joins_deltas_and_stops_on_cancel():
+    lines = [
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        "",
+        'data: {"choices": [{"delta": {"content": "{\\"a\\": "}}]}',
+        'data: {"choices": [{"delta": {"content": "1}"}}]}',
+        "data: [DONE]",
+    ]
+    assert MultimodalStyleAnalyzer._read_stream(lines) == '{"a": 1}'
+
+    cancelled = threading.Event()
+    cancelled.set()
+    assert MultimodalStyleAnalyzer._read_stream(iter(lines), cancelled) is None
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
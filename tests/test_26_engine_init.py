@@ -0,0 +1,82 @@
+"""
+并发初始化测试
+任务26: 验证模型选择/项目命名/健康检查并发执行、超时兜底与中文项目 ID
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.initializer import EngineInitializer
+
+
+class StubBrain:
+    """按预设延迟返回的假 CreativeDirector"""
+
+    def __init__(self, recommend_delay=0.0, name_delay=0.0, model="RENDER", name="Neon City"):
+        self.recommend_delay, self.name_delay = recommend_delay, name_delay
+        self.model, self.name = model, name
+
+    def analyze_theme_and_recommend_model(self, theme):
+        time.sleep(self.recommend_delay)
+        return {"model": self.model}
+
+    def generate_project_name(self, theme):
+        time.sleep(self.name_delay)
+        return self.name
+
+
+def test_calls_run_concurrently():
+    """总耗时取决于最慢的一项而非总和"""
+    brain = StubBrain(recommend_delay=0.3, name_delay=0.3)
+
+    def health_check():
+        time.sleep(0.3)
+        return True
+
+    start = time.time()
+    result = EngineInitializer.initialize_concurrently(brain, "城市夜景", None, health_check, deadline=5)
+
+    assert time.time() - start < 0.8
+    assert result["forge_ok"] and result["timed_out"] == []
+    assert result["reference"]["initial_model_choice"] == "RENDER"
+    assert result["project_id"].startswith("Neon_City_")
+
+
+def test_timeout_falls_back_to_local_heuristics():
+    """超时的模型选择按关键词判断动漫主题；超时的项目名用主题本身（保留中文）"""
+    brain = StubBrain(recommend_delay=2.0, name_delay=2.0)
+    result = EngineInitializer.initialize_concurrently(brain, "可爱的 动漫 少女", None, lambda: True, deadline=0.2)
+
+    assert sorted(result["timed_out"]) == ["project_id", "reference"]
+    assert result["forge_ok"]
+    assert result["reference"]["initial_model_choice"] == "ANIME"
+    assert result["project_id"].startswith("可爱的_动漫_少女_")
+
+
+def test_health_failure_returns_without_waiting():
+    brain = StubBrain(recommend_delay=2.0, name_delay=2.0)
+    start = time.time()
+    result = EngineInitializer.initialize_concurrently(brain, "forest", None, lambda: False, deadline=5)
+
+    assert not result["forge_ok"]
+    assert time.time() - start < 1.0
+
+
+def test_project_ids_differ_for_different_themes():
+    first = EngineInitializer.build_project_id("魔法森林")
+    second = EngineInitializer.build_project_id("赛博城市")
+    assert first.rsplit("_", 2)[0] == "魔法森林" and second.rsplit("_", 2)[0] == "赛博城市"
+    # 过滤后为空的名称使用短哈希
+    assert EngineInitializer.build_project_id("!!!").startswith("project_")
+    assert EngineInitializer.build_project_id("!!!").rsplit("_", 2)[0] != EngineInitializer.build_project_id("???").rsplit("_", 2)[0]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,78 @@
+"""
+Prompt 候选池测试
+任务27: 验证批量响应按透镜编号对应、池的消费/补充以及分数大幅变化时丢弃过时候选
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.modules.creator.director import CreativeDirector
+from pkg.system.modules.creator.prompt_pool import PromptPool
+
+LENSES = ["Emphasis on Light: ...", "Emphasis on Texture: ...", "Emphasis on Mood: ..."]
+
+
+def test_batch_items_matched_by_lens_key():
+    """缺失、乱序、重复或越界的项不会把 prompt 记到别的透镜上"""
+    items = [
+        {"lens": 3, "prompt": "moody fog"},
+        {"lens": "1", "prompt": "golden rim light"},
+        {"lens": 3, "prompt": "duplicate"},
+        {"lens": 9, "prompt": "out of range"},
+        {"lens": 2, "prompt": "  "},
+        "bare string",
+    ]
+    assert CreativeDirector._match_lens_prompts(LENSES, items) == [
+        (LENSES[0], "golden rim light"),
+        (LENSES[2], "moody fog"),
+    ]
+    # 回写透镜名称时按名称对应
+    assert CreativeDirector._match_lens_prompts(LENSES, [{"lens": "Emphasis on Texture", "prompt": "rough bark"}]) == [
+        (LENSES[1], "rough bark"),
+    ]
+
+
+class StubBrain:
+    """每次批量生成返回带调用序号的 prompt"""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def brainstorm_batch(self, theme, feedback_context="", count=6, use_random=True, deadline=None):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        return [(lens, f"batch{call}-{i}") for i, lens in enumerate(LENSES[:count])]
+
+    def brainstorm_prompt(self, theme, feedback_context="", use_random=True, deadline=None):
+        return "single"
+
+
+def test_pool_serves_batch_and_drops_stale_candidates():
+    brain = StubBrain()
+    pool = PromptPool(brain, "forest", size=3, refill_at=0, score_delta=0.1)
+
+    assert pool.next_prompt(score=0.50) == "batch1-0"
+    assert pool.last_lens == LENSES[0]
+    assert pool.next_prompt(score=0.55) == "batch1-1"  # 小幅波动：继续消费
+    assert pool.next_prompt(score=0.80) == "batch2-0"  # 大幅提升：旧候选被丢弃
+    assert brain.calls == 2 and pool.served == 3
+
+
+def test_pool_invalidated_by_context_key():
+    brain = StubBrain()
+    pool = PromptPool(brain, "forest", size=3, refill_at=0)
+    pool.next_prompt(invalidation_key="")
+    assert pool.next_prompt(invalidation_key="更明亮一些") == "batch2-0"
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
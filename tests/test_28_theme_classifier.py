@@ -0,0 +1,96 @@
+"""
+主题→底模本地分类器测试
+任务28: 验证冷启动不阻塞调用方、余弦差距门槛、反馈后缀剥离与非英文主题跳过（桩编码器）
+"""
+
+import math
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.system.strategies.theme_classifier import (
+    SEED_TEXTS,
+    ThemeModelClassifier,
+    is_english_text,
+    strip_feedback,
+)
+
+
+def _unit(angle):
+    return [math.cos(angle), math.sin(angle)]
+
+
+class StubClassifier(ThemeModelClassifier):
+    """RENDER 种子指向 0°、ANIME 种子指向 90°，主题按预设角度嵌入；首次嵌入模拟模型加载耗时"""
+
+    def __init__(self, themes, load_seconds=0.0, **kwargs):
+        super().__init__(path="", sidecar_socket="", **kwargs)
+        self.themes = themes
+        self.load_seconds = load_seconds
+        self.embedded = []
+
+    def _embed(self, texts):
+        if self._service is None:
+            time.sleep(self.load_seconds)
+            self._service = object()
+        self.embedded.extend(texts)
+        vectors = []
+        for text in texts:
+            if text in SEED_TEXTS["RENDER"]:
+                vectors.append(_unit(0.0))
+            elif text in SEED_TEXTS["ANIME"]:
+                vectors.append(_unit(math.pi / 2))
+            else:
+                vectors.append(_unit(self.themes[text]))
+        return vectors
+
+
+def _wait_idle(classifier):
+    classifier._background.submit(lambda: None).result(timeout=5)
+
+
+def test_cold_model_is_warmed_in_background():
+    """模型未加载时 classify 立即返回 None 并在后台预热；预热完成后给出本地结果"""
+    classifier = StubClassifier({"product photo of a watch": 0.05}, load_seconds=0.3, min_samples=0)
+
+    start = time.time()
+    assert classifier.classify("product photo of a watch") is None
+    assert time.time() - start < 0.1
+
+    _wait_idle(classifier)
+    assert classifier.classify("product photo of a watch")["model"] == "RENDER"
+
+
+def test_margin_gate_rejects_near_ties():
+    """logit scale 100 下余弦只差 0.02 的 softmax 概率也有 ~0.88，需余弦差距门槛拦住"""
+    classifier = StubClassifier({}, min_samples=0, min_confidence=0.85, min_margin=0.03)
+    assert classifier.decide({"RENDER": 0.30, "ANIME": 0.28}) is None
+    decision = classifier.decide({"RENDER": 0.30, "ANIME": 0.20})
+    assert decision["model"] == "RENDER" and decision["confidence"] > 0.99
+
+
+def test_record_strips_feedback_and_skips_non_english():
+    classifier = StubClassifier({"neon city": 0.1}, min_samples=0)
+    classifier.record_async("neon city (Feedback: make it brighter)", "RENDER")
+    classifier.record_async("霓虹城市", "RENDER")
+    _wait_idle(classifier)
+
+    assert classifier.embedded == ["neon city"]
+    assert classifier.sample_counts() == {"RENDER": 1.0}
+    assert classifier.classify("霓虹城市") is None
+
+
+def test_text_helpers():
+    assert strip_feedback("forest (Feedback: 更多光线\n和雾)") == "forest"
+    assert strip_feedback("forest (morning)") == "forest (morning)"
+    assert is_english_text("a cat in 东京") and not is_english_text("东京的猫 cat")
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
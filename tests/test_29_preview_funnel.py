@@ -0,0 +1,100 @@
+"""
+两级预览漏斗测试
+任务29: 验证初筛沿用目标底模、目标尺寸与 ControlNet，按 CLIP 排序只完整渲染前 k 个 seed，
+最终图参数与引擎 params 一致（可直接复现），以及初筛失败 / 无法排序时的退化
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from pkg.infrastructure.budget import Deadline, SessionBudget
+from pkg.infrastructure.forge_client import ForgeError
+from pkg.system import engine as engine_module
+from pkg.system.engine import DiffuServoV4
+
+CHECKPOINT = {"sd_model_checkpoint": "render.safetensors"}
+CONTROLNET = {"controlnet": {"args": [{"module": "canny"}]}}
+
+
+class StubForge:
+    """记录 txt2img 请求；批量请求视为初筛"""
+
+    def __init__(self, screen_error=None):
+        self.payloads = []
+        self.screen_error = screen_error
+
+    def txt2img(self, payload, timeout=None, timeout_cap=None):
+        self.payloads.append(payload)
+        if "batch_size" in payload:
+            if self.screen_error:
+                raise self.screen_error
+            return type("Result", (), {"images": [f"s{k}".encode() for k in range(payload["batch_size"])]})()
+        return type("Result", (), {"images": [f"final-{payload['seed']}".encode()]})()
+
+
+def _funnel_engine(tmp_path, monkeypatch, forge, rankings, size=4, keep=2):
+    monkeypatch.setattr(engine_module, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(engine_module, "rank_by_clip", lambda paths, theme: rankings.pop(0) if rankings else None)
+    engine = DiffuServoV4.__new__(DiffuServoV4)
+    engine.project_id, engine.theme, engine.iteration, engine.state = "funnel_test", "forest", 3, "EXPLORE"
+    engine.funnel_size, engine.funnel_keep = size, keep
+    engine.params = {"prompt": "forest", "negative_prompt": "blurry", "steps": 30, "cfg_scale": 5.0,
+                     "sampler_name": "DPM++ 2M", "width": 832, "height": 1216, "enable_hr": True, "seed": 1,
+                     "override_settings": CHECKPOINT, "override_settings_restore_afterwards": False,
+                     "alwayson_scripts": CONTROLNET}
+    engine.forge, engine.checkpoints, engine.session_budget = forge, None, SessionBudget()
+    engine.render_payloads, engine.population, engine.history = {}, [], []
+    return engine
+
+
+def test_screen_uses_target_checkpoint_and_keeps_top_seeds(tmp_path, monkeypatch):
+    forge = StubForge()
+    engine = _funnel_engine(tmp_path, monkeypatch, forge, rankings=[[2, 0, 3, 1], [1, 0]])
+
+    path = engine._preview_funnel("RENDER", Deadline())
+
+    screen, *finals = forge.payloads
+    assert screen["override_settings"] == CHECKPOINT and screen["alwayson_scripts"] == CONTROLNET
+    # 初筛与最终图同尺寸（同 seed 初始噪声一致，构图得以保留），只减少步数并关闭 hires
+    assert (screen["width"], screen["height"], screen["steps"], screen["enable_hr"]) == (832, 1216, 15, False)
+    base_seed = screen["seed"]
+    # 只完整渲染排序前 2 的 seed
+    assert [p["seed"] for p in finals] == [base_seed + 2, base_seed]
+    assert all((p["width"], p["height"], p["steps"], p["enable_hr"]) == (832, 1216, 30, True) for p in finals)
+    assert all(p["alwayson_scripts"] == CONTROLNET and "batch_size" not in p for p in finals)
+    assert not any(key.startswith("seed_resize") for p in finals for key in p)
+    # 第二次排序选中第二张最终图；其参数即引擎 params，best_params / 延迟高清化可直接复现
+    assert engine.params["seed"] == base_seed
+    assert Path(path).read_bytes() == f"final-{base_seed}".encode()
+    assert engine.render_payloads[path] == engine.params
+
+
+def test_unranked_screen_keeps_batch_order(tmp_path, monkeypatch):
+    forge = StubForge()
+    engine = _funnel_engine(tmp_path, monkeypatch, forge, rankings=[], keep=1)
+
+    engine._preview_funnel("RENDER", Deadline())
+
+    screen, final = forge.payloads
+    assert final["seed"] == screen["seed"]
+
+
+def test_screen_failure_falls_back_to_single_render(tmp_path, monkeypatch):
+    forge = StubForge(screen_error=ForgeError("out of memory"))
+    engine = _funnel_engine(tmp_path, monkeypatch, forge, rankings=[])
+
+    path = engine._preview_funnel("RENDER", Deadline())
+
+    screen, final = forge.payloads
+    assert final["seed"] == screen["seed"]
+    assert engine.render_payloads[path]["width"] == 832
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))